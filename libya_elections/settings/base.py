@@ -420,6 +420,85 @@ REPORT_GENERATION_INTERVALS = {
     'registrations': datetime.timedelta(minutes=10)
 }
 
+# The registration rollup table (reporting_api.models.RegistrationRollup) is
+# maintained incrementally by each run of the registrations report, folding in only
+# the registrations created, archived, or deleted since the previous run.  It is
+# rebuilt from scratch every REPORT_REGISTRATIONS_FULL_REBUILD_INTERVAL, so that
+# ages are recomputed and any missed changes are picked up.
+REPORT_REGISTRATIONS_FULL_REBUILD_INTERVAL = datetime.timedelta(hours=6)
+# Each run brings the rollup up to this long ago rather than to the current time, so
+# that registrations saved by transactions still in progress aren't skipped.  It must
+# be longer than any transaction which saves registrations.
+REPORT_REGISTRATION_ROLLUP_LAG = datetime.timedelta(minutes=5)
+
+# Incoming message counts by date and message type can be maintained in Redis as
+# each message is saved, instead of counting all messages each time the registrations
+# report is generated.  The counters are reconciled with the database every
+# REPORT_SMS_COUNTERS_RECONCILE_INTERVAL.
+REPORT_INCREMENTAL_SMS_COUNTS = True
+REPORT_SMS_COUNTERS_RECONCILE_INTERVAL = datetime.timedelta(hours=6)
+
+# The time and queries of each stage of the report generation tasks (query,
+# aggregate, serialize, redis_write), and the number and size of the reports
+# written, can be recorded in Redis for the last REPORT_INSTRUMENTATION_HISTORY
+# runs (see reporting_api.instrumentation).  If REPORT_PROFILE_THRESHOLD is set,
+# the runs are also profiled, and the profiles of those taking at least that many
+# seconds are saved in REPORT_PROFILE_DIR.
+REPORT_INSTRUMENTATION = False
+REPORT_INSTRUMENTATION_HISTORY = 100
+REPORT_PROFILE_THRESHOLD = None
+REPORT_PROFILE_DIR = None
+
+# How reporting_api.aggregate.aggregate_up() rolls up report data: 'columnar',
+# 'dicts' (the original implementation), or 'compare' (run both and log any
+# differences, returning the 'dicts' result).
+REPORT_AGGREGATION_ENGINE = 'columnar'
+
+# Whether the reporting_api raw data queries whose results grow with the number
+# of polling reports and messages are read with a server-side cursor (within a
+# transaction, as DATABASES disables server-side cursors across transactions),
+# and how many rows are fetched at a time.
+REPORT_SERVER_SIDE_CURSORS = True
+REPORT_CURSOR_ITERSIZE = 2000
+
+# Whether each CenterOpen or PollingReport saved triggers a task which updates the
+# election day reports for just that center (see
+# reporting_api.reports.update_election_day_center()), so that the dashboard
+# reflects it without waiting for the next run of the election_day task.
+REPORT_ELECTION_DAY_CENTER_UPDATES = True
+
+# Maximum number of threads (each with its own database connection) used to run
+# the independent reporting_api queries, and to generate the reports for each
+# election, concurrently.  0 or 1 runs them one after another.
+REPORT_QUERY_THREADS = 5
+
+# Codec used to encode the reports stored in Redis (see reporting_api.serialization):
+# 'zlib-json' or 'json'.  Reports stored with any codec can be read regardless of
+# this setting.  Compare them with the benchmark_report_codecs management command.
+REPORT_STORE_CODEC = 'zlib-json'
+
+# Number of decoded reports which each process keeps in memory between requests (see
+# reporting_api.reports.retrieve_report()); 0 disables the cache.
+REPORT_CACHE_SIZE = 32
+
+# Whether the reporting_api JSON endpoints stream the reports to the client as stored
+# in Redis, instead of decoding them and encoding the response again.
+REPORT_STREAMING_RESPONSES = True
+
+# Number of vr_dashboard page contexts computed from the reports to keep in a
+# process-local cache, until the reports are regenerated (see
+# vr_dashboard.views.views.page_context()); 0 to compute them for each request.
+DASHBOARD_PAGE_CACHE_SIZE = 64
+
+# Number of centers on each page of the election day center list (by default, and at
+# most, with the page_size query arg); the CSV has all of them.
+ELECTION_DAY_CENTERS_PAGE_SIZE = 100
+ELECTION_DAY_CENTERS_MAX_PAGE_SIZE = 1000
+
+# How long (in seconds) reports replaced by a new generation remain in Redis, for
+# requests which resolved their keys just before the switch.
+REPORT_GENERATION_GRACE_PERIOD = 5 * 60
+
 # Begin Roll generator constants
 # Some of these numbers come from the document 'Polling Planning Rules eng 20140526 0900.docx'
 # ROLLGEN_REGISTRATIONS_PER_PAGE_REGISTRATION controls the number of registrants per printed page
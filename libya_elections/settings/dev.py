@@ -1,3 +1,4 @@
+import datetime
 import sys
 
 from libya_elections.settings.base import *  # noqa
@@ -51,6 +52,12 @@ if 'test' in sys.argv:
     CAPTCHA_TEST_MODE = True
 
     REPORTING_REDIS_KEY_PREFIX = 'os_reporting_api_ut_'
+    # Counts saved in Redis by one test would be wrong for the next test's database.
+    REPORT_INCREMENTAL_SMS_COUNTS = False
+    # Other threads' connections can't see the data created in a test's transaction.
+    REPORT_QUERY_THREADS = 0
+    # Tests look at the registration rollup right after saving registrations.
+    REPORT_REGISTRATION_ROLLUP_LAG = datetime.timedelta(0)
 
     # use default storage for tests, since we don't run collectstatic for tests
     STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0004_create_user_model_permissions'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            # The registration rollup (reporting_api) finds the registrations changed
+            # since its last refresh by modification_date, and the election day reports
+            # check the latest modification_date to see whether they need to be
+            # regenerated.
+            """
+            CREATE INDEX
+                register_registration_modification_date_index
+            ON
+                register_registration (modification_date)
+            """,
+            """
+            DROP INDEX IF EXISTS register_registration_modification_date_index;
+            """
+        ),
+    ]
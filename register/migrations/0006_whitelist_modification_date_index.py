@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0005_registration_modification_date_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            # The election day reports (reporting_api) check the latest modification_date
+            # of the whitelist to see whether they need to be regenerated.
+            """
+            CREATE INDEX
+                register_whitelist_modification_date_index
+            ON
+                register_whitelist (modification_date)
+            """,
+            """
+            DROP INDEX IF EXISTS register_whitelist_modification_date_index;
+            """
+        ),
+    ]
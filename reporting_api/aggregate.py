@@ -3,11 +3,40 @@ import copy
 import logging
 import datetime
 
+from django.conf import settings
+
 logger = logging.getLogger(__name__)
 
 
-def aggregate_up(lesser_dicts, aggregate_key, lesser_key=None, skip_keys=(), copy_keys=None,
-                 count_inner_keys=(), sum_inner_keys=(), enumerate_keys=()):
+def aggregate_up(lesser_dicts, aggregate_key, **kwargs):
+    """ Aggregate lesser dicts using the engine selected by REPORT_AGGREGATION_ENGINE:
+
+    'columnar' -- aggregate_up_columnar()
+    'dicts' -- aggregate_up_dicts()
+    'compare' -- run both, logging any differences, and return the result of
+                 aggregate_up_dicts()
+
+    See aggregate_up_dicts() for a description of the arguments and result.
+    """
+    engine = settings.REPORT_AGGREGATION_ENGINE
+    if engine == 'columnar':
+        return aggregate_up_columnar(lesser_dicts, aggregate_key, **kwargs)
+    elif engine == 'dicts':
+        return aggregate_up_dicts(lesser_dicts, aggregate_key, **kwargs)
+
+    assert engine == 'compare', 'Invalid REPORT_AGGREGATION_ENGINE %s' % engine
+    lesser_dicts = list(lesser_dicts)
+    result = aggregate_up_dicts(lesser_dicts, aggregate_key, **kwargs)
+    columnar_result = aggregate_up_columnar(lesser_dicts, aggregate_key, **kwargs)
+    if columnar_result != result:
+        logger.error('aggregate_up: columnar result differs for %s (groups %s)', aggregate_key,
+                     [k for k in set(result) | set(columnar_result)
+                      if result.get(k) != columnar_result.get(k)])
+    return result
+
+
+def aggregate_up_dicts(lesser_dicts, aggregate_key, lesser_key=None, skip_keys=(),
+                       copy_keys=None, count_inner_keys=(), sum_inner_keys=(), enumerate_keys=()):
     """ Sums values of aggregate_key in lesser dicts
     Skips top-level keys in skip_keys
     Copies top-level keys in copy_keys
@@ -134,6 +163,157 @@ def aggregate_up(lesser_dicts, aggregate_key, lesser_key=None, skip_keys=(), cop
     return {k: dict(v) for (k, v) in aggregate_dicts.items()}
 
 
+# marker for a group with no value in a column
+_MISSING = object()
+
+
+def _aggregate_column(key, groups, values, num_groups, count_inner_keys, sum_inner_keys):
+    """ Aggregate one column (the values of a single key across the lesser dicts, along
+    with the group index of each) as described for aggregate_up_dicts().
+
+    Returns a list with the aggregated value for each group, and a list with the
+    inner key counts and sums (or None) for each group.  Groups without any values in
+    the column are represented by _MISSING.
+    """
+    result = [_MISSING] * num_groups
+    inner_counts = [None] * num_groups
+    value_types = set(map(type, values))
+
+    if value_types == {list}:
+        for g, val in zip(groups, values):
+            current = result[g]
+            if current is _MISSING:
+                result[g] = list(val)
+            else:
+                # For the hacky Male/Female coding.
+                result[g] = [current[0] + val[0], current[1] + val[1]]
+        return result, inner_counts
+
+    if value_types <= {int, float}:
+        for g, val in zip(groups, values):
+            current = result[g]
+            result[g] = val if current is _MISSING else current + val
+        return result, inner_counts
+
+    # mixed or other types, so check each value
+    for g, val in zip(groups, values):
+        current = result[g]
+        if isinstance(val, list):
+            if current is _MISSING:
+                result[g] = list(val)
+            else:
+                result[g] = [current[0] + val[0], current[1] + val[1]]
+        elif type(val) in [int, float]:
+            result[g] = val if current is _MISSING else current + val
+        elif isinstance(val, dict):
+            # the last dict is copied when building the output
+            result[g] = val
+            counts = inner_counts[g]
+            if counts is None:
+                counts = inner_counts[g] = defaultdict(int)
+            for inner_key in val.keys():
+                if inner_key in count_inner_keys:
+                    if isinstance(inner_key, str):
+                        counts[inner_key] += 1
+                    else:
+                        counts[str(inner_key) + '_count'] += 1
+                if inner_key in sum_inner_keys:
+                    counts[inner_key] += val[inner_key]
+        else:
+            result[g] = val
+            if not isinstance(val, str):
+                logger.warning('aggregate_up: Storing data of type %s for key %s' %
+                               (type(val), key))
+    return result, inner_counts
+
+
+def aggregate_up_columnar(lesser_dicts, aggregate_key, lesser_key=None, skip_keys=(),
+                          copy_keys=None, count_inner_keys=(), sum_inner_keys=(),
+                          enumerate_keys=()):
+    """ Same as aggregate_up_dicts(), but operating on columns of values rather than
+    on a copy of each lesser dict.
+
+    Each lesser dict is assigned the index of its group, then the values of each key are
+    collected into a column (along with the group indexes) and aggregated together.
+    Only the values which end up in the result are copied.
+    """
+    logger.info('aggregating up %s (columnar)' % aggregate_key)
+
+    lesser_dicts = list(lesser_dicts)
+
+    # group index of each lesser dict, and the aggregate value of each group
+    group_index = {}
+    group_values = []
+    groups = []
+    for ld in lesser_dicts:
+        aggregate_val = ld[aggregate_key]
+        g = group_index.get(aggregate_val)
+        if g is None:
+            g = group_index[aggregate_val] = len(group_values)
+            group_values.append(aggregate_val)
+        groups.append(g)
+    num_groups = len(group_values)
+
+    # by default copy all keys of the first lesser dict
+    if not copy_keys:
+        copy_keys = list(lesser_dicts[0].keys()) if lesser_dicts else ()
+    enumerate_key_for_presence = [i[0] for i in enumerate_keys]
+    excluded_keys = set(skip_keys) | set(copy_keys) | set(enumerate_key_for_presence)
+    count_inner_keys = set(count_inner_keys)
+    sum_inner_keys = set(sum_inner_keys)
+
+    # Build the output dicts with the keys in the order in which aggregate_up_dicts()
+    # would first store them, but with placeholder values for now.
+    aggregate_dicts = [None] * num_groups
+    group_lesser_dicts = [[] for _ in range(num_groups)]
+    columns = {}
+    for ld, g in zip(lesser_dicts, groups):
+        group_lesser_dicts[g].append(ld)
+        agg_dict = aggregate_dicts[g]
+        if agg_dict is None:
+            agg_dict = aggregate_dicts[g] = dict.fromkeys(copy_keys)
+            agg_dict.update((key, []) for key in enumerate_key_for_presence)
+        for key, val in ld.items():
+            if key in excluded_keys:
+                continue
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = ([], [])
+            column[0].append(g)
+            column[1].append(val)
+            if key not in agg_dict:
+                agg_dict[key] = None
+
+    for g, agg_dict in enumerate(aggregate_dicts):
+        last_ld = group_lesser_dicts[g][-1]
+        for key in copy_keys:
+            agg_dict[key] = copy.deepcopy(last_ld[key])
+        for key_for_presence, key_for_value in enumerate_keys:
+            agg_dict[key_for_presence] = [copy.deepcopy(ld[key_for_value])
+                                          for ld in group_lesser_dicts[g]
+                                          if key_for_presence in ld]
+
+    for key, (column_groups, column_values) in columns.items():
+        result, inner_counts = _aggregate_column(key, column_groups, column_values, num_groups,
+                                                 count_inner_keys, sum_inner_keys)
+        for g, val in enumerate(result):
+            if val is _MISSING:
+                continue
+            if isinstance(val, dict):
+                val = copy.deepcopy(val)
+                if inner_counts[g]:
+                    val.update(inner_counts[g])
+            elif not isinstance(val, (list, int, float, str)):
+                val = copy.deepcopy(val)
+            aggregate_dicts[g][key] = val
+
+    count_key = str(lesser_key) + '_count' if lesser_key else 'count'
+    for g, group_dicts in enumerate(group_lesser_dicts):
+        aggregate_dicts[g][count_key] = len(group_dicts)
+
+    return dict(zip(group_values, aggregate_dicts))
+
+
 def aggregate_nested_key(d, d_key, nested_key):
     """ Sums values in dicts with this structure:
         {
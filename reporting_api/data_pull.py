@@ -5,8 +5,9 @@ import logging
 
 # 3rd party imports
 from django.conf import settings
-from django.db import connection
+from django.db import connection, transaction
 from django.utils import translation
+from django.utils.timezone import localdate, now
 
 # Project imports
 from . import codings
@@ -16,7 +17,10 @@ from register.models import Office
 from .aggregate import aggregate_up, aggregate_nested_key, aggregate_dates
 from .constants import COUNTRY, MESSAGE_TYPE, OFFICE, POLLING_CENTER_CODE, \
     POLLING_CENTER_COPY_OF, POLLING_CENTER_TYPE, REGION, SUBCONSTITUENCY_ID
-from .data_pull_common import get_offices, get_subconstituencies
+from .data_pull_common import get_offices, get_subconstituencies, ReferenceData
+from .instrumentation import stage
+from .models import RegistrationRollupStatus
+from .utils import run_concurrently, streaming_cursor
 
 logger = logging.getLogger(__name__)
 
@@ -45,35 +49,97 @@ def sms_datedict_template():
     return defaultdict(lambda: sms_msg_count_template())
 
 
-def get_polling_center_dicts(cursor, polling_locations):
-    all_dates = set()
-    polling_to_demo = defaultdict(lambda: demo_dict_template())
+def refresh_registration_rollup():
+    """Bring the RegistrationRollup table (which DEMO_QUERY reads) up to date.
 
-    # DEMO_QUERY converts a TIMESTAMP to a DATE, which must be
-    # done in a TZ-aware manner so that the date reflects the
-    # local time zone.
-    with ConnectionInTZ(cursor, settings.TIME_ZONE):
-        cursor.execute(query.DEMO_QUERY)
-
-        # convert db codings to defaultdict structure
-        for (date, gender, age, center_id, count) in cursor:
-            polling_dict = polling_to_demo[center_id]
-            polling_dict['total'] += count
-            formatted_date = date.strftime('%Y-%m-%d')
-            all_dates.add(formatted_date)
-            if codings.GENDER_CODING[gender] == 'Male':
-                polling_dict[formatted_date][0] += count
+    Registrations created, archived, or deleted since the previous refresh are folded in,
+    except that every REPORT_REGISTRATIONS_FULL_REBUILD_INTERVAL the table is rebuilt from
+    scratch so that ages are recomputed and any missed changes are picked up.
+
+    The table is brought up to REPORT_REGISTRATION_ROLLUP_LAG ago rather than to now, so
+    that registrations saved by transactions which haven't committed yet are picked up by
+    the next refresh instead of being skipped.
+    """
+    until = now() - settings.REPORT_REGISTRATION_ROLLUP_LAG
+    with transaction.atomic():
+        status = RegistrationRollupStatus.objects.select_for_update().first()
+        cursor = connection.cursor()
+        # Registration timestamps are converted to dates, which must be
+        # done in a TZ-aware manner so that the date reflects the
+        # local time zone.
+        with ConnectionInTZ(cursor, settings.TIME_ZONE):
+            if status is None or \
+                    status.last_full_rebuild + settings.REPORT_REGISTRATIONS_FULL_REBUILD_INTERVAL \
+                    <= until:
+                logger.info("rebuilding registration rollup")
+                params = {'UNTIL': until, 'AGE_DATE': localdate(until)}
+                cursor.execute(query.ROLLUP_CLEAR_QUERY)
+                cursor.execute(query.ROLLUP_REBUILD_QUERY, params)
+                cursor.execute(query.ROLLUP_DELETIONS_CLEAR_QUERY)
+                cursor.execute(query.ROLLUP_DELETIONS_REBUILD_QUERY, params)
+                if status is None:
+                    status = RegistrationRollupStatus()
+                status.last_full_rebuild = until
             else:
-                polling_dict[formatted_date][1] += count
-            try:
-                polling_dict[codings.AGE_CODING[age]] += count
-            except KeyError:
-                logger.error("registration outside of codings.AGE_CODING, skip it (age %s)" % age)
-                continue
+                logger.info("updating registration rollup with changes since %s",
+                            status.high_water_mark)
+                params = {'SINCE': status.high_water_mark, 'UNTIL': until,
+                          'AGE_DATE': localdate(status.last_full_rebuild)}
+                cursor.execute(query.ROLLUP_DELTA_QUERY, params)
+                cursor.execute(query.ROLLUP_UNDELETIONS_QUERY, params)
+                cursor.execute(query.ROLLUP_DELETIONS_DELTA_QUERY, params)
+                cursor.execute(query.ROLLUP_PRUNE_QUERY)
+        status.high_water_mark = until
+        status.save()
+
+
+def fold_demo_row(polling_to_demo, date, gender, age, center_id, count):
+    """Add count registrations on the given date, with the given gender and age, to the
+    registration counts for the center."""
+    polling_dict = polling_to_demo[center_id]
+    polling_dict['total'] += count
+    formatted_date = date.strftime('%Y-%m-%d')
+    if codings.GENDER_CODING[gender] == 'Male':
+        polling_dict[formatted_date][0] += count
+    else:
+        polling_dict[formatted_date][1] += count
+    try:
+        polling_dict[codings.AGE_CODING[age]] += count
+    except KeyError:
+        logger.error("registration outside of codings.AGE_CODING, skip it (age %s)" % age)
+
+
+def get_center_demo_counts(cursor):
+    """Return a dict mapping center_id to the demographic breakdown of registrations at
+    that center (see demo_dict_template()), with a [M,F] entry for each date which
+    had registrations.  The counts come from the RegistrationRollup table, so call
+    refresh_registration_rollup() first.
+    """
+    polling_to_demo = defaultdict(lambda: demo_dict_template())
+
+    cursor.execute(query.DEMO_QUERY)
+
+    # convert db codings to defaultdict structure
+    for (date, gender, age, center_id, count) in cursor:
+        fold_demo_row(polling_to_demo, date, gender, age, center_id, count)
+    return polling_to_demo
+
+
+def get_polling_center_dicts(cursor, polling_locations, reference_data=None):
+    """Return the per-center registration data for the report along with the set of dates
+    which had registrations.
+
+    reference_data: ReferenceData for this report run
+    """
+    polling_to_demo = get_center_demo_counts(cursor)
+    if reference_data is None:
+        reference_data = ReferenceData()
 
+    all_dates = set()
     to_return = {}
 
     for (k, def_d) in polling_to_demo.items():
+        all_dates.update(key for key, value in def_d.items() if isinstance(value, list))
         # Copy to regular dict (not defaultdict)
         d = dict(def_d)
         d[POLLING_CENTER_CODE] = k
@@ -90,11 +156,12 @@ def get_polling_center_dicts(cursor, polling_locations):
         d[SUBCONSTITUENCY_ID] = subconstituency_id
 
         try:
-            region = Office.objects.get(id=office_id).region
-            d[REGION] = Office.REGION_NAMES[region]
-        except Office.DoesNotExist:
+            region = reference_data.office_regions[office_id]
+        except KeyError:
             logger.error("office_id missing from Office table: %s" % office_id)
             continue
+        try:
+            d[REGION] = Office.REGION_NAMES[region]
         except KeyError:
             logger.error("region missing from Office.REGION_NAMES: %s" % region)
             logger.error(Office.REGION_NAMES)
@@ -104,7 +171,25 @@ def get_polling_center_dicts(cursor, polling_locations):
     return to_return, all_dates
 
 
-def get_sms_dicts(cursor):
+def get_sms_counts(cursor):
+    """Return the number of incoming messages as a dict mapping
+    (formatted date, direction, message type) to the count."""
+    # MESSAGES_QUERY converts a TIMESTAMP to a DATE, which must be
+    # done in a TZ-aware manner so that the date reflects the
+    # local time zone.
+    with ConnectionInTZ(cursor, settings.TIME_ZONE):
+        cursor.execute(query.MESSAGES_QUERY)
+        return {(date.strftime('%Y-%m-%d'), direction, msg_type): count
+                for (date, direction, msg_type, count) in cursor}
+
+
+def get_sms_dicts(cursor, sms_counts=None):
+    """
+    sms_counts: the result of get_sms_counts(), if already known (e.g., maintained
+    incrementally)
+    """
+    if sms_counts is None:
+        sms_counts = get_sms_counts(cursor)
     sms_messages = defaultdict(lambda: sms_datedict_template())
 
     # SMS message type strings are translatable but must be in English in the
@@ -112,27 +197,47 @@ def get_sms_dicts(cursor):
     # (If message direction strings are ever translated, they will need the same
     # handling here.)
     with translation.override(language=None):
-        # MESSAGES_QUERY converts a TIMESTAMP to a DATE, which must be
-        # done in a TZ-aware manner so that the date reflects the
-        # local time zone.
-        with ConnectionInTZ(cursor, settings.TIME_ZONE):
-            cursor.execute(query.MESSAGES_QUERY)
-            for (date, direction, msg_type, count) in cursor:
-                msg_type_dict = sms_messages[msg_type]
-
-                formatted_date = date.strftime('%Y-%m-%d')
-                msg_type_dict[formatted_date][codings.MESSAGE_DIRECTION[direction]] += count
-                msg_type_dict[formatted_date]['total'] += count
-                try:
-                    # Message type strings are lazily translated; force the translation here
-                    # since the JSON encoder won't otherwise resolve it.
-                    msg_type_dict[MESSAGE_TYPE] = str(codings.MESSAGE_TYPES[msg_type])
-                except KeyError:
-                    msg_type_dict[MESSAGE_TYPE] = msg_type
+        for (formatted_date, direction, msg_type), count in sorted(sms_counts.items()):
+            msg_type_dict = sms_messages[msg_type]
+
+            msg_type_dict[formatted_date][codings.MESSAGE_DIRECTION[direction]] += count
+            msg_type_dict[formatted_date]['total'] += count
+            try:
+                # Message type strings are lazily translated; force the translation here
+                # since the JSON encoder won't otherwise resolve it.
+                msg_type_dict[MESSAGE_TYPE] = str(codings.MESSAGE_TYPES[msg_type])
+            except KeyError:
+                msg_type_dict[MESSAGE_TYPE] = msg_type
     return sms_messages
 
 
+def phone_statistics(cursor):
+    """
+    Get the per-phone statistics from a single pass over the messages, returned as
+    a 3-item tuple with the results of multiple_family_book_registrations(),
+    duplicate_registrations(), and registrations_by_phone().  (Those each run a
+    narrower query of their own, for callers which only need one of the statistics.)
+    """
+    cursor.execute(query.PHONE_STATISTICS_QUERY)
+    fbrn = {}
+    dups = {}
+    regs_by_phone = []
+    for (phone_number, fbr_count, fbr_list, reg_count, duplicate_dates) in cursor:
+        if fbr_count > 1:
+            fbrn[phone_number] = fbr_list
+        if reg_count > 1:
+            regs_by_phone.append((phone_number, reg_count))
+        if duplicate_dates:
+            # more info we might want to display here?
+            dups[phone_number] = duplicate_dates
+    return fbrn, dups, regs_by_phone
+
+
 def multiple_family_book_registrations(cursor):
+    """
+    Get the family book record numbers registered from each phone which registered
+    people with more than one of them, returned as a dict.
+    """
     cursor.execute(query.PHONE_MULTIPLE_FAMILY_BOOK_QUERY)
     fbrn = {}
     for (from_number, num_count, num_list, latest) in cursor:
@@ -150,6 +255,10 @@ def registrations_by_phone(cursor):
 
 
 def duplicate_registrations(cursor):
+    """
+    Get the dates on which each phone was sent the "NID already registered" message,
+    returned as a dict.
+    """
     cursor.execute(query.DUPLICATE_REGISTRATIONS_QUERY)
     dups = defaultdict(list)
     for (to_number, date) in cursor:
@@ -158,30 +267,46 @@ def duplicate_registrations(cursor):
     return dict(dups)
 
 
-def get_raw_data(polling_locations):
+def get_raw_data(polling_locations, reference_data=None, sms_counts=None):
     """
     Get all the data we need from the database
     """
-    cursor = connection.cursor()
-
-    # POLLING CENTERS
-    logger.info("running polling center query")
-    polling_center_code_to_demo, all_dates = get_polling_center_dicts(cursor, polling_locations)
-
-    # SMS
-    logger.info("running messages query")
-    sms_dict = get_sms_dicts(cursor)
-
-    fbrn_dict = multiple_family_book_registrations(cursor)
-    duplicate_dict = duplicate_registrations(cursor)
-
-    regs_by_phone = registrations_by_phone(cursor)
+    if reference_data is None:
+        reference_data = ReferenceData()
+    # The queries are independent, so they can be run concurrently on separate
+    # connections; the reference data is loaded first so that it isn't queried
+    # from more than one thread.
+    reference_data.load()
+
+    def pull_polling_centers():
+        logger.info("running polling center query")
+        return get_polling_center_dicts(
+            connection.cursor(), polling_locations, reference_data)
+
+    def pull_sms():
+        if sms_counts is None:
+            logger.info("running messages query")
+        return get_sms_dicts(connection.cursor(), sms_counts)
+
+    # The phone query has a row per phone, so fetch the rows in batches as they're
+    # folded into the report.
+    def pull_phone_statistics():
+        logger.info("running phone statistics query")
+        with streaming_cursor() as phone_cursor:
+            return phone_statistics(phone_cursor)
+
+    (polling_center_code_to_demo, all_dates), sms_dict, \
+        (fbrn_dict, duplicate_dict, regs_by_phone) = run_concurrently([
+            pull_polling_centers,
+            pull_sms,
+            pull_phone_statistics,
+        ])
     return (polling_center_code_to_demo, sms_dict, fbrn_dict,
             duplicate_dict, all_dates, regs_by_phone)
 
 
 def process_raw_data(polling_center_code_to_demo, sms_dict, fbrn_dict, duplicate_dict, all_dates,
-                     regs_by_phone):
+                     regs_by_phone, reference_data=None):
     subconstituency_to_demo = aggregate_up(polling_center_code_to_demo.values(),
                                            aggregate_key=SUBCONSTITUENCY_ID,
                                            lesser_key='polling_center',
@@ -210,8 +335,8 @@ def process_raw_data(polling_center_code_to_demo, sms_dict, fbrn_dict, duplicate
                                                                   'incoming'))}
 
     output_dict = {
-        'subconstituencies': get_subconstituencies(),
-        'offices': get_offices(),
+        'subconstituencies': get_subconstituencies(reference_data),
+        'offices': get_offices(reference_data),
         'by_' + COUNTRY: list(country_to_demo.values()),
         'by_' + REGION: list(region_to_demo.values()),
         'by_' + OFFICE: list(office_to_demo.values()),
@@ -230,8 +355,12 @@ def process_raw_data(polling_center_code_to_demo, sms_dict, fbrn_dict, duplicate
     return output_dict
 
 
-def pull_data(polling_locations):
-    polling_center_code_to_demo, sms_dict, fbrn_dict, duplicate_dict, all_dates, regs_by_phone =\
-        get_raw_data(polling_locations)
-    return process_raw_data(polling_center_code_to_demo, sms_dict, fbrn_dict, duplicate_dict,
-                            all_dates, regs_by_phone)
+def pull_data(polling_locations, reference_data=None, sms_counts=None):
+    if reference_data is None:
+        reference_data = ReferenceData()
+    with stage('query'):
+        polling_center_code_to_demo, sms_dict, fbrn_dict, duplicate_dict, all_dates, \
+            regs_by_phone = get_raw_data(polling_locations, reference_data, sms_counts)
+    with stage('aggregate'):
+        return process_raw_data(polling_center_code_to_demo, sms_dict, fbrn_dict,
+                                duplicate_dict, all_dates, regs_by_phone, reference_data)
@@ -1,5 +1,6 @@
 # 3rd party imports
 from django.db import connection
+from django.utils.functional import cached_property
 
 # Project imports
 from register.models import Office, SubConstituency
@@ -64,14 +65,51 @@ def get_all_polling_locations():
     return _get_registration_centers(must_allow_registrations=False)
 
 
-def get_offices():
+class ReferenceData(object):
+    """Offices, subconstituencies, and registration centers, each queried at most once
+    and shared by the data pulls for a report run, so that the number of queries doesn't
+    depend on the number of centers.
+    """
+
+    @cached_property
+    def offices(self):
+        return list(Office.objects.all())
+
+    @cached_property
+    def office_regions(self):
+        """dict mapping office id to region"""
+        return {office.id: office.region for office in self.offices}
+
+    @cached_property
+    def subconstituencies(self):
+        return list(SubConstituency.objects.all())
+
+    @cached_property
+    def active_registration_locations(self):
+        return get_active_registration_locations()
+
+    @cached_property
+    def all_polling_locations(self):
+        return get_all_polling_locations()
+
+    def load(self):
+        """Query all the reference data now, before it is shared between threads."""
+        for name in ('offices', 'office_regions', 'subconstituencies',
+                     'active_registration_locations', 'all_polling_locations'):
+            getattr(self, name)
+
+
+def get_offices(reference_data=None):
+    offices = reference_data.offices if reference_data else Office.objects.all()
     return [{'arabic_name': o.name_arabic,
              'english_name': o.name_english,
-             'code': o.id} for o in Office.objects.all()]
+             'code': o.id} for o in offices]
 
 
-def get_subconstituencies():
+def get_subconstituencies(reference_data=None):
+    subconstituencies = \
+        reference_data.subconstituencies if reference_data else SubConstituency.objects.all()
     return [{'arabic_name': s.name_arabic,
              'english_name': s.name_english,
              'code': s.id}
-            for s in SubConstituency.objects.all()]
+            for s in subconstituencies]
@@ -1,5 +1,6 @@
 # Python imports
 from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
 import datetime
 import logging
 
@@ -9,52 +10,40 @@ from django.db import connection
 from django.db.models import Count
 
 # Project imports
-from libya_elections.utils import ConnectionInTZ
 from polling_reports.models import CenterClosedForElection, PollingReport, PreliminaryVoteCount
 from register.models import Office, RegistrationCenter
 from .aggregate import aggregate_up, join_by_date, join_by_date_nested
 from .constants import COUNTRY, INACTIVE_FOR_ELECTION, OFFICE, POLLING_CENTER_CODE, \
     POLLING_CENTER_COPY_OF, POLLING_CENTER_TYPE, PRELIMINARY_VOTE_COUNTS, REGION, \
     SUBCONSTITUENCY_ID
-from .data_pull_common import get_offices
-from .utils import dictfetchall, get_polling_centers
+from .data_pull_common import get_offices, ReferenceData
+from .instrumentation import stage
+from .utils import get_polling_centers, streaming_query
 from . import query
 
 logger = logging.getLogger(__name__)
 
 
-def get_raw_data(polling_locations, election):
+def get_raw_data(polling_locations, election, reference_data):
     """
     Get all the data we need from the database.
     """
     cursor = connection.cursor()
     logger.info("running ed queries")
-    polling_centers = get_polling_centers(cursor, polling_locations)
+    polling_centers = get_polling_centers(cursor, polling_locations,
+                                          reference_data.office_regions)
 
-    inactive_for_election = [
-        inactive.registration_center.center_id
-        for inactive in CenterClosedForElection.objects.filter(election=election)
-    ]
+    inactive_for_election = list(
+        CenterClosedForElection.objects.filter(election=election)
+        .values_list('registration_center__center_id', flat=True)
+    )
 
-    # The CENTER_OPENS and CENTER_VOTESREPORT queries split TIMESTAMPS into
-    # separate date and time fields within the query.  Our custom dictfetchall()
-    # can't currently adjust for time zone by accounting for separate fields.
-    # Work around that by letting PostgreSQL adjust the TZ before splitting
-    # the TIMESTAMP.  (A good alternative fix is not to complicate dictfetchall()
-    # but instead to preserve the combined TIMESTAMP/datetime further once all
-    # users of the data are in the integrated Django app.)
-    with ConnectionInTZ(cursor, settings.TIME_ZONE):
-        cursor.execute(query.CENTER_OPENS, {
-            'ELECTION_ID': election.id,
-        })
-        # disable TZ adjustment in dictfetchall()
-        center_opens = dictfetchall(cursor, date_time_columns=())
-        cursor.execute(query.CENTER_VOTESREPORT, {
-            'ELECTION_ID': election.id,
-        })
-        center_reports = dictfetchall(cursor, date_time_columns=())
-
-    prelim_vote_counts = PreliminaryVoteCount.objects.filter(election=election)
+    # The center opens and reports grow with the number of polling reports, so they
+    # are streamed from the server as they are joined to the polling centers rather
+    # than fetched here (see center_data_queries()).
+
+    prelim_vote_counts = PreliminaryVoteCount.objects.filter(election=election) \
+        .select_related('registration_center')
 
     # The input will contain each key once per option, but it is okay
     # to keep only the last instance since the fields set initially
@@ -62,7 +51,7 @@ def get_raw_data(polling_locations, election):
     prelim_vote_counts_by_center = {
         str(prelim.registration_center.center_id): {
             COUNTRY: 'Libya',
-            REGION: prelim.registration_center.office.region,
+            REGION: reference_data.office_regions[prelim.registration_center.office_id],
             OFFICE: prelim.registration_center.office_id,
             POLLING_CENTER_CODE: prelim.registration_center.center_id,
             PRELIMINARY_VOTE_COUNTS: dict()
@@ -75,8 +64,35 @@ def get_raw_data(polling_locations, election):
         this_polling_center_dict[PRELIMINARY_VOTE_COUNTS][prelim.option] = prelim.num_votes
 
     logger.info("ed queries done")
-    return polling_centers, inactive_for_election, center_opens, center_reports, \
-        prelim_vote_counts_by_center
+    return polling_centers, inactive_for_election, prelim_vote_counts_by_center
+
+
+@contextmanager
+def center_data_queries(election, center_id=None):
+    """
+    Provide iterators over the rows of the CENTER_OPENS and CENTER_VOTESREPORT
+    queries for the election (for a single center, if center_id is specified),
+    which are streamed from the database within the with block.
+    """
+    params = {'ELECTION_ID': election.id}
+    center_opens_sql, center_reports_sql = query.CENTER_OPENS, query.CENTER_VOTESREPORT
+    if center_id is not None:
+        params['CENTER_ID'] = center_id
+        center_opens_sql = for_center(center_opens_sql)
+        center_reports_sql = for_center(center_reports_sql)
+    # The CENTER_OPENS and CENTER_VOTESREPORT queries split TIMESTAMPS into
+    # separate date and time fields within the query.  Our custom dictfetchall()
+    # can't currently adjust for time zone by accounting for separate fields.
+    # Work around that by letting PostgreSQL adjust the TZ before splitting
+    # the TIMESTAMP.  (A good alternative fix is not to complicate dictfetchall()
+    # but instead to preserve the combined TIMESTAMP/datetime further once all
+    # users of the data are in the integrated Django app.)
+    # (date_time_columns=() disables TZ adjustment in dictfetchiter().)
+    with streaming_query(center_opens_sql, params, date_time_columns=(),
+                         time_zone=settings.TIME_ZONE) as center_opens, \
+            streaming_query(center_reports_sql, params, date_time_columns=(),
+                            time_zone=settings.TIME_ZONE) as center_reports:
+        yield center_opens, center_reports
 
 
 def summarize_opens_with_missing_center(missing):
@@ -106,8 +122,41 @@ def summarize_reports_with_missing_center(missing):
         logger.debug(data)
 
 
+def aggregate_offices(polling_centers):
+    return aggregate_up(polling_centers,
+                        aggregate_key=OFFICE,
+                        lesser_key='polling_center',
+                        skip_keys=(SUBCONSTITUENCY_ID, POLLING_CENTER_CODE,
+                                   POLLING_CENTER_COPY_OF, POLLING_CENTER_TYPE, 'phones'),
+                        copy_keys=(OFFICE, REGION, COUNTRY),
+                        enumerate_keys=((INACTIVE_FOR_ELECTION, POLLING_CENTER_CODE),),
+                        # voting periods stored at X_count:
+                        count_inner_keys=(1, 2, 3, 4, 'opened'),
+                        sum_inner_keys=(1, 2, 3, 4))
+
+
+def aggregate_regions(offices):
+    return aggregate_up(offices,
+                        aggregate_key=REGION,
+                        lesser_key='office',
+                        skip_keys=(OFFICE, 'name', INACTIVE_FOR_ELECTION),
+                        copy_keys=(REGION, COUNTRY),
+                        sum_inner_keys=(1, 2, 3, 4,
+                                        '1_count', '2_count', '3_count', '4_count'))
+
+
+def aggregate_country(regions):
+    return aggregate_up(regions,
+                        aggregate_key=COUNTRY,
+                        lesser_key=REGION,
+                        skip_keys=(REGION, 'name'),
+                        copy_keys=(COUNTRY,),
+                        sum_inner_keys=(1, 2, 3, 4,
+                                        '1_count', '2_count', '3_count', '4_count'))
+
+
 def process_raw_data(polling_centers, inactive_for_election, center_opens, center_reports,
-                     center_vote_counts):
+                     center_vote_counts, reference_data=None):
     all_dates = set()
 
     logger.info("joining center opens")
@@ -136,32 +185,9 @@ def process_raw_data(polling_centers, inactive_for_election, center_opens, cente
     for inactive_center in inactive_for_election:
         polling_centers[inactive_center][INACTIVE_FOR_ELECTION] = True
 
-    offices = aggregate_up(polling_centers.values(),
-                           aggregate_key=OFFICE,
-                           lesser_key='polling_center',
-                           skip_keys=(SUBCONSTITUENCY_ID, POLLING_CENTER_CODE,
-                                      POLLING_CENTER_COPY_OF, POLLING_CENTER_TYPE, 'phones'),
-                           copy_keys=(OFFICE, REGION, COUNTRY),
-                           enumerate_keys=((INACTIVE_FOR_ELECTION, POLLING_CENTER_CODE),),
-                           # voting periods stored at X_count:
-                           count_inner_keys=(1, 2, 3, 4, 'opened'),
-                           sum_inner_keys=(1, 2, 3, 4))
-
-    regions = aggregate_up(offices.values(),
-                           aggregate_key=REGION,
-                           lesser_key='office',
-                           skip_keys=(OFFICE, 'name', INACTIVE_FOR_ELECTION),
-                           copy_keys=(REGION, COUNTRY),
-                           sum_inner_keys=(1, 2, 3, 4,
-                                           '1_count', '2_count', '3_count', '4_count'))
-
-    country = aggregate_up(regions.values(),
-                           aggregate_key=COUNTRY,
-                           lesser_key=REGION,
-                           skip_keys=(REGION, 'name'),
-                           copy_keys=(COUNTRY,),
-                           sum_inner_keys=(1, 2, 3, 4,
-                                           '1_count', '2_count', '3_count', '4_count'))
+    offices = aggregate_offices(polling_centers.values())
+    regions = aggregate_regions(offices.values())
+    country = aggregate_country(regions.values())
 
     # Office and broader groupings should include preliminary vote counts from centers
     # (and aggregate_up can't handle this)
@@ -184,45 +210,92 @@ def process_raw_data(polling_centers, inactive_for_election, center_opens, cente
         'by_region': regions,
         'by_office': offices,
         'by_polling_center': polling_centers,
-        'offices': get_offices(),
+        'offices': get_offices(reference_data),
         'dates': list(sorted(all_dates)),
         'last_updated': datetime.datetime.now().isoformat()}
 
     return output_dict
 
 
-def pull_data(polling_locations, election):
-    polling_centers, inactive_for_election, center_opens, center_reports, center_vote_counts = \
-        get_raw_data(polling_locations, election)
-    return process_raw_data(polling_centers, inactive_for_election, center_opens, center_reports,
-                            center_vote_counts)
+def pull_data(polling_locations, election, reference_data=None):
+    if reference_data is None:
+        reference_data = ReferenceData()
+    with stage('query'):
+        polling_centers, inactive_for_election, center_vote_counts = \
+            get_raw_data(polling_locations, election, reference_data)
+    # The center opens and reports are streamed from the database as they're
+    # processed, so their queries are part of this stage.
+    with stage('aggregate'), \
+            center_data_queries(election) as (center_opens, center_reports):
+        return process_raw_data(polling_centers, inactive_for_election, center_opens,
+                                center_reports, center_vote_counts, reference_data)
 
 
-def message_log(election):
-    logger.info("running message log queries")
-
-    cursor = connection.cursor()
+def pull_center_data(center, election):
+    """
+    Pull the election day data for a single polling center, for updating the
+    'by_polling_center' slice of a report generated by pull_data() after the
+    center reports.
 
-    cursor.execute(query.LOG_PHONES, {'NO_LATER_THAN': election.work_end_time})
-    log_phones = dictfetchall(cursor)
+    center: the center's entry in that slice without any data by date (as
+    initially generated by get_polling_centers())
 
-    cursor.execute(query.LOG_ROLLCALL, {'ELECTION_ID': election.id})
-    log_rollcall = dictfetchall(cursor)
+    Returns the new entry for the center, and the set of dates it has data for.
+    """
+    center_id = center[POLLING_CENTER_CODE]
+    all_dates = set()
+    with center_data_queries(election, center_id) as (center_opens, center_reports):
+        polling_centers = join_by_date(center_opens,
+                                       'polling_center_code', 'date',
+                                       ['opened'],
+                                       {center_id: center}, all_dates)
+        polling_centers = join_by_date_nested(center_reports,
+                                              'polling_center_code', 'date',
+                                              {'voting_period': 'votes_reported'},
+                                              polling_centers, all_dates)
+    if CenterClosedForElection.objects.filter(election=election,
+                                              registration_center__center_id=center_id) \
+            .exists():
+        polling_centers[center_id][INACTIVE_FOR_ELECTION] = True
+    return polling_centers[center_id], all_dates
+
+
+def for_center(sql, center_column='polling_center_code'):
+    """ Restrict the results of one of the election day queries to the center
+    identified by the CENTER_ID parameter. """
+    return 'SELECT * FROM (%s) AS for_center WHERE %s = %%(CENTER_ID)s;' % (
+        sql.rstrip(';'), center_column)
+
+
+def message_log_queries(election):
+    """ Return the queries, with their parameters, for the message log entries. """
+    return (
+        (query.LOG_PHONES, {'NO_LATER_THAN': election.work_end_time}),
+        (query.LOG_ROLLCALL, {'ELECTION_ID': election.id}),
+        (query.LOG_VOTESREPORT, {'ELECTION_ID': election.id}),
+    )
+
+
+def center_message_log(election, center_id):
+    """ Return the message_log() entries for a single center. """
+    entries = []
+    for sql, params in message_log_queries(election):
+        with streaming_query(for_center(sql, 'center_code'),
+                             dict(params, CENTER_ID=center_id)) as rows:
+            entries.extend(rows)
+    return entries
 
-    cursor.execute(query.LOG_VOTESREPORT, {'ELECTION_ID': election.id})
-    log_report = dictfetchall(cursor)
-    logger.info("message log queries done")
 
-    logger.info("joining message logs")
-    merged = []
-    merged.extend(log_phones)
-    merged.extend(log_rollcall)
-    merged.extend(log_report)
+def message_log(election):
+    logger.info("running message log queries")
 
     output = defaultdict(list)
-    for item in merged:
-        center_code = item['center_code']
-        output[center_code].append(item)
+    for sql, params in message_log_queries(election):
+        with streaming_query(sql, params) as rows:
+            for item in rows:
+                center_code = item['center_code']
+                output[center_code].append(item)
+    logger.info("message log queries done")
 
     return output
 
@@ -231,10 +304,10 @@ def generate_election_day_hq_reports(election):
     """Generate election day HQ reports for the election day HQ view"""
     # Ignore centers which are inactive for polling for this election,
     # except when building the list of all centers.
-    inactive_center_db_ids = [
-        inactivity.registration_center.id
-        for inactivity in CenterClosedForElection.objects.filter(election=election)
-    ]
+    inactive_center_db_ids = list(
+        CenterClosedForElection.objects.filter(election=election)
+        .values_list('registration_center_id', flat=True)
+    )
     # For a given center there are usually 4 polling reports, one for each reporting period.
     # Sometimes a center has multiple reports per period, and occasionally no report for a
     # period. Since PollingReports are cumulative, we only want the most recent report for each
@@ -248,11 +321,14 @@ def generate_election_day_hq_reports(election):
         .order_by('registration_center__id', '-period_number', '-modification_date') \
         .distinct('registration_center__id')
 
-    open_centers = RegistrationCenter.objects.filter(centeropen__isnull=False) \
-        .exclude(id__in=inactive_center_db_ids) \
-        .distinct()
+    open_center_ids = set(
+        RegistrationCenter.objects.filter(centeropen__isnull=False)
+        .exclude(id__in=inactive_center_db_ids)
+        .values_list('id', flat=True)
+    )
 
     all_centers = RegistrationCenter.objects.all() \
+        .select_related('office', 'copy_of') \
         .annotate(n_registrations=Count('registration')) \
         .order_by('center_id')
 
@@ -291,7 +367,7 @@ def generate_election_day_hq_reports(election):
 
     # Tally registrations
     for center in all_centers:
-        is_open = center in open_centers
+        is_open = center.id in open_center_ids
 
         for report_type in REPORT_TYPES:
             if report_type == 'by_office':
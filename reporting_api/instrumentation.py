@@ -0,0 +1,195 @@
+"""
+Opt-in instrumentation of the report generation tasks (see
+settings.REPORT_INSTRUMENTATION).
+
+Each instrumented run records the time spent and queries run in each stage of
+generating the reports (query, aggregate, serialize, Redis write, ...), along
+with the number and size of the reports written to Redis, and the record is
+added to a Redis list of recent runs (see recent_runs()).  Time and queries are
+attributed to the innermost stage; those outside of any stage are recorded as
+'other'.  Stages which run concurrently in other threads overlap, so their
+totals may add up to more than the time of the run.
+
+If settings.REPORT_PROFILE_THRESHOLD is set, each run is also profiled (in the
+thread which started it) with cProfile, and the statistics of runs which take at
+least that many seconds are written to settings.REPORT_PROFILE_DIR, for
+inspection with pstats or snakeviz.
+"""
+# Python imports
+from collections import defaultdict
+from contextlib import contextmanager
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+
+# 3rd party imports
+from django.conf import settings
+from django.utils.timezone import now
+
+# Project imports
+from .utils import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+# Redis list of the records of recent runs, newest first (prefixed by
+# REPORTING_REDIS_KEY_PREFIX)
+REPORT_RUNS_KEY = 'report_runs'
+
+# The run in progress in this process, if it's instrumented.  Celery runs one task
+# at a time in each worker process, so there is at most one.
+_current_run = None
+# the stages in progress in each thread, innermost last
+_stages = threading.local()
+
+
+class InstrumentedRun(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.started = now()
+        self.stages = defaultdict(lambda: {'seconds': 0.0, 'queries': 0, 'count': 0})
+        self.reports_written = 0
+        self.bytes_written = 0
+        self.lock = threading.Lock()
+        self.query_counter = QueryCounter()
+
+    def add_stage(self, name, seconds, queries):
+        with self.lock:
+            stage_totals = self.stages[name]
+            stage_totals['seconds'] += seconds
+            stage_totals['queries'] += queries
+            stage_totals['count'] += 1
+
+    def add_report(self, num_bytes):
+        with self.lock:
+            self.reports_written += 1
+            self.bytes_written += num_bytes
+
+    def as_dict(self, seconds):
+        # whatever wasn't spent in a stage in this thread
+        outside = {
+            'seconds': seconds - sum(stage['seconds'] for stage in self.stages.values()),
+            'queries': self.query_counter.count - sum(stage['queries']
+                                                      for stage in self.stages.values()),
+        }
+        stages = {name: {'seconds': round(stage['seconds'], 3), 'queries': stage['queries'],
+                         'count': stage['count']}
+                  for name, stage in sorted(self.stages.items())}
+        stages['other'] = {'seconds': round(max(outside['seconds'], 0), 3),
+                           'queries': max(outside['queries'], 0), 'count': 1}
+        return {
+            'name': self.name,
+            'started': self.started.isoformat(),
+            'seconds': round(seconds, 3),
+            'queries': self.query_counter.count,
+            'reports_written': self.reports_written,
+            'bytes_written': self.bytes_written,
+            'stages': stages,
+        }
+
+
+@contextmanager
+def instrumented_run(name):
+    """
+    Record the stages of the run of the named task within the context, if
+    settings.REPORT_INSTRUMENTATION is set.
+    """
+    global _current_run
+    if not settings.REPORT_INSTRUMENTATION or _current_run is not None:
+        yield
+        return
+    run = _current_run = InstrumentedRun(name)
+    profiler = None
+    if settings.REPORT_PROFILE_THRESHOLD is not None:
+        profiler = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        with run.query_counter:
+            if profiler:
+                profiler.enable()
+            try:
+                yield
+            finally:
+                if profiler:
+                    profiler.disable()
+    finally:
+        _current_run = None
+        seconds = time.perf_counter() - start
+        record = run.as_dict(seconds)
+        try:
+            save_run(record)
+            if profiler and seconds >= settings.REPORT_PROFILE_THRESHOLD:
+                dump_profile(profiler, record)
+        except Exception:
+            # never let the instrumentation break the reports
+            logger.exception('Error saving the instrumentation of %s', name)
+
+
+@contextmanager
+def stage(name):
+    """ Attribute the time and queries within the context to the named stage of the
+    current instrumented run, if any. """
+    run = _current_run
+    if run is None:
+        yield
+        return
+    stack = getattr(_stages, 'stack', None)
+    if stack is None:
+        stack = _stages.stack = []
+    # time and queries of nested stages, which aren't included in this one
+    frame = {'seconds': 0.0, 'queries': 0}
+    stack.append(frame)
+    queries = run.query_counter.count
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        queries = run.query_counter.count - queries
+        stack.pop()
+        if stack:
+            stack[-1]['seconds'] += seconds
+            stack[-1]['queries'] += queries
+        run.add_stage(name, seconds - frame['seconds'], max(queries - frame['queries'], 0))
+
+
+def record_report_written(num_bytes):
+    """ Count a report of the specified encoded size written to Redis in the current
+    instrumented run, if any. """
+    run = _current_run
+    if run is not None:
+        run.add_report(num_bytes)
+
+
+def save_run(record):
+    from .reports import redis_key, report_store
+    key = redis_key(REPORT_RUNS_KEY)
+    pipe = report_store.pipeline()
+    pipe.lpush(key, json.dumps(record))
+    pipe.ltrim(key, 0, settings.REPORT_INSTRUMENTATION_HISTORY - 1)
+    pipe.execute()
+    logger.info('%s took %.1f seconds: %s', record['name'], record['seconds'],
+                json.dumps(record['stages']))
+
+
+def dump_profile(profiler, record):
+    os.makedirs(settings.REPORT_PROFILE_DIR, exist_ok=True)
+    filename = os.path.join(settings.REPORT_PROFILE_DIR, '%s-%s.prof' % (
+        record['name'], record['started'].replace(':', '').replace('+', '_')))
+    profiler.dump_stats(filename)
+    logger.warning('%s took %.1f seconds; profile saved in %s', record['name'],
+                   record['seconds'], filename)
+
+
+def recent_runs(name=None):
+    """ Return the records of the recent instrumented runs (of the named task, if
+    specified), newest first. """
+    from .reports import redis_key, report_store
+    records = [json.loads(record.decode())
+               for record in report_store.lrange(redis_key(REPORT_RUNS_KEY), 0, -1)]
+    if name is not None:
+        records = [record for record in records if record['name'] == name]
+    return records
@@ -0,0 +1,147 @@
+import timeit
+
+from django.core.management import BaseCommand, CommandError
+
+from reporting_api.reports import election_day_office_ids, election_day_office_index_key, \
+    election_day_office_table_key, election_day_offices_table_keys, \
+    election_day_polling_center_log_key, election_day_polling_center_table_key, election_key, \
+    report_store, resolve_report_keys, retrieve_report, ELECTION_DAY_BY_COUNTRY_KEY, \
+    ELECTION_DAY_HQ_REPORTS_KEY, ELECTION_DAY_METADATA_KEY, \
+    ELECTION_DAY_POLLING_CENTERS_TABLE_KEY, \
+    REGISTRATION_POINTS_CR_BY_COUNTRY_KEY, REGISTRATION_POINTS_NR_BY_COUNTRY_KEY, \
+    REGISTRATION_POINTS_CR_BY_OFFICE_KEY, REGISTRATION_POINTS_NR_BY_OFFICE_KEY, \
+    REGISTRATION_POINTS_CR_BY_REGION_KEY, REGISTRATION_POINTS_NR_BY_REGION_KEY, \
+    REGISTRATION_POINTS_CR_BY_SUBCONSTITUENCY_KEY, REGISTRATION_POINTS_NR_BY_SUBCONSTITUENCY_KEY, \
+    REGISTRATIONS_BY_COUNTRY_KEY, REGISTRATIONS_BY_PHONE_KEY, \
+    REGISTRATIONS_BY_POLLING_CENTER_KEY, REGISTRATIONS_BY_REGION_KEY, \
+    REGISTRATIONS_BY_SUBCONSTITUENCY_KEY, REGISTRATIONS_CSV_COUNTRY_STATS_KEY, \
+    REGISTRATIONS_CSV_OFFICE_STATS_KEY, REGISTRATIONS_CSV_REGION_STATS_KEY, \
+    REGISTRATIONS_CSV_SUBCONSTITUENCY_STATS_KEY, REGISTRATIONS_DAILY_BY_OFFICE_KEY, \
+    REGISTRATIONS_DAILY_BY_SUBCONSTITUENCY_KEY, REGISTRATIONS_METADATA_KEY, \
+    REGISTRATIONS_OFFICE_STATS_KEY, REGISTRATIONS_REGION_STATS_KEY, REGISTRATIONS_STATS_KEY, \
+    REGISTRATIONS_SUBCONSTITUENCY_STATS_KEY, REGISTRATIONS_CUMULATIVE_MESSAGES_KEY, \
+    REGISTRATIONS_WEEKLY_KEY
+from reporting_api.serialization import CODECS, decode_report, encode_report
+from voting.models import Election
+
+# The report keys retrieved by each vr_dashboard page
+REGISTRATION_PAGES = (
+    ('national', (REGISTRATIONS_BY_COUNTRY_KEY, REGISTRATIONS_METADATA_KEY,
+                  REGISTRATIONS_STATS_KEY, REGISTRATION_POINTS_NR_BY_COUNTRY_KEY,
+                  REGISTRATION_POINTS_CR_BY_COUNTRY_KEY)),
+    ('offices', (REGISTRATIONS_METADATA_KEY, REGISTRATIONS_OFFICE_STATS_KEY,
+                 REGISTRATIONS_STATS_KEY, REGISTRATION_POINTS_NR_BY_OFFICE_KEY,
+                 REGISTRATION_POINTS_CR_BY_OFFICE_KEY)),
+    ('weekly', (REGISTRATIONS_WEEKLY_KEY, REGISTRATIONS_METADATA_KEY,
+                REGISTRATIONS_STATS_KEY, REGISTRATION_POINTS_NR_BY_COUNTRY_KEY)),
+    ('sms', (REGISTRATIONS_STATS_KEY, REGISTRATIONS_METADATA_KEY,
+             REGISTRATIONS_CUMULATIVE_MESSAGES_KEY)),
+    ('regions', (REGISTRATIONS_BY_REGION_KEY, REGISTRATIONS_METADATA_KEY,
+                 REGISTRATIONS_STATS_KEY, REGISTRATIONS_REGION_STATS_KEY,
+                 REGISTRATION_POINTS_NR_BY_REGION_KEY, REGISTRATION_POINTS_CR_BY_REGION_KEY)),
+    ('subconstituencies', (REGISTRATIONS_BY_SUBCONSTITUENCY_KEY, REGISTRATIONS_METADATA_KEY,
+                           REGISTRATIONS_STATS_KEY, REGISTRATIONS_SUBCONSTITUENCY_STATS_KEY,
+                           REGISTRATION_POINTS_NR_BY_SUBCONSTITUENCY_KEY,
+                           REGISTRATION_POINTS_CR_BY_SUBCONSTITUENCY_KEY)),
+    ('csv_report', (REGISTRATIONS_METADATA_KEY, REGISTRATIONS_CSV_COUNTRY_STATS_KEY,
+                    REGISTRATIONS_CSV_OFFICE_STATS_KEY, REGISTRATIONS_CSV_REGION_STATS_KEY,
+                    REGISTRATIONS_CSV_SUBCONSTITUENCY_STATS_KEY)),
+    ('csv_daily_report', (REGISTRATIONS_DAILY_BY_OFFICE_KEY,
+                          REGISTRATIONS_DAILY_BY_SUBCONSTITUENCY_KEY,
+                          REGISTRATIONS_METADATA_KEY)),
+    ('center_csv_report', (REGISTRATIONS_METADATA_KEY, REGISTRATIONS_BY_POLLING_CENTER_KEY)),
+    ('phone_csv_report', (REGISTRATIONS_METADATA_KEY, REGISTRATIONS_BY_PHONE_KEY)),
+)
+
+# (the keys for each office and center are added by Command.get_pages())
+ELECTION_DAY_PAGES = (
+    ('election_day_hq', (ELECTION_DAY_METADATA_KEY, ELECTION_DAY_HQ_REPORTS_KEY)),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare the size and decode time of the reports stored in Redis, per ' \
+           'dashboard page, with each report codec.  The reports must already have ' \
+           'been generated.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--election',
+            type=int,
+            help='Id of the election to use for election day pages (default: the latest)')
+        parser.add_argument(
+            '--repeat',
+            default=20,
+            type=int,
+            help='Number of times to decode each page when timing')
+
+    def get_pages(self, election):
+        pages = list(REGISTRATION_PAGES)
+        if election is None:
+            return pages
+        pages.extend((name, [election_key(key, election) for key in keys])
+                     for name, keys in ELECTION_DAY_PAGES)
+        metadata_key = election_key(ELECTION_DAY_METADATA_KEY, election)
+        metadata = retrieve_report(metadata_key)
+        if metadata:
+            office_ids = election_day_office_ids(metadata)
+            pages.append(('election_day', [
+                metadata_key,
+                election_key(ELECTION_DAY_BY_COUNTRY_KEY, election),
+            ] + election_day_offices_table_keys(election, metadata)))
+            pages.append(('election_day_center', [metadata_key] + [
+                election_day_office_index_key(election, office_id) for office_id in office_ids
+            ]))
+            if office_ids:
+                office_id = office_ids[0]
+                pages.append(('election_day_office_n', [
+                    metadata_key,
+                    election_day_office_table_key(election, office_id),
+                ] + [
+                    election_day_polling_center_table_key(election, center_id)
+                    for center_id in metadata['centers_by_office'][str(office_id)]
+                ]))
+        centers = retrieve_report(election_key(ELECTION_DAY_POLLING_CENTERS_TABLE_KEY, election))
+        if centers:
+            center_id = centers[0]['polling_center_code']
+            pages.append(('election_day_center_n', [
+                election_key(ELECTION_DAY_METADATA_KEY, election),
+                election_key(ELECTION_DAY_POLLING_CENTERS_TABLE_KEY, election),
+                election_day_polling_center_table_key(election, center_id),
+                election_day_polling_center_log_key(election, center_id),
+            ]))
+        return pages
+
+    def handle(self, *args, **options):
+        if options['election']:
+            election = Election.objects.get(id=options['election'])
+        else:
+            election = Election.objects.order_by('-polling_start_time').first()
+        pages = self.get_pages(election)
+
+        all_keys = sorted({key for name, keys in pages for key in keys})
+        stored = dict(zip(all_keys, report_store.mget(resolve_report_keys(all_keys))))
+        missing = [key for key, value in stored.items() if value is None]
+        if missing:
+            raise CommandError('Reports not found in Redis (generate them first): %s'
+                               % ', '.join(missing))
+        reports = {key: decode_report(value) for key, value in stored.items()}
+
+        codec_names = sorted(CODECS.keys())
+        self.stdout.write('%-24s' % 'page'
+                          + ''.join('%14s %10s' % (name + ' bytes', 'ms') for name in codec_names))
+        totals = {name: [0, 0.0] for name in codec_names}
+        for page_name, keys in pages:
+            line = '%-24s' % page_name
+            for name in codec_names:
+                encoded = [encode_report(reports[key], codec=name) for key in keys]
+                num_bytes = sum(len(value) for value in encoded)
+                seconds = timeit.timeit(lambda: [decode_report(value) for value in encoded],
+                                        number=options['repeat']) / options['repeat']
+                totals[name][0] += num_bytes
+                totals[name][1] += seconds
+                line += '%14d %10.2f' % (num_bytes, seconds * 1000)
+            self.stdout.write(line)
+        self.stdout.write('%-24s' % 'total'
+                          + ''.join('%14d %10.2f' % (totals[name][0], totals[name][1] * 1000)
+                                    for name in codec_names))
@@ -0,0 +1,65 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management import BaseCommand
+
+from reporting_api import data_pull, data_pull_ed
+from reporting_api.data_pull_common import ReferenceData
+from reporting_api.reports import load_election_day_report, load_registrations_report
+from voting.models import Election
+
+
+class Command(BaseCommand):
+    help = 'Measure the time and peak memory used to derive the dashboard reports from ' \
+           'the raw registrations and election day reports and store them in Redis.  ' \
+           'Create data at national scale first with create_reporting_api_test_data, ' \
+           'e.g. --num-registrations 2000000 --num-centers 1600.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--election',
+            type=int,
+            help='Id of the election to use for the election day report (default: the latest)')
+        parser.add_argument(
+            '--repeat',
+            default=3,
+            type=int,
+            help='Number of times to run each step when timing')
+
+    def measure(self, name, func, repeat):
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            seconds.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.stdout.write('%-28s %10.1f ms %10.1f MB' % (name, min(seconds) * 1000,
+                                                         peak / 1024 / 1024))
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        reference_data = ReferenceData()
+        self.stdout.write('%-28s %13s %13s' % ('step', 'best time', 'peak memory'))
+
+        registrations = data_pull.pull_data(reference_data.active_registration_locations,
+                                            reference_data=reference_data)
+        self.measure('registrations', lambda: load_registrations_report(registrations), repeat)
+
+        if options['election']:
+            election = Election.objects.get(id=options['election'])
+        else:
+            election = Election.objects.order_by('-polling_start_time').first()
+        if election is None:
+            return
+        raw_report = data_pull_ed.pull_data(reference_data.all_polling_locations, election,
+                                            reference_data)
+        self.measure('election day normalization',
+                     lambda: json.loads(json.dumps(raw_report)), repeat)
+        report = json.loads(json.dumps(raw_report))
+        self.measure('election day', lambda: load_election_day_report(election, report), repeat)
@@ -0,0 +1,186 @@
+from collections import defaultdict
+from functools import partial
+import json
+import re
+import resource
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from polling_reports.models import PollingReport
+from register.models import Registration, RegistrationCenter, SMS
+from reporting_api import data_pull, data_pull_ed
+from reporting_api.create_test_data import create
+from reporting_api.data_pull_common import ReferenceData
+from reporting_api.reports import generate_election_day_reports_and_logs, \
+    generate_registrations_reports, redis_key, report_store, REPORT_GENERATIONS_KEY, \
+    generation_key
+from reporting_api.utils import QueryCounter
+from voting.models import Election
+
+from .create_reporting_api_test_data import DELETE_EXISTING_DATA_ARG, DELETE_EXISTING_DATA_OPT
+
+# Roughly the size of the national registration database
+NATIONAL_NUM_REGISTRATIONS = 2000000
+NATIONAL_NUM_REGISTRATION_CENTERS = 1600
+NATIONAL_NUM_REGISTRATION_DATES = 30
+NATIONAL_NUM_REPORTING_PERIODS = 4
+
+# Settings which change the performance of the pipeline, recorded with the results
+BENCHMARK_SETTINGS = (
+    'REPORT_AGGREGATION_ENGINE', 'REPORT_CURSOR_ITERSIZE', 'REPORT_QUERY_THREADS',
+    'REPORT_SERVER_SIDE_CURSORS', 'REPORT_STORE_CODEC',
+)
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of the process so far (not just of the
+    current stage, since it can't be reset)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def stored_report_sizes():
+    """Return the number and total size in bytes of the current generation of the
+    reports in Redis, by report key with the ids (election, center) replaced by N."""
+    generations = report_store.hgetall(redis_key(REPORT_GENERATIONS_KEY))
+    keys = sorted(key.decode() for key in generations)
+    pipe = report_store.pipeline(transaction=False)
+    for key in keys:
+        pipe.strlen(generation_key(key, generations[key.encode()].decode()))
+    sizes = defaultdict(lambda: {'count': 0, 'bytes': 0})
+    for key, size in zip(keys, pipe.execute()):
+        pattern = sizes[re.sub(r'\d+', 'N', key)]
+        pattern['count'] += 1
+        pattern['bytes'] += size
+    return dict(sorted(sizes.items()))
+
+
+class Command(BaseCommand):
+    help = 'Time each stage of the reporting_api pipeline, from pulling the data from the ' \
+           'database to storing the reports in Redis, with synthetic data at national ' \
+           'scale.  Reports the wall time, query count and peak RSS of each stage and ' \
+           'the size of the stored reports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            DELETE_EXISTING_DATA_ARG, action='store_true',
+            default=False,
+            help='Remove existing data and create synthetic data at the specified scale')
+        parser.add_argument(
+            '--use-existing-data', action='store_true',
+            default=False,
+            help='Benchmark the existing data (e.g., created by a previous run)')
+        parser.add_argument(
+            '--num-registrations',
+            default=NATIONAL_NUM_REGISTRATIONS,
+            type=int,
+            help='Specify the number of registrations to create')
+        parser.add_argument(
+            '--num-centers',
+            default=NATIONAL_NUM_REGISTRATION_CENTERS,
+            type=int,
+            help='Distribute registrations among this number of registration centers')
+        parser.add_argument(
+            '--num-registration-dates',
+            default=NATIONAL_NUM_REGISTRATION_DATES,
+            type=int,
+            help='Specify the number of dates with registrations')
+        parser.add_argument(
+            '--num-reporting-periods',
+            default=NATIONAL_NUM_REPORTING_PERIODS,
+            type=int,
+            help='Create this many polling reports per center for the election')
+        parser.add_argument(
+            '--json', action='store_true',
+            default=False,
+            help='Write the results as JSON, for comparison with other runs')
+
+    def create_data(self, options):
+        if options['use_existing_data']:
+            return
+        if not options[DELETE_EXISTING_DATA_OPT]:
+            raise CommandError('%s or --use-existing-data is a required parameter'
+                               % DELETE_EXISTING_DATA_ARG)
+        start = time.perf_counter()
+        create(num_registrations=options['num_registrations'],
+               num_registration_dates=options['num_registration_dates'],
+               num_registration_centers=options['num_centers'],
+               num_daily_reports=options['num_centers'] * options['num_reporting_periods'])
+        if not options['json']:
+            self.stdout.write('Created data in %.1f s' % (time.perf_counter() - start))
+
+    def measure(self, results, name, func):
+        with QueryCounter() as counter:
+            start = time.perf_counter()
+            result = func()
+            seconds = time.perf_counter() - start
+        results[name] = {'seconds': round(seconds, 3), 'queries': counter.count,
+                         'peak_rss_mb': round(peak_rss_mb(), 1)}
+        return result
+
+    def handle(self, *args, **options):
+        self.create_data(options)
+        election = Election.objects.order_by('-polling_start_time').first()
+        if election is None:
+            raise CommandError('There is no election to benchmark')
+
+        stages = {}
+        reference_data = ReferenceData()
+        self.measure(stages, 'reference data', reference_data.load)
+        polling_locations = reference_data.active_registration_locations
+
+        raw_data = self.measure(stages, 'registrations pull_data', lambda: data_pull.get_raw_data(
+            polling_locations, reference_data=reference_data))
+        self.measure(stages, 'registrations process_raw_data', partial(
+            data_pull.process_raw_data, *raw_data, reference_data=reference_data))
+        del raw_data  # free it before the later stages
+        self.measure(stages, 'generate_registrations_reports', generate_registrations_reports)
+
+        def pull_election_day_data():
+            polling_centers, inactive_for_election, center_vote_counts = \
+                data_pull_ed.get_raw_data(reference_data.all_polling_locations, election,
+                                          reference_data)
+            # The center opens and reports are streamed as they're processed; fetch
+            # them here so that the queries are counted as part of this stage.
+            with data_pull_ed.center_data_queries(election) as (center_opens, center_reports):
+                return polling_centers, inactive_for_election, list(center_opens), \
+                    list(center_reports), center_vote_counts
+
+        raw_data = self.measure(stages, 'election day pull_data', pull_election_day_data)
+        self.measure(stages, 'election day process_raw_data', partial(
+            data_pull_ed.process_raw_data, *raw_data, reference_data=reference_data))
+        del raw_data
+        self.measure(stages, 'generate_election_day_reports_and_logs',
+                     lambda: generate_election_day_reports_and_logs(rebuild_all=True))
+
+        results = {
+            'scale': {
+                'registrations': Registration.objects.count(),
+                'centers': RegistrationCenter.objects.count(),
+                'sms': SMS.objects.count(),
+                'elections': Election.objects.count(),
+                'polling_reports': PollingReport.objects.filter(election=election).count(),
+            },
+            'settings': {name: getattr(settings, name) for name in BENCHMARK_SETTINGS},
+            'stages': stages,
+            'redis': stored_report_sizes(),
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for name, value in results['scale'].items():
+            self.stdout.write('%-40s %12d' % (name, value))
+        self.stdout.write('')
+        self.stdout.write('%-40s %12s %10s %14s' % ('stage', 'time', 'queries', 'peak RSS'))
+        for name, stage in stages.items():
+            self.stdout.write('%-40s %10.2f s %10d %11.1f MB' % (
+                name, stage['seconds'], stage['queries'], stage['peak_rss_mb']))
+        self.stdout.write('')
+        self.stdout.write('%-40s %12s %14s' % ('report', 'count', 'bytes'))
+        for key, size in results['redis'].items():
+            self.stdout.write('%-40s %12d %14d' % (key, size['count'], size['bytes']))
+        self.stdout.write('%-40s %12d %14d' % (
+            'total', sum(size['count'] for size in results['redis'].values()),
+            sum(size['bytes'] for size in results['redis'].values())))
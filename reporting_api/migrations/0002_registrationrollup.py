@@ -0,0 +1,43 @@
+# Generated by Django 2.2 on 2026-10-16 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0004_create_user_model_permissions'),
+        ('reporting_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationRollupStatus',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('high_water_mark', models.DateTimeField(verbose_name='high water mark')),
+                ('last_full_rebuild', models.DateTimeField(verbose_name='last full rebuild')),
+            ],
+            options={
+                'verbose_name': 'registration rollup status',
+                'verbose_name_plural': 'registration rollup statuses',
+            },
+        ),
+        migrations.CreateModel(
+            name='RegistrationRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reg_date', models.DateField(verbose_name='registration date')),
+                ('gender', models.IntegerField(verbose_name='gender')),
+                ('age', models.IntegerField(verbose_name='age')),
+                ('count', models.IntegerField(verbose_name='count')),
+                ('registration_center', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='register.RegistrationCenter', verbose_name='registration center')),
+            ],
+            options={
+                'verbose_name': 'registration rollup',
+                'verbose_name_plural': 'registration rollups',
+                'unique_together': {('registration_center', 'reg_date', 'gender', 'age')},
+            },
+        ),
+    ]
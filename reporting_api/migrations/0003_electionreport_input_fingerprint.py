@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-16 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting_api', '0002_registrationrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electionreport',
+            name='input_fingerprint',
+            field=models.CharField(blank=True, max_length=40, verbose_name='input fingerprint'),
+        ),
+    ]
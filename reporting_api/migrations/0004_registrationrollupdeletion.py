@@ -0,0 +1,25 @@
+# Generated by Django 2.2 on 2026-10-16 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0005_registration_modification_date_index'),
+        ('reporting_api', '0003_electionreport_input_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationRollupDeletion',
+            fields=[
+                ('registration', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='register.Registration', verbose_name='registration')),
+            ],
+            options={
+                'verbose_name': 'registration rollup deletion',
+                'verbose_name_plural': 'registration rollup deletions',
+            },
+        ),
+    ]
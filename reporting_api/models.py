@@ -1,7 +1,15 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
 from libya_elections.abstract import AbstractBaseModel
+from polling_reports.models import CenterOpen, PollingReport
+from register.models import Office, RegistrationCenter, SMS, SubConstituency
+
+# the fields of an SMS which determine how it's counted (see count_sms())
+SMS_COUNTED_FIELDS = {'creation_date', 'direction', 'msg_type', 'deleted'}
 
 
 class ElectionReport(AbstractBaseModel):
@@ -10,7 +18,120 @@ class ElectionReport(AbstractBaseModel):
     report = models.TextField(_('report'))
     hq_reports = models.TextField(_('headquarters reports'))
     message_log = models.TextField(_('message log'))
+    # election_input_fingerprint() of the data the reports were generated from
+    input_fingerprint = models.CharField(_('input fingerprint'), max_length=40, blank=True)
 
     class Meta:
         verbose_name = _("election report")
         verbose_name_plural = _("election reports")
+
+
+class RegistrationRollup(AbstractBaseModel):
+    """
+    Number of current registrations at a center on a particular date (in local time), by
+    gender and age, maintained by reporting_api.data_pull.refresh_registration_rollup().
+    """
+    registration_center = models.ForeignKey('register.RegistrationCenter',
+                                            verbose_name=_('registration center'),
+                                            on_delete=models.CASCADE)
+    reg_date = models.DateField(_('registration date'))
+    gender = models.IntegerField(_('gender'))
+    age = models.IntegerField(_('age'))
+    count = models.IntegerField(_('count'))
+
+    class Meta:
+        verbose_name = _("registration rollup")
+        verbose_name_plural = _("registration rollups")
+        unique_together = (('registration_center', 'reg_date', 'gender', 'age'),)
+
+
+class RegistrationRollupStatus(AbstractBaseModel):
+    """
+    Single row recording how far RegistrationRollup has been brought up to date.
+    """
+    high_water_mark = models.DateTimeField(_('high water mark'))
+    # ages in RegistrationRollup are as of the local date of the last full rebuild
+    last_full_rebuild = models.DateTimeField(_('last full rebuild'))
+
+    class Meta:
+        verbose_name = _("registration rollup status")
+        verbose_name_plural = _("registration rollup statuses")
+
+
+class RegistrationRollupDeletion(AbstractBaseModel):
+    """
+    A deleted registration which RegistrationRollup already leaves out, so that saving it
+    again doesn't remove it from the counts a second time.
+    """
+    registration = models.OneToOneField('register.Registration', primary_key=True,
+                                        verbose_name=_('registration'),
+                                        on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name = _("registration rollup deletion")
+        verbose_name_plural = _("registration rollup deletions")
+
+
+# Signals
+@receiver(post_save, sender=CenterOpen)
+@receiver(post_save, sender=PollingReport)
+def update_election_day_center(sender, instance, **kwargs):
+    """Update the election day reports for the center that opened or reported once the
+    change is committed, rather than waiting for the next election day report run."""
+    if not settings.REPORT_ELECTION_DAY_CENTER_UPDATES:
+        return
+    from .tasks import election_day_center
+    election_id = instance.election_id
+    center_id = instance.registration_center.center_id
+    transaction.on_commit(lambda: election_day_center.delay(election_id, center_id))
+
+
+@receiver(pre_save, sender=SMS)
+def remember_sms_counter_field(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Remember how an SMS was counted before it's saved, from the copy in the database,
+    so that count_sms() can correct the counts if that changes.  Saves which only update
+    other fields are skipped."""
+    from .reports import sms_counter_field
+    if not settings.REPORT_INCREMENTAL_SMS_COUNTS or raw:
+        return
+    if update_fields is not None and not SMS_COUNTED_FIELDS & set(update_fields):
+        return
+    stored = None
+    if instance.pk is not None:
+        stored = SMS.objects.unfiltered().filter(pk=instance.pk) \
+            .only(*SMS_COUNTED_FIELDS).first()
+    instance._sms_counter_field = sms_counter_field(stored) if stored else None
+
+
+@receiver(post_save, sender=SMS)
+def count_sms(sender, instance, raw=False, **kwargs):
+    """Update the SMS counters which the sms_stats and message_stats reports are read
+    from once the change is committed, rather than counting all messages each time the
+    reports are generated."""
+    from .reports import sms_counter_field, update_sms_counters
+    if not settings.REPORT_INCREMENTAL_SMS_COUNTS or raw:
+        return
+    if not hasattr(instance, '_sms_counter_field'):
+        return  # see remember_sms_counter_field()
+    old_field = instance._sms_counter_field
+    del instance._sms_counter_field
+    new_field = sms_counter_field(instance)
+    if old_field == new_field:
+        return
+    deltas = {}
+    if old_field:
+        deltas[old_field] = -1
+    if new_field:
+        deltas[new_field] = 1
+    transaction.on_commit(lambda: update_sms_counters(deltas))
+
+
+@receiver([post_save, post_delete], sender=Office)
+@receiver([post_save, post_delete], sender=RegistrationCenter)
+@receiver([post_save, post_delete], sender=SubConstituency)
+def flush_name_directory(sender, **kwargs):
+    """Make the dashboard load the names again once the change is committed (see
+    reporting_api.name_directory).  Bulk updates are picked up when the registrations
+    reports are next generated."""
+    from .name_directory import names_changed
+    transaction.on_commit(names_changed)
@@ -0,0 +1,86 @@
+"""
+A process-local directory of the names of the offices, subconstituencies and
+registration centers, for the voter registration dashboard, so that rendering a
+page doesn't have to query them.
+
+The directory is loaded again when the names change (any process saving an
+office, subconstituency or center bumps NAME_DIRECTORY_VERSION_KEY; see
+reporting_api.models) or a new generation of the registrations reports is
+stored, which may refer to new centers.
+"""
+# Python imports
+import threading
+
+# 3rd party imports
+from django.utils.translation import get_language
+
+# Project imports
+from register.models import Office, RegistrationCenter, SubConstituency
+from .reports import redis_key, report_store, report_store_replica, \
+    REGISTRATIONS_METADATA_KEY, REPORT_GENERATIONS_KEY
+
+# Redis counter bumped whenever the names change (prefixed by REPORTING_REDIS_KEY_PREFIX)
+NAME_DIRECTORY_VERSION_KEY = 'name_directory_version'
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+class Name(object):
+    """ The id and names of an office or subconstituency, with the name in the
+    current language as name, like register.models.NamedThing. """
+    __slots__ = ('id', 'name_english', 'name_arabic')
+
+    def __init__(self, id, name_english, name_arabic):
+        self.id = id
+        self.name_english = name_english
+        self.name_arabic = name_arabic
+
+    @property
+    def name(self):
+        return self.name_arabic if get_language() == 'ar' else self.name_english
+
+    def __str__(self):
+        return self.name
+
+
+class NameDirectory(object):
+
+    def __init__(self, version):
+        self.version = version
+        self.offices = {
+            office_id: Name(office_id, name_english, name_arabic)
+            for office_id, name_english, name_arabic
+            in Office.objects.values_list('id', 'name_english', 'name_arabic')
+        }
+        self.subconstituencies = {
+            subconstituency_id: Name(subconstituency_id, name_english, name_arabic)
+            for subconstituency_id, name_english, name_arabic
+            in SubConstituency.objects.values_list('id', 'name_english', 'name_arabic')
+        }
+        # names of the (non-deleted) centers, by center_id
+        self.centers = dict(RegistrationCenter.objects.values_list('center_id', 'name'))
+
+
+def current_version():
+    pipe = report_store_replica.pipeline(transaction=False)
+    pipe.get(redis_key(NAME_DIRECTORY_VERSION_KEY))
+    pipe.hget(redis_key(REPORT_GENERATIONS_KEY), REGISTRATIONS_METADATA_KEY)
+    return tuple(pipe.execute())
+
+
+def get_name_directory():
+    """ Return the directory of names, loading it if the names or the registrations
+    reports have changed since it was loaded.  The directory is shared with other
+    requests and must not be modified. """
+    global _directory
+    version = current_version()
+    with _directory_lock:
+        if _directory is None or _directory.version != version:
+            _directory = NameDirectory(version)
+        return _directory
+
+
+def names_changed():
+    """ Make each process load the directory again on its next use. """
+    report_store.incr(redis_key(NAME_DIRECTORY_VERSION_KEY))
@@ -3,22 +3,104 @@
 from libya_elections.constants import FIRST_PERIOD_NUMBER, LAST_PERIOD_NUMBER
 
 
-DEMO_QUERY = """SELECT DATE(register_registration.creation_date) AS reg_date,
+DEMO_QUERY = """SELECT reg_date,
                      gender,
-                     DATE_PART('YEAR', AGE(birth_date)) AS age,
+                     age,
                      center_id,
-                     COUNT(*)
-              FROM register_registration
-                   JOIN civil_registry_citizen AS citizen ON (register_registration.citizen_id = citizen.civil_registry_id)
-                   JOIN register_registrationcenter ON (registration_center_id = register_registrationcenter.id)
-                   WHERE register_registration.archive_time IS NULL
+                     count
+              FROM reporting_api_registrationrollup AS rollup
+                   JOIN register_registrationcenter ON (rollup.registration_center_id = register_registrationcenter.id)
                    /* only centers supporting registrations (no oil centers, etc) */
-                   AND register_registrationcenter.reg_open = true
-                   AND register_registration.deleted = false
-                   AND register_registrationcenter.deleted = false
+                   WHERE register_registrationcenter.reg_open = true
                    /* only non-deleted centers */
+                   AND register_registrationcenter.deleted = false;"""
+
+# Whether a registration counts towards the rollup at a point in time, judged from its
+# current version.  There is no deletion timestamp, so a deleted registration is taken
+# to have been deleted when it was last modified.
+REGISTRATION_COUNTED_AT_UNTIL = """(reg.creation_date <= %(UNTIL)s
+                                    AND (reg.archive_time IS NULL OR reg.archive_time > %(UNTIL)s)
+                                    AND NOT (reg.deleted = true AND reg.modification_date <= %(UNTIL)s))"""
+
+# For a registration modified after SINCE, the previous refresh (at SINCE) counted it
+# unless it had already been deleted, which reporting_api_registrationrollupdeletion
+# records.
+REGISTRATION_COUNTED_AT_SINCE = """(deletion.registration_id IS NULL
+                                    AND reg.creation_date <= %(SINCE)s
+                                    AND (reg.archive_time IS NULL OR reg.archive_time > %(SINCE)s))"""
+
+# signed change in registration counts between SINCE and UNTIL for a registration
+# modified after SINCE: +1 for a registration which started (new registrations, as well
+# as the new version of a registration which was changed), -1 for a registration which
+# was archived (the old version of a registration which was changed) or deleted
+REGISTRATION_DELTA = """(CASE WHEN """ + REGISTRATION_COUNTED_AT_UNTIL + """ THEN 1 ELSE 0 END
+                         - CASE WHEN """ + REGISTRATION_COUNTED_AT_SINCE + """ THEN 1 ELSE 0 END)"""
+
+# Age in whole years as of AGE_DATE, the local date of the last full rebuild, so that a
+# registration is added to and removed from the same age bucket.
+REGISTRATION_AGE = """DATE_PART('YEAR', AGE(%(AGE_DATE)s, birth_date))::INTEGER"""
+
+# # REGISTRATION ROLLUP # #
+ROLLUP_CLEAR_QUERY = """DELETE FROM reporting_api_registrationrollup;"""
+
+# demographic breakdowns by day per registration center as of UNTIL, as stored in
+# reporting_api_registrationrollup (after ROLLUP_CLEAR_QUERY)
+ROLLUP_REBUILD_QUERY = """INSERT INTO reporting_api_registrationrollup (registration_center_id, reg_date, gender, age, count)
+              SELECT reg.registration_center_id,
+                     DATE(reg.creation_date) AS reg_date,
+                     gender,
+                     """ + REGISTRATION_AGE + """ AS age,
+                     COUNT(*)
+              FROM register_registration AS reg
+                   JOIN civil_registry_citizen AS citizen ON (reg.citizen_id = citizen.civil_registry_id)
+                   WHERE """ + REGISTRATION_COUNTED_AT_UNTIL + """
               GROUP BY 1, 2, 3, 4;"""
 
+# fold the changes between SINCE and UNTIL into the rollup; registrations modified after
+# UNTIL are judged as of UNTIL now and looked at again by the next refresh
+ROLLUP_DELTA_QUERY = """INSERT INTO reporting_api_registrationrollup AS rollup (registration_center_id, reg_date, gender, age, count)
+              SELECT * FROM
+                  (SELECT reg.registration_center_id,
+                          DATE(reg.creation_date) AS reg_date,
+                          gender,
+                          """ + REGISTRATION_AGE + """ AS age,
+                          SUM""" + REGISTRATION_DELTA + """ AS delta
+                   FROM register_registration AS reg
+                        JOIN civil_registry_citizen AS citizen ON (reg.citizen_id = citizen.civil_registry_id)
+                        LEFT JOIN reporting_api_registrationrollupdeletion AS deletion ON (deletion.registration_id = reg.id)
+                        WHERE reg.modification_date > %(SINCE)s
+                   GROUP BY 1, 2, 3, 4) AS changes
+              WHERE delta <> 0
+              ON CONFLICT (registration_center_id, reg_date, gender, age)
+              DO UPDATE SET count = rollup.count + EXCLUDED.count;"""
+
+ROLLUP_DELETIONS_CLEAR_QUERY = """DELETE FROM reporting_api_registrationrollupdeletion;"""
+
+# the deleted registrations which the rollup leaves out as of UNTIL
+# (after ROLLUP_DELETIONS_CLEAR_QUERY)
+ROLLUP_DELETIONS_REBUILD_QUERY = """INSERT INTO reporting_api_registrationrollupdeletion (registration_id)
+              SELECT id FROM register_registration
+              WHERE deleted = true
+              AND modification_date <= %(UNTIL)s;"""
+
+# bring reporting_api_registrationrollupdeletion from SINCE up to UNTIL (after
+# ROLLUP_DELTA_QUERY, which reads the deletions as of SINCE)
+ROLLUP_UNDELETIONS_QUERY = """DELETE FROM reporting_api_registrationrollupdeletion AS deletion
+              USING register_registration AS reg
+              WHERE deletion.registration_id = reg.id
+              AND reg.modification_date > %(SINCE)s
+              AND NOT (reg.deleted = true AND reg.modification_date <= %(UNTIL)s);"""
+
+ROLLUP_DELETIONS_DELTA_QUERY = """INSERT INTO reporting_api_registrationrollupdeletion (registration_id)
+              SELECT id FROM register_registration
+              WHERE deleted = true
+              AND modification_date > %(SINCE)s
+              AND modification_date <= %(UNTIL)s
+              ON CONFLICT (registration_id) DO NOTHING;"""
+
+# remove rollup rows which no longer represent any registrations
+ROLLUP_PRUNE_QUERY = """DELETE FROM reporting_api_registrationrollup WHERE count = 0;"""
+
 # incoming message count by day per center
 MESSAGES_QUERY = """SELECT DATE(creation_date) AS message_date,
                            direction,
@@ -67,6 +149,37 @@ REGISTRATIONS_BY_PHONE_QUERY = """
   GROUP BY sms.from_number
  HAVING COUNT(DISTINCT reg.id) > 1;"""
 
+# the same per-phone statistics as the three queries above (which are used on their
+# own by the functions in data_pull that return each statistic), in one pass over
+# register_sms, for the phones which
+# - successfully registered people with more than one distinct family record
+#   (fbr_count, fbr_list; modified from fraud query)
+# - have more than 1 registration (reg_count)
+# - were sent the "NID already registered" message, using the rapidsms logic
+#   (duplicate_dates)
+PHONE_STATISTICS_QUERY = """
+    SELECT CASE WHEN sms.direction = 1 THEN sms.from_number ELSE sms.to_number END
+               AS phone_number,
+           COUNT(DISTINCT citizen.fbr_number) AS fbr_count,
+           ARRAY_AGG(DISTINCT citizen.fbr_number)
+               FILTER (WHERE citizen.civil_registry_id IS NOT NULL) AS fbr_list,
+           COUNT(DISTINCT reg.id) AS reg_count,
+           ARRAY_AGG(DISTINCT sms.creation_date)
+               FILTER (WHERE sms.direction = 2) AS duplicate_dates
+      FROM register_sms AS sms
+      LEFT JOIN register_registration AS reg
+           ON (reg.sms_id = sms.id AND reg.deleted = false AND reg.archive_time IS NULL)
+      LEFT JOIN civil_registry_citizen AS citizen ON (reg.citizen_id = citizen.civil_registry_id)
+     WHERE sms.deleted = false
+       AND ((sms.direction = 1 /* incoming */
+             AND reg.id IS NOT NULL) /* successful registrations only */
+            OR (sms.direction = 2 /* outgoing */
+                AND sms.message_code = 3))
+  GROUP BY 1
+    HAVING COUNT(DISTINCT citizen.fbr_number) > 1
+        OR COUNT(DISTINCT reg.id) > 1
+        OR BOOL_OR(sms.direction = 2);"""
+
 # datetime of first rollcall per center each day
 CENTER_OPENS = """SELECT center.center_id AS polling_center_code,
                   DATE(rollcall.creation_date) as date,
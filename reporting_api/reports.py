@@ -1,46 +1,97 @@
 # Python imports
-from collections import defaultdict, Iterable
-from copy import deepcopy
+from collections import defaultdict, Iterable, OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from functools import partial
+import hashlib
+from itertools import accumulate
 import json
 import logging
 import numbers
+import threading
+import time
+import uuid
 
 # 3rd party imports
 import dateutil.parser
 from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max, Q
 from django.utils.timezone import now
 from pytz import timezone
 import redis
+from redis.exceptions import LockError
 
 # Project imports
+from libya_elections.constants import INCOMING
 from libya_elections.utils import astz
+from polling_reports.models import CenterClosedForElection, CenterOpen, PollingReport, \
+    PreliminaryVoteCount, StaffPhone
+from register.models import Office, Registration, RegistrationCenter, SubConstituency, \
+    Whitelist
 from voting.models import Election
+from .constants import COUNTRY, INACTIVE_FOR_ELECTION, OFFICE, POLLING_CENTER_CODE, \
+    POLLING_CENTER_COPY_OF, PRELIMINARY_VOTE_COUNTS, REGION
 from .encoder import DateTimeEncoder
+from .instrumentation import record_report_written, stage
 from . import data_pull_common
 from . import data_pull
 from . import data_pull_ed
 from .models import ElectionReport
-from .utils import get_datetime_from_local_date_and_time
+from .serialization import decode_report, encode_report
+from .utils import get_datetime_from_local_date_and_time, run_concurrently
 
 logger = logging.getLogger(__name__)
 
+# The VR dashboard currently reports counts of registrations prior to
+# the Constitutional Drafting Assembly registration period.  The cutoff
+# date for that was 2014-04-23.  The CDA date could be edited here for
+# testing the pre-CDA counters with test data that only has newer
+# registration dates.
+#
+# The entire feature will presumably be removed in the future.
+CDA_DATE_STR = '2014-04-23'
+CDA_DATE = datetime.strptime(CDA_DATE_STR, '%Y-%m-%d').date()
+
 report_store = redis.StrictRedis(**settings.REPORTING_REDIS_SETTINGS)
 report_store_replica = redis.StrictRedis(**settings.REPORTING_REDIS_REPLICA_SETTINGS)
 
+# Process-local LRU cache of decoded reports, mapping the Redis key of a particular
+# generation of a report to the report; see retrieve_report().
+decoded_reports = OrderedDict()
+decoded_reports_lock = threading.Lock()
+
 # Redis keys used for the various reports (prefixed by REPORTING_REDIS_KEY_PREFIX).
 # If/when these key values changed, a migration step of removing the old keys from
 # Redis may be required.
 ELECTION_DAY_BY_COUNTRY_KEY = 'election_%d_by_country'
 ELECTION_DAY_BY_OFFICE_KEY = 'election_%d_by_office'
+ELECTION_DAY_BY_REGION_KEY = 'election_%d_by_region'
 ELECTION_DAY_LOG_KEY = 'election_%d_log'
 ELECTION_DAY_METADATA_KEY = 'election_%d_metadata'
 ELECTION_DAY_OFFICES_TABLE_KEY = 'election_%d_offices'
 ELECTION_DAY_POLLING_CENTER_LOG_KEY_TEMPLATE = 'election_%d_log_polling_center_%d'
 ELECTION_DAY_POLLING_CENTERS_TABLE_KEY = 'election_%d_polling_centers'
 ELECTION_DAY_POLLING_CENTER_TABLE_KEY_TEMPLATE = 'election_%d_polling_center_%d'
+# The data for each office is also stored under keys of its own, which are all that
+# update_election_day_center() writes besides the center's own keys and the regions
+# and country: the office's row of the offices table, its aggregate, the entries of
+# its centers in the report, and its slice of the index of the polling centers table
+# (the fields of each center used to filter and sort the table; see
+# polling_centers_index()).
+ELECTION_DAY_OFFICE_TABLE_KEY_TEMPLATE = 'election_%d_office_%d'
+ELECTION_DAY_OFFICE_AGGREGATE_KEY_TEMPLATE = 'election_%d_by_office_%d'
+ELECTION_DAY_OFFICE_CENTERS_KEY_TEMPLATE = 'election_%d_office_%d_polling_centers'
+ELECTION_DAY_OFFICE_INDEX_KEY_TEMPLATE = 'election_%d_office_%d_polling_centers_index'
 ELECTION_DAY_REPORT_KEY = 'election_%d_report'
 ELECTION_DAY_HQ_REPORTS_KEY = 'election_%d_hq_reports'
+# held while writing the election day reports (see election_day_lock())
+ELECTION_DAY_LOCK_KEY = 'election_%d_lock'
+ELECTION_DAY_LOCK_TIMEOUT = 60
+# the log of changes to the status of each center (see record_center_changes())
+ELECTION_DAY_CENTER_CHANGES_KEY = 'election_%d_center_changes'
+ELECTION_DAY_CENTER_DIGESTS_KEY = 'election_%d_center_digests'
+ELECTION_DAY_CHANGE_SEQUENCE_KEY = 'election_%d_change_sequence'
 
 # _POINTS_: x, y points for plotting
 # _CR_: Cumulative Registrations THROUGH each of a series of dates
@@ -71,6 +122,27 @@ REGISTRATIONS_OFFICE_STATS_KEY = 'registrations_office_stats'
 REGISTRATIONS_REGION_STATS_KEY = 'registrations_region_stats'
 REGISTRATIONS_STATS_KEY = 'registrations_stats'
 REGISTRATIONS_SUBCONSTITUENCY_STATS_KEY = 'registrations_subconstituencies_stats'
+# the aggregates shown by the weekly and SMS pages (see calc_weekly_registrations()
+# and calc_cumulative_messages())
+REGISTRATIONS_WEEKLY_KEY = 'registrations_weekly'
+REGISTRATIONS_CUMULATIVE_MESSAGES_KEY = 'registrations_cumulative_messages'
+# hash of incoming message counts (see get_incremental_sms_counts()), the changes to
+# them since the last reconciliation with the database began, a scratch copy used
+# while reconciling, and when they were last reconciled
+SMS_COUNTERS_KEY = 'sms_counters'
+SMS_COUNTERS_CHANGES_KEY = 'sms_counters_changes'
+SMS_COUNTERS_RECONCILING_KEY = 'sms_counters_reconciling'
+SMS_COUNTERS_RECONCILED_KEY = 'sms_counters_reconciled'
+
+# Each time a set of reports is written, the reports are stored under keys for a new
+# generation (see generation_key()) and then this hash, which maps each of the report
+# keys above to its current generation, is updated in a single command.  Readers
+# resolve all the keys they need with one lookup in the hash, so they always see a
+# consistent set of reports.  Generations are unique values rather than a counter, so
+# that a counter restarting after Redis is emptied can't be mistaken for a generation
+# already cached by retrieve_report().
+REPORT_GENERATIONS_KEY = 'report_generations'
+GENERATION_KEY_TEMPLATE = '%s@%s'
 
 # common abbreviated date+time format for voter registration dashboard
 DASHBOARD_SHORT_DATETIME_FMT = '%d/%m %H:%M'
@@ -84,6 +156,38 @@ def election_day_polling_center_log_key(election, center_id):
     return ELECTION_DAY_POLLING_CENTER_LOG_KEY_TEMPLATE % (election.id, center_id)
 
 
+def election_day_office_table_key(election, office_id):
+    return ELECTION_DAY_OFFICE_TABLE_KEY_TEMPLATE % (election.id, office_id)
+
+
+def election_day_office_aggregate_key(election, office_id):
+    return ELECTION_DAY_OFFICE_AGGREGATE_KEY_TEMPLATE % (election.id, office_id)
+
+
+def election_day_office_centers_key(election, office_id):
+    return ELECTION_DAY_OFFICE_CENTERS_KEY_TEMPLATE % (election.id, office_id)
+
+
+def election_day_office_index_key(election, office_id):
+    return ELECTION_DAY_OFFICE_INDEX_KEY_TEMPLATE % (election.id, office_id)
+
+
+def election_day_office_ids(metadata):
+    """ Return the ids of the offices with polling centers, which are those in the
+    offices table of the election day report with the specified metadata, in the order
+    of the table (see generate_offices_table()). """
+    return [int(office_id)
+            for office_id in sorted(str(key) for key, centers
+                                    in metadata['centers_by_office'].items() if centers)]
+
+
+def election_day_offices_table_keys(election, metadata):
+    """ Return the keys of the rows of the offices table, in order, for the election
+    day report with the specified metadata. """
+    return [election_day_office_table_key(election, office_id)
+            for office_id in election_day_office_ids(metadata)]
+
+
 def redis_key(key):
     """ Take a raw key or list of raw keys and add the prefix. """
     if isinstance(key, str):
@@ -103,7 +207,79 @@ def empty_report_store():
         report_store.delete(*all_keys)
 
 
-def retrieve_report(key):
+def generation_key(key, generation):
+    """ Return the prefixed Redis key for the specified generation of a report. """
+    return redis_key(GENERATION_KEY_TEMPLATE % (key, generation))
+
+
+def resolve_report_keys(keys, store=None):
+    """ Return the prefixed Redis keys for the current generation of each of the reports.
+    Reports stored before generations were introduced are under their plain key. """
+    store = store or report_store_replica
+    generations = store.hmget(redis_key(REPORT_GENERATIONS_KEY), keys)
+    return [generation_key(key, generation.decode()) if generation else redis_key(key)
+            for key, generation in zip(keys, generations)]
+
+
+class ReportWriter(object):
+    """
+    Store a new generation of a set of reports, which replaces the current generation
+    of those reports all at once when commit() is called.
+
+    Writing the reports doesn't block readers, who continue to see the current
+    generation until commit().  The replaced reports then expire after
+    settings.REPORT_GENERATION_GRACE_PERIOD, in case a reader has already resolved
+    their keys.
+    """
+
+    def __init__(self):
+        self.generation = uuid.uuid4().hex
+        self.keys = []
+        self.pipe = report_store.pipeline(transaction=False)
+
+    def set(self, key, report):
+        self.keys.append(key)
+        with stage('serialize'):
+            value = encode_report(report)
+        record_report_written(len(value))
+        self.pipe.set(generation_key(key, self.generation), value)
+
+    def commit(self):
+        with stage('redis_write'):
+            self.pipe.execute()
+            replaced = resolve_report_keys(self.keys, store=report_store)
+            report_store.hmset(redis_key(REPORT_GENERATIONS_KEY),
+                               {key: self.generation for key in self.keys})
+            pipe = report_store.pipeline(transaction=False)
+            for old_key in replaced:
+                pipe.expire(old_key, settings.REPORT_GENERATION_GRACE_PERIOD)
+            pipe.execute()
+
+
+def get_cached_reports(redis_keys):
+    """Return a dictionary of the reports for Redis keys found in the process-local
+    cache."""
+    cached = {}
+    with decoded_reports_lock:
+        for key in redis_keys:
+            if key in decoded_reports:
+                decoded_reports.move_to_end(key)
+                cached[key] = decoded_reports[key]
+    return cached
+
+
+def cache_reports(reports):
+    """Add the reports in the dictionary to the process-local cache, evicting the least
+    recently used reports beyond settings.REPORT_CACHE_SIZE."""
+    with decoded_reports_lock:
+        for key, report in reports.items():
+            decoded_reports[key] = report
+            decoded_reports.move_to_end(key)
+        while len(decoded_reports) > settings.REPORT_CACHE_SIZE:
+            decoded_reports.popitem(last=False)
+
+
+def retrieve_report(key, store=None):
     """
     Retrieve a report from Redis, returning None if it hasn't already been generated.
     (It won't be available until the report generation task populates Redis.) We use
@@ -118,24 +294,55 @@ def retrieve_report(key):
 
     If a single key has been provided (as a string) and it could not be found, None will
     be returned.
+
+    The keys are resolved to the current generation of each report all at once (see
+    REPORT_GENERATIONS_KEY), so the reports returned are consistent with each other.
+    Up to settings.REPORT_CACHE_SIZE decoded reports are kept in a process-local cache,
+    so that usually only the generations have to be fetched from Redis.  The returned
+    reports are shared with other requests and must not be modified by the caller.
+
+    store: Redis connection to use instead of report_store_replica, for callers that
+    update the reports
     """
+    store = store or report_store_replica
+    keys = [key] if isinstance(key, str) else key
+    redis_keys = dict(zip(keys, resolve_report_keys(keys, store=store)))
+    reports = get_cached_reports(redis_keys.values()) if settings.REPORT_CACHE_SIZE else {}
+    keys_to_fetch = [k for k in redis_keys.values() if k not in reports]
+    if keys_to_fetch:
+        fetched = dict(zip(keys_to_fetch, store.mget(keys_to_fetch)))
+        fetched = {k: decode_report(v) for k, v in fetched.items() if v is not None}
+        if settings.REPORT_CACHE_SIZE:
+            cache_reports(fetched)
+        reports.update(fetched)
+    reports = {k: reports[redis_keys[k]] for k in keys if redis_keys[k] in reports}
+
     if isinstance(key, str):
-        data_out = report_store_replica.get(redis_key(key))
-        if data_out is not None:
+        if key in reports:
             logger.debug('returning %s from cache', key)
-            return json.loads(data_out.decode())
+            return reports[key]
         else:
             logger.warning('%s not available in the cache and won\'t be generated', key)
             return None
     else:
-        data_out = report_store_replica.mget(redis_key(key))
+        data_out = [reports.get(k) for k in key]
         if None in data_out:
             logger.warning('Keys %s not available in the cache and won\'t be generated',
                            [k for i, k in enumerate(key) if data_out[i] is None])
             # Make it easy for caller to check for failure -- 1st element always None on error
             data_out[0] = None
-            return data_out
-        return [json.loads(d.decode()) for d in data_out]
+        return data_out
+
+
+def retrieve_encoded_reports(redis_keys, store=None):
+    """ Return the stored reports for the Redis keys returned by resolve_report_keys(),
+    without decoding them, for callers which pass them on as is (see
+    serialization.iter_report_json()).  Missing reports are None.
+
+    store: Redis connection to use instead of report_store_replica
+    """
+    store = store or report_store_replica
+    return store.mget(redis_keys)
 
 
 def parse_iso_datetime(s):
@@ -220,7 +427,7 @@ def calc_by_grouping(groups, groups_key, dates, yesterday_date_str, age_grouping
     for age in age_groupings:
         group_template[age] = 0
 
-    total_stats = deepcopy(group_template)
+    total_stats = dict(group_template)
 
     stats = dict()
 
@@ -242,7 +449,7 @@ def calc_by_grouping(groups, groups_key, dates, yesterday_date_str, age_grouping
         for age in age_groupings:
             by_age.append(group[age])
 
-        group_stats = deepcopy(group_template)
+        group_stats = dict(group_template)
         group_stats['id'] = group[groups_key]
         group_stats['m'] = males
         group_stats['f'] = females
@@ -312,8 +519,8 @@ def add_stats(all_data, yesterday_date_str, rows, key):
     On input:
     all_data -- registration report
     yesterday_date_str -- "yesterday"
-    rows -- a copy of a slice of all_data (e.g., by office, or by subconstituency),
-            which will be augmented with counts and labels
+    rows -- a slice of all_data (e.g., by office, or by subconstituency); the rows
+            aren't modified, but copies augmented with counts and labels are returned
     key -- the key in all_data which yields the desired slice
     """
     dates = all_data['dates']
@@ -321,6 +528,8 @@ def add_stats(all_data, yesterday_date_str, rows, key):
 
     result = []
     for row in rows:
+        # Only top-level entries are added, so the values can be shared with the report.
+        row = dict(row)
         row['label'], row['label_translated'] = label(all_data, row[key], key)
 
         m = sum([row.get(d, [0, 0])[0] for d in dates])
@@ -358,10 +567,118 @@ def yearweek_key(d):
     return d.strftime('%Y%U')
 
 
-def add_sum_row(table, dates, dates_d, ages):
+def daily_registrations(rows, dates):
+    """ Return the [m, f] registrations on each of the dates for each of the rows of
+    a slice of the registrations table, as a list per row with None for the dates on
+    which the row has no registrations.
+
+    The reports derived from a slice each walk the dates of every row, so the dense
+    lists are built once and passed to them instead.
+    """
+    return [[row.get(d) for d in dates] for row in rows]
+
+
+def registration_weeks(dates_d):
+    """ Return the Sunday-Saturday weeks which the dates (datetime.date, in increasing
+    order) fall in, as a list of (first day, last day) pairs, oldest first, and the
+    index in that list of the week of each date.
+
+    If the last date is Thursday, March 20, the last week will be the enclosing
+    Sunday-Saturday, or March 16-22.
+    """
+    if not dates_d:
+        return [], []
+    last_day = dates_d[-1]
+    end_of_last_week = last_day + timedelta((12 - last_day.weekday()) % 7)
+    # the number of weeks before the last week
+    weeks_back = [(end_of_last_week - d).days // 7 for d in dates_d]
+    num_weeks = weeks_back[0] + 1
+    weeks = []
+    for i in reversed(range(num_weeks)):
+        end_of_week = end_of_last_week - timedelta(7 * i)
+        weeks.append((end_of_week - timedelta(6), end_of_week))
+    return weeks, [num_weeks - 1 - back for back in weeks_back]
+
+
+def calc_weekly_registrations(by_office, dates, dates_d, daily_by_office):
+    """ Return the aggregates of the registrations by office shown on the weekly
+    page: for each office and for the country (all offices), the total male and
+    female registrations, the registrations before the CDA date, the registrations
+    on each of the last seven dates, and the registrations in each week (see
+    registration_weeks()).  All the weeks are included, so that the page can show
+    any number of them.
+
+    daily_by_office: daily_registrations() of by_office
+    """
+    weeks, week_of_date = registration_weeks(dates_d)
+    num_pre_cda = sum(1 for d in dates_d if d < CDA_DATE)
+    num_last_seven = len(dates[-7:])
+
+    def totals(male, female, by_date):
+        by_week = [0] * len(weeks)
+        for i, count in enumerate(by_date):
+            by_week[week_of_date[i]] += count
+        return {'male': male,
+                'female': female,
+                'pre_cda': sum(by_date[:num_pre_cda]),
+                'last_seven': by_date[len(by_date) - num_last_seven:],
+                'weeks': by_week}
+
+    country_by_date = [0] * len(dates)
+    country_male = country_female = 0
+    offices = []
+    for row, row_daily in zip(by_office, daily_by_office):
+        male = female = 0
+        by_date = []
+        for i, counts in enumerate(row_daily):
+            if counts:
+                male += counts[0]
+                female += counts[1]
+                by_date.append(counts[0] + counts[1])
+                country_by_date[i] += counts[0] + counts[1]
+            else:
+                by_date.append(0)
+        country_male += male
+        country_female += female
+        office = totals(male, female, by_date)
+        office['office_id'] = row['office_id']
+        offices.append(office)
+
+    return {
+        'last_seven_dates': dates[-7:],
+        'weeks': [[first.strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d')]
+                  for first, last in weeks],
+        'by_office': offices,
+        'country': totals(country_male, country_female, country_by_date),
+    }
+
+
+def calc_cumulative_messages(stats, dates):
+    """ Return the cumulative number of messages through each of the dates, overall
+    and by message type, from which the SMS page can count the messages in any range
+    of dates by subtraction.
+
+    stats: the registrations stats report, with the 'sms_stats' and 'message_stats'
+    counts of messages by date
+    """
+    def cumulative(counts):
+        return list(accumulate(counts.get(d, 0) for d in dates))
+
+    return {
+        'messages': cumulative(stats['sms_stats']['messages']),
+        'by_type': {msg_type: cumulative(counts)
+                    for msg_type, counts in stats['message_stats'].items()},
+    }
+
+
+def add_sum_row(table, dates, dates_d, ages, daily=None):
     """ Calculate a row consisting of the sums by column,
     and append it to the table.
+
+    daily -- daily_registrations() for the rows of the table, if already computed
     """
+    if daily is None:
+        daily = daily_registrations(table, dates)
 
     # template for what gets added to the table
     totals = {'label': 'Total',
@@ -382,8 +699,16 @@ def add_sum_row(table, dates, dates_d, ages):
     for age in ages:
         totals[age] = 0
 
+    # add the total of each date, not the m/f breakdown
+    for row_daily in daily:
+        for d, col in zip(dates, row_daily):
+            if col is not None:
+                totals[d] += col[0] + col[1]
+
     # each column stores data slightly differently
     # handle each data type separately
+    date_set = set(dates)
+    age_set = set(ages)
     for row in table:
         for key, col in row.items():
             if key in ['total', 'yesterday']:
@@ -391,10 +716,9 @@ def add_sum_row(table, dates, dates_d, ages):
                 totals[key][0] += col[0]
                 totals[key][1] += col[1]
                 totals[key][2] += col[2]
-            elif key in dates:
-                # add the total, not the m/f breakdown
-                totals[key] += (col[0] + col[1])
-            elif key in ages:
+            elif key in date_set:
+                continue  # added above
+            elif key in age_set:
                 # add int to total
                 totals[key] += col
             elif key == 'cda':
@@ -435,11 +759,15 @@ def group_names(groups, group_id):
             return g['english_name'], g['arabic_name']
 
 
-def calc_daily_by_group(name_of_id_field, data_by_group, groups, dates, dates_d):
+def calc_daily_by_group(name_of_id_field, data_by_group, groups, dates, dates_d, daily=None):
     """
     Summarize registrations by group (either Office or Subconstituency) by day (in decreasing
     order) and by M/F, returning rows for the daily CSV-formatted report.
+
+    daily -- daily_registrations() for data_by_group, if already computed
     """
+    if daily is None:
+        daily = daily_registrations(data_by_group, dates)
     result = []
 
     # This value is overwritten when writing the CSV in the proper language context
@@ -451,11 +779,11 @@ def calc_daily_by_group(name_of_id_field, data_by_group, groups, dates, dates_d)
 
     result.append(header)
 
-    for group in data_by_group:
+    for group, group_daily in zip(data_by_group, daily):
         row = list(group_names(groups, group[name_of_id_field]))
 
-        for d in reversed(dates):  # columns are in decreasing order by day
-            m, f = group.get(d, [0, 0])
+        for col in reversed(group_daily):  # columns are in decreasing order by day
+            m, f = col or [0, 0]
             row.append(m)
             row.append(f)
 
@@ -464,7 +792,7 @@ def calc_daily_by_group(name_of_id_field, data_by_group, groups, dates, dates_d)
     return result
 
 
-def registration_points(table, key, dates, cumulative=False):
+def registration_points(table, key, dates, cumulative=False, daily=None):
     """ Build a nested list of plottable points for the registration charts.
     :param table: the main registrations table
     :param key: which "slice" of the data, such as by-country, by-office, etc.
@@ -479,34 +807,111 @@ def registration_points(table, key, dates, cumulative=False):
                                       'label' => string label or dictionary with different forms.
              When some slice other than by-country is requested, the by-country dictionary is
              also included.
+    :param daily: dictionary mapping each key to daily_registrations() for that slice, so
+           that the slices needn't be walked again for each set of points
     """
+    if daily is None:
+        daily = {}
+    if key not in daily:
+        daily[key] = daily_registrations(table['by_' + key], dates)
     rows = table['by_' + key]
     lines = []
-    for row in rows:
-        line = {
-            'label': label(table, row[key], key)[0],
-            'points': []
-        }
-
+    for row, row_daily in zip(rows, daily[key]):
+        totals = [sum(col) if col is not None else None for col in row_daily]
         if cumulative:
-            # no guarantee that each date will be represented in the row, so we can't just
-            # sum the first n values to get the cumulative sum
-            for i, d in enumerate(dates):
-                values_so_far = [sum(row[dates[j]]) for j in range(0, i + 1) if dates[j] in row]
-                line['points'].append([d, sum(values_so_far)])
-        else:
-            for d in dates:
-                if d in row:
-                    line['points'].append([d, sum(row[d])])
-                else:
-                    line['points'].append([d, None])
-        lines.append(line)
+            # no guarantee that each date will be represented in the row, so dates
+            # without registrations add nothing to the cumulative sum
+            totals = accumulate(total or 0 for total in totals)
+        lines.append({
+            'label': label(table, row[key], key)[0],
+            'points': [[d, total] for d, total in zip(dates, totals)]
+        })
 
     if key == "country":
         return lines
     else:
         # include by-country data too
-        return registration_points(table, "country", dates, cumulative=cumulative) + lines
+        return registration_points(table, "country", dates, cumulative=cumulative,
+                                   daily=daily) + lines
+
+
+def sms_counter_field(sms):
+    """
+    Return the field of the SMS counters hash which counts the message, as
+    "<local date>:<direction>:<message type>", or None if the message isn't counted
+    (the counts are those of data_pull.get_sms_counts(): undeleted incoming messages).
+    """
+    if sms.direction != INCOMING or sms.deleted:
+        return None
+    date = astz(sms.creation_date, timezone(settings.TIME_ZONE)).strftime('%Y-%m-%d')
+    return '%s:%d:%d' % (date, sms.direction, sms.msg_type)
+
+
+def update_sms_counters(deltas):
+    """
+    Add the deltas (a dict mapping SMS counters hash fields to the change in the
+    count) to the SMS counters.  Called once the changed messages are committed.
+
+    The deltas are added to the changes since the last reconciliation began too, so
+    that a reconciliation which is counting the messages in the meantime doesn't lose
+    them.
+    """
+    pipe = report_store.pipeline()
+    for field, delta in deltas.items():
+        if delta:
+            pipe.hincrby(redis_key(SMS_COUNTERS_KEY), field, delta)
+            pipe.hincrby(redis_key(SMS_COUNTERS_CHANGES_KEY), field, delta)
+    pipe.execute()
+
+
+def get_incremental_sms_counts():
+    """
+    Return the number of incoming messages, in the form returned by
+    data_pull.get_sms_counts(), from the counters in Redis which are updated as each
+    message is saved (see reporting_api.models.count_sms()).
+
+    Every REPORT_SMS_COUNTERS_RECONCILE_INTERVAL the counters are replaced with the
+    counts from the database, to correct for changes which aren't counted as they're
+    made (messages updated in bulk, etc.), or if the counters have been lost.  Changes
+    counted while the messages are being counted in the database are added to the
+    counts from the database, and the result replaces the counters in one command.
+    """
+    until = now()
+    reconciled = report_store.get(redis_key(SMS_COUNTERS_RECONCILED_KEY))
+    if reconciled is None or \
+            parse_iso_datetime(reconciled.decode()) + \
+            settings.REPORT_SMS_COUNTERS_RECONCILE_INTERVAL <= until:
+        logger.info('Reconciling the SMS counters with the database')
+        report_store.delete(redis_key(SMS_COUNTERS_CHANGES_KEY))
+        counters = {'%s:%d:%d' % key: count
+                    for key, count in data_pull.get_sms_counts(connection.cursor()).items()}
+        pipe = report_store.pipeline()
+        pipe.delete(redis_key(SMS_COUNTERS_RECONCILING_KEY))
+        if counters:
+            pipe.hmset(redis_key(SMS_COUNTERS_RECONCILING_KEY), counters)
+        pipe.execute()
+
+        def replace_counters(pipe):
+            changes = pipe.hgetall(redis_key(SMS_COUNTERS_CHANGES_KEY))
+            pipe.multi()
+            for field, delta in changes.items():
+                pipe.hincrby(redis_key(SMS_COUNTERS_RECONCILING_KEY), field, int(delta))
+            if counters or changes:
+                pipe.rename(redis_key(SMS_COUNTERS_RECONCILING_KEY), redis_key(SMS_COUNTERS_KEY))
+            else:
+                pipe.delete(redis_key(SMS_COUNTERS_KEY))
+            pipe.delete(redis_key(SMS_COUNTERS_CHANGES_KEY))
+            pipe.set(redis_key(SMS_COUNTERS_RECONCILED_KEY), until.isoformat())
+
+        # retried if any changes are counted before the counters are replaced
+        report_store.transaction(replace_counters, redis_key(SMS_COUNTERS_CHANGES_KEY))
+
+    sms_counts = {}
+    for field, count in report_store.hgetall(redis_key(SMS_COUNTERS_KEY)).items():
+        date, direction, msg_type = field.decode().split(':')
+        if int(count):
+            sms_counts[(date, int(direction), int(msg_type))] = int(count)
+    return sms_counts
 
 
 def generate_registrations_reports():
@@ -515,10 +920,25 @@ def generate_registrations_reports():
     summaries, for use by vr-dashboard.  These are saved in Redis, not returned.
     """
     logger.info('starting registration reporting')
-    polling_locations = data_pull_common.get_active_registration_locations()
+    reference_data = data_pull_common.ReferenceData()
+    polling_locations = reference_data.active_registration_locations
+    with stage('query'):
+        data_pull.refresh_registration_rollup()
+        if settings.REPORT_INCREMENTAL_SMS_COUNTS:
+            sms_counts = get_incremental_sms_counts()
+        else:
+            sms_counts = None
     # pull data from vr database
-    data_out = data_pull.pull_data(polling_locations)
+    data_out = data_pull.pull_data(polling_locations, reference_data, sms_counts)
+    with stage('aggregate'):
+        load_registrations_report(data_out)
 
+
+def load_registrations_report(data_out):
+    """
+    Compute the sub-groupings and summaries of the raw registration report and save
+    them in Redis.  data_out isn't modified.
+    """
     by_office = data_out['by_office_id']
     by_region = data_out['by_region']
     by_subconstituency = data_out['by_subconstituency_id']
@@ -543,110 +963,102 @@ def generate_registrations_reports():
     stored_stats['headline'] = {'males': region_stats['total']['m'],
                                 'females': region_stats['total']['f']}
 
-    csv_country_stats = add_stats(data_out, yesterday_date_str,
-                                  deepcopy(data_out['by_country']), 'country')
+    # the registrations on each date for each slice, shared by the reports below
+    daily = {key: daily_registrations(data_out['by_' + key], dates)
+             for key in ('country', 'region', 'office_id', 'subconstituency_id')}
+
+    csv_country_stats = add_stats(data_out, yesterday_date_str, data_out['by_country'], 'country')
 
-    csv_region_stats = add_stats(data_out, yesterday_date_str,
-                                 deepcopy(data_out['by_region']), 'region')
-    add_sum_row(csv_region_stats, dates, dates_d, data_out['demographic_breakdowns']['by_age'])
+    csv_region_stats = add_stats(data_out, yesterday_date_str, data_out['by_region'], 'region')
+    add_sum_row(csv_region_stats, dates, dates_d, data_out['demographic_breakdowns']['by_age'],
+                daily['region'])
 
-    csv_office_stats = add_stats(data_out, yesterday_date_str,
-                                 deepcopy(data_out['by_office_id']), 'office_id')
-    add_sum_row(csv_office_stats, dates, dates_d, data_out['demographic_breakdowns']['by_age'])
+    csv_office_stats = add_stats(data_out, yesterday_date_str, data_out['by_office_id'],
+                                 'office_id')
+    add_sum_row(csv_office_stats, dates, dates_d, data_out['demographic_breakdowns']['by_age'],
+                daily['office_id'])
 
     csv_subconstituency_stats = add_stats(data_out, yesterday_date_str,
-                                          deepcopy(data_out['by_subconstituency_id']),
+                                          data_out['by_subconstituency_id'],
                                           'subconstituency_id')
     add_sum_row(csv_subconstituency_stats, dates, dates_d,
-                data_out['demographic_breakdowns']['by_age'])
+                data_out['demographic_breakdowns']['by_age'], daily['subconstituency_id'])
 
     daily_by_office = calc_daily_by_group(
         'office_id', by_office, data_out['offices'],
-        dates, dates_d)
+        dates, dates_d, daily['office_id'])
     daily_by_subconstituency = calc_daily_by_group(
         'subconstituency_id', by_subconstituency, data_out['subconstituencies'],
-        dates, dates_d)
-
-    by_country_cr_points = registration_points(data_out, "country", dates, cumulative=True)
-    by_country_nr_points = registration_points(data_out, "country", dates)
-    by_office_cr_points = registration_points(data_out, "office_id", dates, cumulative=True)
-    by_office_nr_points = registration_points(data_out, "office_id", dates)
-    by_region_cr_points = registration_points(data_out, "region", dates, cumulative=True)
-    by_region_nr_points = registration_points(data_out, "region", dates)
+        dates, dates_d, daily['subconstituency_id'])
+
+    by_country_cr_points = registration_points(data_out, "country", dates, cumulative=True,
+                                               daily=daily)
+    by_country_nr_points = registration_points(data_out, "country", dates, daily=daily)
+    by_office_cr_points = registration_points(data_out, "office_id", dates, cumulative=True,
+                                              daily=daily)
+    by_office_nr_points = registration_points(data_out, "office_id", dates, daily=daily)
+    by_region_cr_points = registration_points(data_out, "region", dates, cumulative=True,
+                                              daily=daily)
+    by_region_nr_points = registration_points(data_out, "region", dates, daily=daily)
     by_subconstituency_cr_points = registration_points(data_out, "subconstituency_id", dates,
-                                                       cumulative=True)
-    by_subconstituency_nr_points = registration_points(data_out, "subconstituency_id", dates)
+                                                       cumulative=True, daily=daily)
+    by_subconstituency_nr_points = registration_points(data_out, "subconstituency_id", dates,
+                                                       daily=daily)
+
+    weekly = calc_weekly_registrations(by_office, dates, dates_d, daily['office_id'])
+    cumulative_messages = calc_cumulative_messages(stored_stats, dates)
 
     logging.info('Pipe-lining the registrations-related report stores')
     # store in pieces for use by different dashboard displays, but in a
     # pipeline
-    pipe = report_store.pipeline(transaction=False)
+    writer = ReportWriter()
     metadata = {key: data_out[key]
                 for key in ('demographic_breakdowns', 'subconstituencies',
                             'offices', 'last_updated', 'dates')}
-    pipe.set(redis_key(REGISTRATIONS_METADATA_KEY),
-             json.dumps(metadata, cls=DateTimeEncoder))
-    pipe.set(redis_key(REGISTRATIONS_STATS_KEY),
-             json.dumps(stored_stats))
-    pipe.set(redis_key(REGISTRATIONS_OFFICE_STATS_KEY),
-             json.dumps(office_stats))
-    pipe.set(redis_key(REGISTRATIONS_CSV_COUNTRY_STATS_KEY),
-             json.dumps(csv_country_stats))
-    pipe.set(redis_key(REGISTRATIONS_CSV_OFFICE_STATS_KEY),
-             json.dumps(csv_office_stats))
-    pipe.set(redis_key(REGISTRATIONS_CSV_REGION_STATS_KEY),
-             json.dumps(csv_region_stats))
-    pipe.set(redis_key(REGISTRATIONS_CSV_SUBCONSTITUENCY_STATS_KEY),
-             json.dumps(csv_subconstituency_stats))
-    pipe.set(redis_key(REGISTRATIONS_REGION_STATS_KEY),
-             json.dumps(region_stats))
-    pipe.set(redis_key(REGISTRATIONS_SUBCONSTITUENCY_STATS_KEY),
-             json.dumps(subconstituency_stats))
-    pipe.set(redis_key(REGISTRATIONS_BY_SUBCONSTITUENCY_KEY),
-             json.dumps(by_subconstituency))
-    pipe.set(redis_key(REGISTRATIONS_BY_REGION_KEY),
-             json.dumps(by_region))
-    pipe.set(redis_key(REGISTRATIONS_BY_POLLING_CENTER_KEY),
-             json.dumps(data_out['by_polling_center_code']))
-    pipe.set(redis_key(REGISTRATIONS_DAILY_BY_OFFICE_KEY),
-             json.dumps(daily_by_office))
-    pipe.set(redis_key(REGISTRATIONS_DAILY_BY_SUBCONSTITUENCY_KEY),
-             json.dumps(daily_by_subconstituency))
-    pipe.set(redis_key(REGISTRATIONS_BY_OFFICE_KEY),
-             json.dumps(by_office))
-    pipe.set(redis_key(REGISTRATIONS_BY_COUNTRY_KEY),
-             json.dumps(data_out['by_country']))
-    pipe.set(redis_key(REGISTRATIONS_BY_PHONE_KEY),
-             json.dumps(data_out['registrations_by_phone']))
-    pipe.set(redis_key(REGISTRATION_POINTS_CR_BY_COUNTRY_KEY),
-             json.dumps(by_country_cr_points))
-    pipe.set(redis_key(REGISTRATION_POINTS_NR_BY_COUNTRY_KEY),
-             json.dumps(by_country_nr_points))
-    pipe.set(redis_key(REGISTRATION_POINTS_CR_BY_OFFICE_KEY),
-             json.dumps(by_office_cr_points))
-    pipe.set(redis_key(REGISTRATION_POINTS_NR_BY_OFFICE_KEY),
-             json.dumps(by_office_nr_points))
-    pipe.set(redis_key(REGISTRATION_POINTS_CR_BY_REGION_KEY),
-             json.dumps(by_region_cr_points))
-    pipe.set(redis_key(REGISTRATION_POINTS_NR_BY_REGION_KEY),
-             json.dumps(by_region_nr_points))
-    pipe.set(redis_key(REGISTRATION_POINTS_CR_BY_SUBCONSTITUENCY_KEY),
-             json.dumps(by_subconstituency_cr_points))
-    pipe.set(redis_key(REGISTRATION_POINTS_NR_BY_SUBCONSTITUENCY_KEY),
-             json.dumps(by_subconstituency_nr_points))
-    pipe.execute()
+    writer.set(REGISTRATIONS_METADATA_KEY, metadata)
+    writer.set(REGISTRATIONS_STATS_KEY, stored_stats)
+    writer.set(REGISTRATIONS_OFFICE_STATS_KEY, office_stats)
+    writer.set(REGISTRATIONS_CSV_COUNTRY_STATS_KEY, csv_country_stats)
+    writer.set(REGISTRATIONS_CSV_OFFICE_STATS_KEY, csv_office_stats)
+    writer.set(REGISTRATIONS_CSV_REGION_STATS_KEY, csv_region_stats)
+    writer.set(REGISTRATIONS_CSV_SUBCONSTITUENCY_STATS_KEY, csv_subconstituency_stats)
+    writer.set(REGISTRATIONS_REGION_STATS_KEY, region_stats)
+    writer.set(REGISTRATIONS_SUBCONSTITUENCY_STATS_KEY, subconstituency_stats)
+    writer.set(REGISTRATIONS_BY_SUBCONSTITUENCY_KEY, by_subconstituency)
+    writer.set(REGISTRATIONS_BY_REGION_KEY, by_region)
+    writer.set(REGISTRATIONS_BY_POLLING_CENTER_KEY, data_out['by_polling_center_code'])
+    writer.set(REGISTRATIONS_DAILY_BY_OFFICE_KEY, daily_by_office)
+    writer.set(REGISTRATIONS_DAILY_BY_SUBCONSTITUENCY_KEY, daily_by_subconstituency)
+    writer.set(REGISTRATIONS_BY_OFFICE_KEY, by_office)
+    writer.set(REGISTRATIONS_BY_COUNTRY_KEY, data_out['by_country'])
+    writer.set(REGISTRATIONS_BY_PHONE_KEY, data_out['registrations_by_phone'])
+    writer.set(REGISTRATION_POINTS_CR_BY_COUNTRY_KEY, by_country_cr_points)
+    writer.set(REGISTRATION_POINTS_NR_BY_COUNTRY_KEY, by_country_nr_points)
+    writer.set(REGISTRATION_POINTS_CR_BY_OFFICE_KEY, by_office_cr_points)
+    writer.set(REGISTRATION_POINTS_NR_BY_OFFICE_KEY, by_office_nr_points)
+    writer.set(REGISTRATION_POINTS_CR_BY_REGION_KEY, by_region_cr_points)
+    writer.set(REGISTRATION_POINTS_NR_BY_REGION_KEY, by_region_nr_points)
+    writer.set(REGISTRATION_POINTS_CR_BY_SUBCONSTITUENCY_KEY, by_subconstituency_cr_points)
+    writer.set(REGISTRATION_POINTS_NR_BY_SUBCONSTITUENCY_KEY, by_subconstituency_nr_points)
+    writer.set(REGISTRATIONS_WEEKLY_KEY, weekly)
+    writer.set(REGISTRATIONS_CUMULATIVE_MESSAGES_KEY, cumulative_messages)
+    writer.commit()
 
 
 def generate_offices_table(offices, by_office, by_polling_center,
                            election_day, day_after_election_day):
     """ Pre-compute key data needed for generating election day
-     office reports.
+     office reports.  The rows of by_office aren't modified; the table rows are
+     copies with the additional data.
     """
     offices_by_key = {str(office['code']): office for office in offices}
+    centers_by_office_key = defaultdict(list)
+    for center in by_polling_center.values():
+        centers_by_office_key[str(center['office_id'])].append(center)
     rows = []
 
     for key in sorted([key for key in by_office.keys()]):
-        row = by_office[key]
+        row = dict(by_office[key])
         key = str(key)
 
         # copy name from the offices hash array
@@ -673,8 +1085,7 @@ def generate_offices_table(offices, by_office, by_polling_center,
         row['votes_reported_4'] = 0
         reported_4 = 0
         # Which polling centers are in this office?
-        centers = {k: v for k, v in by_polling_center.items() if str(v['office_id']) == key}
-        for center_id, center in centers.items():
+        for center in centers_by_office_key[key]:
             if day_after_election_day in center and '4' in center[day_after_election_day]:
                 # found a period 4 report on EDAY+1. Sum the votes and increment the report count
                 row['votes_reported_4'] += center[day_after_election_day]['4']
@@ -705,50 +1116,69 @@ def get_effective_reminder_time():
     return now()
 
 
+def get_reminder_times(election_day_dt):
+    """ Return the times on election day of the reminders for each reporting period. """
+    reminder_strings = ['11:30', '15:30', '19:45', '21:30']
+    return [election_day_dt.replace(hour=int(s[0:2]), minute=int(s[3:5]))
+            for s in reminder_strings]
+
+
 def update_polling_centers_table(all_dates, all_centers, election, election_day_dt, election_day,
                                  day_after_election_day):
     """ Amend the "by_polling_center" slice of the election day report with additional
-    data used to generate the election day views.
+    data used to generate the election day views.  Each center in all_centers is
+    replaced by an amended copy, so the caller only needs to copy the slice itself
+    to leave the report as it was.
     """
     current_time = get_effective_reminder_time()
-    reminder_strings = ['11:30', '15:30', '19:45', '21:30']
-    reminders = [election_day_dt.replace(hour=int(s[0:2]), minute=int(s[3:5]))
-                 for s in reminder_strings]
     period_keys = ['1', '2', '3', '4']
-
-    for center_id, center in all_centers.items():
+    # The status of a period which a center hasn't reported for depends only on
+    # whether the reminder for the period has been sent yet.
+    not_reported_statuses = [
+        'not_due' if current_time <= reminder else 'has_not_reported'
+        for reminder in get_reminder_times(election_day_dt)
+    ]
+    # Each center's most recent open and report are the first ones found going
+    # through the dates from latest to earliest.
+    dates_latest_first = sorted(all_dates, reverse=True)
+    # The start of the election as the local date and time strings used in the
+    # report, so that open times can be compared without parsing them
+    election_start = astz(election.start_time, timezone(settings.TIME_ZONE))
+    election_start_date_and_time = (election_start.strftime('%Y-%m-%d'),
+                                    election_start.time().isoformat())
+
+    for center_id, center in list(all_centers.items()):
+        center = all_centers[center_id] = dict(center)
         center['closed'] = ('has_not_reported', 'No')
 
         # find most recent open, report time
-        dates_opened = sorted([d for d in all_dates if d in center and 'opened' in center[d]])
-        dates_reported = sorted([d for d in all_dates if d in center and 'reported' in center[d]])
+        center_dates = [(d, center[d]) for d in dates_latest_first if d in center]
+        date_opened = next((d for d, data in center_dates if 'opened' in data), None)
+        date_reported = next((d for d, data in center_dates if 'reported' in data), None)
 
-        if dates_opened:
+        if date_opened:
             # Validate that the open time is not too early.  A CenterOpen "should" be
             # created only inside the boundaries of an Election, but there may be some
             # historical data which is outside of the currently-allowable range.
             # (Additionally, the end-to-end dashboard test validates this behavior.)
             #
             # What about open times which are too late?  TBD
-            this_open_time = get_datetime_from_local_date_and_time(
-                dates_opened[-1],
-                center[dates_opened[-1]]['opened']
-            )
-            if this_open_time < election.start_time:
+            time_opened = center[date_opened]['opened']
+            if (date_opened, time_opened) < election_start_date_and_time:
+                this_open_time = get_datetime_from_local_date_and_time(date_opened, time_opened)
                 logger.error('Center %s has open time %s prior to election start time %s',
                              center_id, this_open_time, election.start_time)
             else:
-                center['last_opened'] = printable_date_and_time(dates_opened[-1],
-                                                                center[dates_opened[-1]]['opened'])
+                center['last_opened'] = printable_date_and_time(date_opened, time_opened)
 
-        if dates_reported:
+        if date_reported:
             center['last_reported'] = \
-                printable_date_and_time(dates_reported[-1],
-                                        center[dates_reported[-1]]['reported'])
+                printable_date_and_time(date_reported, center[date_reported]['reported'])
 
         # check if center has data for election day
         if election_day in center:
-            on_election_day = center[election_day]
+            # this is modified too, so it is copied as well
+            on_election_day = center[election_day] = dict(center[election_day])
             if 'opened' in on_election_day:
                 # drop seconds and microseconds
                 center['opened'] = on_election_day['opened'] = \
@@ -756,15 +1186,12 @@ def update_polling_centers_table(all_dates, all_centers, election, election_day_
                 center['opened_today'] = on_election_day['opened_today'] = \
                     election_day_dt.strftime("%d/%m") + ' ' + on_election_day['opened']
 
-            for i, period in enumerate(period_keys):
-                if period in center[election_day]:
+            for period, not_reported_status in zip(period_keys, not_reported_statuses):
+                if period in on_election_day:
                     center['reported_period_' + period] = 'has_reported'
                     center['votes_reported_' + period] = on_election_day[period]
-                elif current_time <= reminders[i]:
-                    # reminder hasn't been sent yet
-                    center['reported_period_' + period] = 'not_due'
                 else:
-                    center['reported_period_' + period] = 'has_not_reported'
+                    center['reported_period_' + period] = not_reported_status
 
             if '4' in on_election_day:
                 center['closed'] = ('has_reported', 'Yes')
@@ -788,23 +1215,192 @@ def update_polling_centers_table(all_dates, all_centers, election, election_day_
 def generate_centers_by_office(offices, by_polling_center):
     """ Generate table which provides a list of polling centers for each office.
     """
+    centers_by_office_id = defaultdict(list)
+    for center in by_polling_center.values():
+        centers_by_office_id[center['office_id']].append(center['polling_center_code'])
     table = defaultdict(list)
     for office in offices:
         office_id = office['code']
-        centers = [by_polling_center[center_id]['polling_center_code']
-                   for center_id in sorted(by_polling_center.keys())
-                   if by_polling_center[center_id]['office_id'] == office_id]
-        table[office_id] = sorted(centers)
+        table[office_id] = sorted(centers_by_office_id[office_id])
     return table
 
 
-def load_election_day_report(election, data_out):
-    election_day_dt = election.polling_start_time
-    election_day_dt = astz(election_day_dt, timezone(settings.TIME_ZONE))
+def get_election_days(election):
+    """ Return the local start of polling for the election, along with the election
+    day and the day after, as they're represented in the election day report. """
+    election_day_dt = get_election_day_dt(election)
     election_day = election_day_dt.strftime('%Y-%m-%d')
 
     day_after_election_day_dt = election_day_dt + timedelta(days=1)
     day_after_election_day = day_after_election_day_dt.strftime('%Y-%m-%d')
+    return election_day_dt, election_day, day_after_election_day
+
+
+@contextmanager
+def election_day_lock(election):
+    """ Hold the lock for writing the election day reports for the election within the
+    with block, so that updates for a single center aren't lost.
+
+    The lock expires after ELECTION_DAY_LOCK_TIMEOUT seconds, so that it isn't held
+    forever by a worker which dies.  If it expires before the block ends, another
+    writer may have taken it, and the expiry is logged rather than raised; the reports
+    have been written by then, and are brought up to date again by the next run of
+    generate_election_day_reports_and_logs().
+    """
+    lock = report_store.lock(redis_key(ELECTION_DAY_LOCK_KEY % election.id),
+                             timeout=ELECTION_DAY_LOCK_TIMEOUT)
+    lock.acquire()
+    try:
+        yield
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning('Election day lock for election %s expired before it was released',
+                           election.id)
+
+
+def center_digest(center):
+    """ Return a digest of a row of the polling centers table, which changes whenever
+    anything shown for the center does. """
+    return hashlib.sha1(json.dumps(through_json(center), sort_keys=True).encode()).hexdigest()
+
+
+def record_center_changes(election, centers):
+    """
+    Record in the change log for the election the centers (rows of the polling
+    centers table just stored) which have changed since they were last recorded, so
+    that clients can retrieve just those (see retrieve_center_changes()).
+
+    The log is a sorted set with each center id scored by the sequence number of
+    its last change, so it holds at most one entry per center.  The sequence starts
+    from the current time in milliseconds rather than 0, so that it keeps increasing
+    if the report store is emptied.  Call this with election_day_lock() held.
+    """
+    digests_key = redis_key(ELECTION_DAY_CENTER_DIGESTS_KEY % election.id)
+    digests = {str(center[POLLING_CENTER_CODE]): center_digest(center) for center in centers}
+    old_digests = report_store.hmget(digests_key, list(digests.keys()))
+    changed = {center_id: digest
+               for (center_id, digest), old_digest in zip(digests.items(), old_digests)
+               if old_digest is None or old_digest.decode() != digest}
+    if not changed:
+        return
+    sequence_key = redis_key(ELECTION_DAY_CHANGE_SEQUENCE_KEY % election.id)
+    report_store.setnx(sequence_key, int(time.time() * 1000))
+    sequence = report_store.incr(sequence_key)
+    pipe = report_store.pipeline()
+    pipe.hmset(digests_key, changed)
+    pipe.zadd(redis_key(ELECTION_DAY_CENTER_CHANGES_KEY % election.id),
+              {center_id: sequence for center_id in changed})
+    pipe.execute()
+
+
+def retrieve_center_changes(election, since=0):
+    """
+    Return the current sequence number of the change log for the election, along
+    with the rows of the polling centers table for the centers which changed after
+    the sequence number since (all of them if since is 0), or (None, None) if the
+    report hasn't been generated.  Clients pass the returned sequence number as since
+    next time.
+    """
+    sequence = report_store_replica.get(
+        redis_key(ELECTION_DAY_CHANGE_SEQUENCE_KEY % election.id))
+    if sequence is None:
+        return None, None
+    sequence = int(sequence)
+    # The changes are recorded after the rows are stored, so the rows retrieved
+    # next are at least as new as the changes up to sequence.
+    changed = report_store_replica.zrangebyscore(
+        redis_key(ELECTION_DAY_CENTER_CHANGES_KEY % election.id), '(%d' % since, sequence)
+    return sequence, retrieve_polling_center_rows(
+        election, sorted(int(center_id) for center_id in changed))
+
+
+def retrieve_polling_center_rows(election, center_ids):
+    """ Return the rows of the polling centers table for the centers with the specified
+    ids, in the same order, from the keys of the individual centers (which are kept up
+    to date by update_election_day_center(), unlike the whole table).  Centers which
+    aren't stored are omitted. """
+    if not center_ids:
+        return []
+    # The rows aren't kept in the process-local cache; the centers requested are
+    # likely to be different each time, and the rows would evict the reports which
+    # are shared.
+    redis_keys = resolve_report_keys([election_day_polling_center_table_key(election,
+                                                                            center_id)
+                                      for center_id in center_ids])
+    return [decode_report(value) for value in retrieve_encoded_reports(redis_keys)
+            if value is not None]
+
+
+def polling_centers_index_row(center):
+    """ Return the entry of the polling centers index for a row of the polling
+    centers table. """
+    return {
+        'code': center[POLLING_CENTER_CODE],
+        'office_id': center['office_id'],
+        # copy centers have no registrations of their own
+        'registrations': (None if POLLING_CENTER_COPY_OF in center
+                          else center['registration_count']),
+        'opened': center.get('opened'),
+        'reported': [period for period in ('1', '2', '3', '4')
+                     if center.get('reported_period_' + period) == 'has_reported'],
+    }
+
+
+def polling_centers_index(centers):
+    """ Return the index of the polling centers (rows of the polling centers table),
+    with just the fields needed to filter and sort them (see
+    retrieve_polling_centers_page()), in the same order.  It is a small fraction of
+    the size of the rows. """
+    return [polling_centers_index_row(center) for center in centers]
+
+
+def retrieve_polling_centers_page(election, office_id=None, period=None, reported=None,
+                                  sort='code', descending=False, offset=0, limit=None):
+    """
+    Return the number of centers in the polling centers table of the election which
+    match the filters, along with the rows of the table for the matching centers from
+    offset, up to limit of them, in order of the sort field of the index (code,
+    office_id, registrations or opened).  Return (None, None) if the report hasn't been
+    generated.
+
+    Only the index of each office and the rows returned are retrieved from Redis,
+    rather than the whole table.
+
+    office_id: only centers of the office
+    period: with reported, only centers which have (reported is True) or haven't
+    (reported is False) reported for the voting period ('1' to '4')
+    """
+    metadata = retrieve_report(election_key(ELECTION_DAY_METADATA_KEY, election))
+    if metadata is None:
+        return None, None
+    office_ids = election_day_office_ids(metadata)
+    if office_id is not None:
+        office_ids = [office_id] if office_id in office_ids else []
+    if not office_ids:
+        return 0, []
+    office_indexes = retrieve_report([election_day_office_index_key(election, office_id)
+                                      for office_id in office_ids])
+    if office_indexes[0] is None:
+        return None, None
+    matching = sorted((row for office_index in office_indexes for row in office_index),
+                      key=lambda row: row['code'])
+    if period is not None and reported is not None:
+        matching = [row for row in matching if (period in row['reported']) == reported]
+    if sort != 'code' or descending:
+        # None (copy centers' registrations, centers not opened) sorts first
+        matching = sorted(matching, key=lambda row: (row[sort] is not None, row[sort] or 0,
+                                                     row['code']),
+                          reverse=descending)
+    end = None if limit is None else offset + limit
+    page = matching[offset:end]
+    return len(matching), retrieve_polling_center_rows(election,
+                                                       [row['code'] for row in page])
+
+
+def load_election_day_report(election, data_out):
+    election_day_dt, election_day, day_after_election_day = get_election_days(election)
 
     polling_centers_by_office = generate_centers_by_office(data_out['offices'],
                                                            data_out['by_polling_center'])
@@ -816,73 +1412,98 @@ def load_election_day_report(election, data_out):
         'dates': data_out['dates'],
         'last_updated': data_out['last_updated']
     }
-    offices_table = generate_offices_table(data_out['offices'], deepcopy(data_out['by_office']),
+    offices_table = generate_offices_table(data_out['offices'], data_out['by_office'],
                                            data_out['by_polling_center'],
                                            election_day, day_after_election_day)
-    polling_centers_table = deepcopy(data_out['by_polling_center'])
+    polling_centers_table = dict(data_out['by_polling_center'])
     update_polling_centers_table(data_out['dates'], polling_centers_table, election,
                                  election_day_dt, election_day, day_after_election_day)
 
     centers = [polling_centers_table[key] for key in sorted(polling_centers_table.keys())]
-    pipe = report_store.pipeline(transaction=False)
-    pipe.set(redis_key(election_key(ELECTION_DAY_REPORT_KEY, election)), json.dumps(data_out))
-    pipe.set(redis_key(election_key(ELECTION_DAY_BY_COUNTRY_KEY, election)),
-             json.dumps(data_out['by_country']))
-    pipe.set(redis_key(election_key(ELECTION_DAY_BY_OFFICE_KEY, election)),
-             json.dumps(data_out['by_office']))
-    pipe.set(redis_key(election_key(ELECTION_DAY_OFFICES_TABLE_KEY, election)),
-             json.dumps(offices_table))
-    pipe.set(redis_key(election_key(ELECTION_DAY_POLLING_CENTERS_TABLE_KEY, election)),
-             json.dumps(centers))
+    centers_by_office = defaultdict(list)
     for center in centers:
-        pipe.set(redis_key(election_day_polling_center_table_key(
-            election, center['polling_center_code'])),
-            json.dumps(center))
-    pipe.set(redis_key(election_key(ELECTION_DAY_METADATA_KEY, election)),
-             json.dumps(metadata, cls=DateTimeEncoder))
-    pipe.execute()
+        centers_by_office[center[OFFICE]].append(center)
+
+    # The reports are encoded before the lock is taken, so that it is only held while
+    # they're stored.
+    writer = ReportWriter()
+    writer.set(election_key(ELECTION_DAY_REPORT_KEY, election), data_out)
+    writer.set(election_key(ELECTION_DAY_BY_COUNTRY_KEY, election), data_out['by_country'])
+    writer.set(election_key(ELECTION_DAY_BY_REGION_KEY, election), data_out['by_region'])
+    writer.set(election_key(ELECTION_DAY_BY_OFFICE_KEY, election), data_out['by_office'])
+    writer.set(election_key(ELECTION_DAY_OFFICES_TABLE_KEY, election), offices_table)
+    writer.set(election_key(ELECTION_DAY_POLLING_CENTERS_TABLE_KEY, election), centers)
+    for office_row in offices_table:
+        office_id = office_row[OFFICE]
+        office_centers = centers_by_office[office_id]
+        writer.set(election_day_office_table_key(election, office_id), office_row)
+        writer.set(election_day_office_aggregate_key(election, office_id),
+                   data_out['by_office'][str(office_id)])
+        writer.set(election_day_office_centers_key(election, office_id),
+                   {str(center[POLLING_CENTER_CODE]):
+                    data_out['by_polling_center'][str(center[POLLING_CENTER_CODE])]
+                    for center in office_centers})
+        writer.set(election_day_office_index_key(election, office_id),
+                   polling_centers_index(office_centers))
+    for center in centers:
+        writer.set(election_day_polling_center_table_key(election,
+                                                         center['polling_center_code']),
+                   center)
+    writer.set(election_key(ELECTION_DAY_METADATA_KEY, election), metadata)
+    with election_day_lock(election):
+        writer.commit()
+        record_center_changes(election, centers)
 
 
-def generate_and_load_election_day_report(election):
+def generate_and_load_election_day_report(election, reference_data=None):
     """
     Generates raw election-day report in Python dict form, for use by vr-dashboard.
     These are saved in Redis and returned.
+
+    reference_data: data_pull_common.ReferenceData to share with other reports
+    generated in the same run
     """
     logger.info('starting election day reporting for election %s', election)
+    if reference_data is None:
+        reference_data = data_pull_common.ReferenceData()
     # Centers ("locations") which aren't active for this election
     # will be represented in the report, though any vote reports from
     # them will be ignored.
-    polling_locations = data_pull_common.get_all_polling_locations()
-    data_out = data_pull_ed.pull_data(polling_locations, election)
+    polling_locations = reference_data.all_polling_locations
+    data_out = data_pull_ed.pull_data(polling_locations, election, reference_data)
     # Pre-computing data based on the election day report needs to work the same
     # whether we just created the report or we loaded an old one (in JSON format)
     # from the database.  Pull the new dictionary through JSON to convert any
     # int keys to strings and otherwise ensure that load_election_day_report()
-    # also handles an old report from the db.
-    data_out = json.loads(json.dumps(data_out))
-    load_election_day_report(election, data_out)
+    # also handles an old report from the db.  (The round trip runs in C, and is
+    # faster than converting the keys in Python; see benchmark_report_loading.)
+    with stage('aggregate'):
+        data_out = json.loads(json.dumps(data_out))
+        load_election_day_report(election, data_out)
     return data_out
 
 
 def load_election_day_hq_reports(election, hq_reports):
-    report_store.set(redis_key(election_key(ELECTION_DAY_HQ_REPORTS_KEY, election)),
-                     json.dumps(hq_reports))
+    writer = ReportWriter()
+    writer.set(election_key(ELECTION_DAY_HQ_REPORTS_KEY, election), hq_reports)
+    writer.commit()
 
 
 def generate_and_load_election_day_hq_reports(election):
-    hq_reports = data_pull_ed.generate_election_day_hq_reports(election)
+    with stage('query'):
+        hq_reports = data_pull_ed.generate_election_day_hq_reports(election)
     load_election_day_hq_reports(election, hq_reports)
     return hq_reports
 
 
 def load_election_day_log(election, data_out):
-    pipe = report_store.pipeline(transaction=False)
-    pipe.set(redis_key(election_key(ELECTION_DAY_LOG_KEY, election)),
-             json.dumps(data_out, cls=DateTimeEncoder))
+    writer = ReportWriter()
+    writer.set(election_key(ELECTION_DAY_LOG_KEY, election), data_out)
     for center_id in data_out.keys():
-        pipe.set(redis_key(election_day_polling_center_log_key(election, int(center_id))),
-                 json.dumps(data_out[center_id], cls=DateTimeEncoder))
-    pipe.execute()
+        writer.set(election_day_polling_center_log_key(election, int(center_id)),
+                   data_out[center_id])
+    with election_day_lock(election):
+        writer.commit()
 
 
 def generate_and_load_election_day_log(election):
@@ -891,11 +1512,147 @@ def generate_and_load_election_day_log(election):
     These are saved in Redis and returned.
     """
     logger.info('generating election day log for election %s', election)
-    data_out = data_pull_ed.message_log(election)
+    with stage('query'):
+        data_out = data_pull_ed.message_log(election)
     load_election_day_log(election, data_out)
     return data_out
 
 
+def through_json(data):
+    """ Convert data the way storing it in Redis (or ElectionReport) does. """
+    return json.loads(json.dumps(data, cls=DateTimeEncoder))
+
+
+def from_json_for_aggregation(report_dict):
+    """ Prepare a center, office, or region from an election day report loaded from
+    JSON for aggregation with data_pull_ed, which expects the voting period keys in
+    the data for each date to be ints, as when the report is generated.  Preliminary
+    vote counts are added to the aggregates afterwards, so they're omitted.
+    """
+    return {
+        key: ({int(k) if k.isdigit() else k: v for k, v in value.items()}
+              if isinstance(value, dict) else value)
+        for key, value in report_dict.items()
+        if key != PRELIMINARY_VOTE_COUNTS
+    }
+
+
+def reaggregate(group_key, aggregate_func, members, stored_groups):
+    """ Aggregate the members of a single group (office, region, or country) of the
+    election day report, keeping the preliminary vote counts stored for the group, and
+    return the group converted through JSON. """
+    [group] = aggregate_func(members).values()
+    stored_group = stored_groups[str(group_key)]
+    if PRELIMINARY_VOTE_COUNTS in stored_group:
+        group[PRELIMINARY_VOTE_COUNTS] = stored_group[PRELIMINARY_VOTE_COUNTS]
+    return through_json(group)
+
+
+def update_election_day_center(election, center_id):
+    """
+    Update the election day reports in Redis after the polling center with the
+    specified center id opens or reports, without regenerating them for every center.
+    The center's data is pulled again, and only its office, region, and country are
+    aggregated again, from the other centers of the office and the stored offices and
+    regions.
+
+    Only the keys for the center, its office, the regions, and the country are written
+    (see ELECTION_DAY_OFFICE_TABLE_KEY_TEMPLATE), so the work done doesn't grow with
+    the size of the report.  The report itself, the whole offices and polling centers
+    tables, the log, the metadata, the HQ reports, and ElectionReport aren't updated;
+    they're brought up to date by the next run of
+    generate_election_day_reports_and_logs(), which also generates the reports if they
+    haven't been generated yet.
+    """
+    center_key = str(center_id)
+    by_region_key = election_key(ELECTION_DAY_BY_REGION_KEY, election)
+    by_country_key = election_key(ELECTION_DAY_BY_COUNTRY_KEY, election)
+
+    with election_day_lock(election):
+        metadata = retrieve_report(election_key(ELECTION_DAY_METADATA_KEY, election),
+                                   store=report_store)
+        if metadata is None:
+            # not generated yet
+            return
+        office_ids = election_day_office_ids(metadata)
+        office_id = next((other_office_id for other_office_id in office_ids
+                          if center_id in metadata['centers_by_office'][str(other_office_id)]),
+                         None)
+        if office_id is None:
+            # not a polling center
+            return
+        office_key = str(office_id)
+        office_centers_key = election_day_office_centers_key(election, office_id)
+        office_index_key = election_day_office_index_key(election, office_id)
+        aggregate_keys = [election_day_office_aggregate_key(election, other_office_id)
+                          for other_office_id in office_ids]
+        # The stored reports are shared with the process-local cache, so only copies
+        # of them are modified.
+        reports = retrieve_report([office_centers_key, office_index_key, by_region_key,
+                                   by_country_key] + aggregate_keys,
+                                  store=report_store)
+        if reports[0] is None:
+            # stored before the keys for each office were added
+            return
+        office_centers, office_index, by_region, by_country = reports[:4]
+        by_office = {str(other_office_id): office
+                     for other_office_id, office in zip(office_ids, reports[4:])}
+
+        # the data by date is the only dict in the center's entry
+        center = {key: value for key, value in office_centers[center_key].items()
+                  if not isinstance(value, dict) and key != INACTIVE_FOR_ELECTION}
+        center, center_dates = data_pull_ed.pull_center_data(center, election)
+        center_log = data_pull_ed.center_message_log(election, center_id)
+
+        office_centers = dict(office_centers)
+        office_centers[center_key] = through_json(center)
+        region, country = center[REGION], center[COUNTRY]
+        by_office[office_key] = reaggregate(
+            office_id, data_pull_ed.aggregate_offices,
+            [center if key == center_key else from_json_for_aggregation(other)
+             for key, other in office_centers.items()],
+            by_office)
+        by_region = dict(by_region)
+        by_region[region] = reaggregate(
+            region, data_pull_ed.aggregate_regions,
+            [from_json_for_aggregation(office) for office in by_office.values()
+             if office[REGION] == region],
+            by_region)
+        by_country = dict(by_country)
+        by_country[country] = reaggregate(
+            country, data_pull_ed.aggregate_country,
+            [from_json_for_aggregation(region_dict) for region_dict in by_region.values()
+             if region_dict[COUNTRY] == country],
+            by_country)
+
+        election_day_dt, election_day, day_after_election_day = get_election_days(election)
+        [office_row] = generate_offices_table(metadata['offices'],
+                                              {office_key: by_office[office_key]},
+                                              office_centers,
+                                              election_day, day_after_election_day)
+        center_table = {center_key: office_centers[center_key]}
+        update_polling_centers_table(center_dates, center_table, election,
+                                     election_day_dt, election_day, day_after_election_day)
+        center_row = center_table[center_key]
+        index_row = polling_centers_index_row(center_row)
+        office_index = [index_row if row['code'] == center_id else row
+                        for row in office_index]
+
+        writer = ReportWriter()
+        writer.set(election_day_polling_center_table_key(election, center_id), center_row)
+        if center_log:
+            writer.set(election_day_polling_center_log_key(election, center_id), center_log)
+        writer.set(office_centers_key, office_centers)
+        writer.set(office_index_key, office_index)
+        writer.set(election_day_office_aggregate_key(election, office_id),
+                   by_office[office_key])
+        writer.set(election_day_office_table_key(election, office_id), office_row)
+        writer.set(by_region_key, by_region)
+        writer.set(by_country_key, by_country)
+        writer.commit()
+        record_center_changes(election, [center_row])
+
+
 def get_election_data_from_db(election):
     """
     :param election: An Election, represented in ElectionReport, for which the data
@@ -922,32 +1679,125 @@ def load_election_data(election):
     load_election_day_log(election, log)
 
 
+def get_election_day_dt(election):
+    return astz(election.polling_start_time, timezone(settings.TIME_ZONE))
+
+
+def election_input_fingerprint(election):
+    """
+    Return a digest of everything that the election day report, HQ reports, and log
+    for the election are generated from (including which reminders have been sent,
+    since centers which haven't reported are shown differently before and after the
+    reminder), so that they need not be regenerated while it stays the same.
+
+    Deleted rows are counted too, since they drop out of the reports, and all rows
+    are counted in case any are removed from the database.  Besides the election's
+    own data, that includes the office and subconstituency names, as well as the
+    registrations (counted for each center) and the whitelist (which flags the center
+    phones).  Those last two are too big to count each time, so only their latest
+    (indexed) modification_date is used; every change to them, including soft
+    deletion, updates it.
+    """
+    election_rows = [
+        model.objects.unfiltered().filter(election=election)
+        for model in (CenterOpen, PollingReport, PreliminaryVoteCount, CenterClosedForElection)
+    ]
+    other_rows = [
+        StaffPhone.objects.unfiltered(),
+        RegistrationCenter.objects.unfiltered(),
+        Office.objects.unfiltered(),
+        SubConstituency.objects.unfiltered(),
+    ]
+    inputs = [
+        rows.aggregate(Max('id'), Max('modification_date'), Count('id'),
+                       deleted=Count('id', filter=Q(deleted=True)))
+        for rows in election_rows + other_rows
+    ]
+    inputs.extend(
+        rows.aggregate(Max('modification_date'))
+        for rows in (Registration.objects.unfiltered(), Whitelist.objects.unfiltered())
+    )
+    current_time = get_effective_reminder_time()
+    inputs.append({
+        'election': election.modification_date,
+        'reminders_sent': sum(1 for reminder in get_reminder_times(get_election_day_dt(election))
+                              if current_time > reminder),
+    })
+    return hashlib.sha1(json.dumps(inputs, cls=DateTimeEncoder, sort_keys=True).encode()) \
+        .hexdigest()
+
+
+def election_day_report_loaded(election):
+    """ Return whether the election day reports for the election are in Redis.  The
+    regions are checked too, since they were added along with the keys for each office,
+    so that reports stored before then are loaded again. """
+    keys = resolve_report_keys([election_key(ELECTION_DAY_METADATA_KEY, election),
+                                election_key(ELECTION_DAY_BY_REGION_KEY, election)],
+                               store=report_store)
+    return report_store.exists(*keys) == len(keys)
+
+
+def refresh_election_day_timestamp(election):
+    """
+    Mark the election day reports for the election as up to date, after determining
+    that nothing they're generated from has changed.
+    """
+    metadata = retrieve_report(election_key(ELECTION_DAY_METADATA_KEY, election),
+                               store=report_store)
+    metadata = dict(metadata, last_updated=datetime.now().isoformat())
+    writer = ReportWriter()
+    writer.set(election_key(ELECTION_DAY_METADATA_KEY, election), metadata)
+    writer.commit()
+
+
 def generate_election_day_reports_and_logs(rebuild_all=False):
     """
     :param rebuild_all: Rebuild reports even for old elections for which a report
     is in the database.
     """
-    for election in Election.objects.all():
-        # See if data for this election has been saved already.  If it has, and data
-        # for the election is not still changing, then we just have to ensure that it
-        # has been loaded into Redis since the last flush of Redis.
-        existing = ElectionReport.objects.filter(election=election)
-        if existing.count() == 1:  # already saved
-            if not rebuild_all:  # okay to use existing report for old election
-                if election.work_end_time < now():  # data not still changing
-                    if not report_store.get(election_key(ELECTION_DAY_METADATA_KEY, election)):
-                        load_election_data(election)
-                    continue
-        log = generate_and_load_election_day_log(election)
-        report = generate_and_load_election_day_report(election)
-        hq_reports = generate_and_load_election_day_hq_reports(election)
-        if existing.count() == 1:
-            record = existing[0]
-        else:
-            record = ElectionReport(election=election)
+    reference_data = data_pull_common.ReferenceData()
+    # The elections are independent, so their reports can be generated concurrently;
+    # load the reference data first so that it isn't queried from more than one thread.
+    reference_data.load()
+    run_concurrently([
+        partial(generate_election_day_report_and_log, election, reference_data, rebuild_all)
+        for election in Election.objects.all()
+    ])
+
 
-        record.message_log = json.dumps(log, cls=DateTimeEncoder)
-        record.report = json.dumps(report)
-        record.hq_reports = json.dumps(hq_reports)
-        record.full_clean()
-        record.save()
+def generate_election_day_report_and_log(election, reference_data, rebuild_all=False):
+    """
+    Generate, load, and save the reports and log for one election, unless the
+    saved ones can be used.
+    """
+    # See if data for this election has been saved already.  If it has, and data
+    # for the election is not still changing, then we just have to ensure that it
+    # has been loaded into Redis since the last flush of Redis.
+    record = ElectionReport.objects.filter(election=election).first()
+    if record and not rebuild_all:  # okay to use existing report for old election
+        if election.work_end_time < now():  # data not still changing
+            if not election_day_report_loaded(election):
+                load_election_data(election)
+            return
+    # Fingerprint the inputs before pulling the data, so that any changes made while
+    # the reports are being generated will be picked up next time.
+    with stage('query'):
+        fingerprint = election_input_fingerprint(election)
+    if record and not rebuild_all and record.input_fingerprint == fingerprint:
+        # The data is still changing, but hasn't changed since the saved report.
+        if not election_day_report_loaded(election):
+            load_election_data(election)
+        refresh_election_day_timestamp(election)
+        return
+    log = generate_and_load_election_day_log(election)
+    report = generate_and_load_election_day_report(election, reference_data)
+    hq_reports = generate_and_load_election_day_hq_reports(election)
+    if record is None:
+        record = ElectionReport(election=election)
+
+    record.input_fingerprint = fingerprint
+    record.message_log = json.dumps(log, cls=DateTimeEncoder)
+    record.report = json.dumps(report)
+    record.hq_reports = json.dumps(hq_reports)
+    record.full_clean()
+    record.save()
@@ -0,0 +1,102 @@
+"""
+Encoding of the report data stored in Redis.
+
+Each stored value starts with a header byte identifying the codec (format and
+version) used to encode it.  None of the header bytes can begin a JSON document,
+so values stored as plain JSON before the header was introduced (or with the
+'json' codec, which adds no header) are still decoded correctly.
+
+Codecs must round-trip the data the same way JSON does (e.g., int dict keys
+become strings), since the reports generated from freshly pulled data must
+match those loaded from the JSON saved in ElectionReport.
+"""
+# Python imports
+import json
+import zlib
+
+# 3rd party imports
+from django.conf import settings
+
+# Project imports
+from .encoder import DateTimeEncoder
+
+# Size of the pieces of the stored report decompressed at a time by iter_report_json()
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class JSONCodec(object):
+    """Plain JSON, as stored before codecs were introduced; no header byte."""
+    name = 'json'
+    header = None
+
+    def encode(self, data):
+        return json.dumps(data, cls=DateTimeEncoder).encode()
+
+    def decode(self, payload):
+        return json.loads(payload.decode())
+
+    def iter_json(self, payload):
+        yield payload
+
+
+class ZlibJSONCodec(JSONCodec):
+    """JSON compressed with zlib."""
+    name = 'zlib-json'
+    header = 0x01
+
+    def __init__(self, level=1):
+        # Level 1 compresses the (very repetitive) report data nearly as well as
+        # the default level, in a fraction of the time.
+        self.level = level
+
+    def encode(self, data):
+        return zlib.compress(super(ZlibJSONCodec, self).encode(data), self.level)
+
+    def decode(self, payload):
+        return super(ZlibJSONCodec, self).decode(zlib.decompress(payload))
+
+    def iter_json(self, payload):
+        decompressor = zlib.decompressobj()
+        for start in range(0, len(payload), STREAM_CHUNK_SIZE):
+            yield decompressor.decompress(payload[start:start + STREAM_CHUNK_SIZE])
+        yield decompressor.flush()
+
+
+CODECS = {codec.name: codec for codec in (JSONCodec(), ZlibJSONCodec())}
+CODECS_BY_HEADER = {codec.header: codec for codec in CODECS.values() if codec.header}
+
+
+def get_codec(name=None):
+    """Return the codec with the specified name, or the one chosen by
+    settings.REPORT_STORE_CODEC."""
+    return CODECS[name or settings.REPORT_STORE_CODEC]
+
+
+def encode_report(data, codec=None):
+    """Encode report data for storage in Redis, with the header byte for the codec.
+
+    codec: name of the codec to use instead of settings.REPORT_STORE_CODEC
+    """
+    codec = get_codec(codec)
+    payload = codec.encode(data)
+    if codec.header is None:
+        return payload
+    return bytes((codec.header,)) + payload
+
+
+def decode_report(value):
+    """Decode report data retrieved from Redis, in any of the supported formats.
+    Empty data is treated as JSON (which is invalid, as it was before the headers)."""
+    codec = CODECS_BY_HEADER.get(value[0]) if value else None
+    if codec is None:
+        return CODECS['json'].decode(value)
+    return codec.decode(value[1:])
+
+
+def iter_report_json(value):
+    """Yield the JSON text (as bytes) of report data retrieved from Redis, in pieces,
+    without decoding the JSON, so that it can be streamed to clients as is."""
+    codec = CODECS_BY_HEADER.get(value[0]) if value else None
+    if codec is None:
+        return CODECS['json'].iter_json(value)
+    return codec.iter_json(value[1:])
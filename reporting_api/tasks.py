@@ -3,8 +3,10 @@ import logging
 from celery.task import task, Task
 from django.conf import settings
 
+from voting.models import Election
+from .instrumentation import instrumented_run
 from .reports import generate_registrations_reports, \
-    generate_election_day_reports_and_logs
+    generate_election_day_reports_and_logs, update_election_day_center
 
 logger = logging.getLogger(__name__)
 
@@ -19,12 +21,19 @@ class LoggedTask(Task):
 
 @task(base=LoggedTask)
 def registrations():
-    generate_registrations_reports()
+    with instrumented_run('registrations'):
+        generate_registrations_reports()
 
 
 @task(base=LoggedTask)
 def election_day():
-    generate_election_day_reports_and_logs()
+    with instrumented_run('election_day'):
+        generate_election_day_reports_and_logs()
+
+
+@task(base=LoggedTask)
+def election_day_center(election_id, center_id):
+    update_election_day_center(Election.objects.get(id=election_id), center_id)
 
 
 def schedule_reporting_api_tasks(schedule, intervals):
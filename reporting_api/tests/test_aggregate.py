@@ -0,0 +1,92 @@
+# Python imports
+import copy
+import json
+from unittest.mock import patch
+
+# 3rd party imports
+from django.test import TestCase, override_settings
+
+# Project imports
+from reporting_api import aggregate
+from reporting_api.aggregate import aggregate_up, aggregate_up_columnar, aggregate_up_dicts
+
+CENTERS = [
+    {'polling_center_code': 11001, 'office_id': 1, 'region': 'West', 'country': 'Libya',
+     '2014-08-01': [3, 1], '2014-08-02': [0, 2], '18-29': 4, 'total': 6},
+    {'polling_center_code': 11002, 'office_id': 1, 'region': 'West', 'country': 'Libya',
+     'copy_of_polling_center': 11001, '2014-08-02': [5, 5], '18-29': 7, 'total': 10},
+    {'polling_center_code': 21001, 'office_id': 2, 'region': 'East', 'country': 'Libya',
+     '2014-08-01': [1, 1], '18-29': 0, 'total': 2},
+]
+
+ELECTION_DAY_CENTERS = [
+    {'polling_center_code': 11001, 'office_id': 1, 'region': 'West', 'country': 'Libya',
+     'registration_count': 30, 'phones': ['218911234567'],
+     '2014-08-01': {'opened': '08:10:00', 1: 10, 2: 20}},
+    {'polling_center_code': 11002, 'office_id': 1, 'region': 'West', 'country': 'Libya',
+     'registration_count': 20, 'inactive_for_election': True,
+     '2014-08-01': {1: 5}, '2014-08-02': {'opened': '08:00:00'}},
+    {'polling_center_code': 21001, 'office_id': 2, 'region': 'East', 'country': 'Libya',
+     'registration_count': 10},
+]
+
+
+class TestAggregateUp(TestCase):
+
+    def _assert_same_results(self, lesser_dicts, **kwargs):
+        original = copy.deepcopy(lesser_dicts)
+        expected = aggregate_up_dicts(lesser_dicts, **kwargs)
+        actual = aggregate_up_columnar(lesser_dicts, **kwargs)
+        # compare the serialized form too, so that key order is checked
+        self.assertEqual(json.dumps(expected), json.dumps(actual))
+        self.assertEqual(original, lesser_dicts)
+        return actual
+
+    def test_registrations(self):
+        offices = self._assert_same_results(CENTERS, aggregate_key='office_id',
+                                            lesser_key='polling_center',
+                                            skip_keys=('polling_center_code',
+                                                       'copy_of_polling_center'),
+                                            copy_keys=('office_id', 'region', 'country'))
+        self.assertEqual([5, 7], offices[1]['2014-08-02'])
+        self.assertEqual(2, offices[1]['polling_center_count'])
+        regions = self._assert_same_results(list(offices.values()), aggregate_key='region',
+                                            lesser_key='office', skip_keys=('office_id',),
+                                            copy_keys=('region', 'country'))
+        self._assert_same_results(list(regions.values()), aggregate_key='country',
+                                  lesser_key='region', skip_keys=('region',),
+                                  copy_keys=('country',))
+
+    def test_election_day(self):
+        offices = self._assert_same_results(
+            ELECTION_DAY_CENTERS, aggregate_key='office_id', lesser_key='polling_center',
+            skip_keys=('polling_center_code', 'phones'),
+            copy_keys=('office_id', 'region', 'country'),
+            enumerate_keys=(('inactive_for_election', 'polling_center_code'),),
+            count_inner_keys=(1, 2, 3, 4, 'opened'), sum_inner_keys=(1, 2, 3, 4))
+        self.assertEqual([11002], offices[1]['inactive_for_election'])
+        self.assertEqual({'opened': 1, 1: 15, '1_count': 2, 2: 20, '2_count': 1},
+                         offices[1]['2014-08-01'])
+        self._assert_same_results(list(offices.values()), aggregate_key='region',
+                                  lesser_key='office',
+                                  skip_keys=('office_id', 'inactive_for_election'),
+                                  copy_keys=('region', 'country'),
+                                  sum_inner_keys=(1, 2, 3, 4, '1_count', '2_count'))
+
+    def test_default_copy_keys(self):
+        lesser_dicts = [{'office_id': 1, 'total': 2}, {'office_id': 1, 'total': 3}]
+        self._assert_same_results(lesser_dicts, aggregate_key='office_id')
+
+    def test_empty(self):
+        self.assertEqual({}, self._assert_same_results([], aggregate_key='office_id'))
+
+    @override_settings(REPORT_AGGREGATION_ENGINE='compare')
+    def test_compare(self):
+        kwargs = {'aggregate_key': 'office_id', 'copy_keys': ('office_id',)}
+        with patch.object(aggregate, 'logger') as mock_logger:
+            result = aggregate_up(CENTERS, **kwargs)
+            self.assertFalse(mock_logger.error.called)
+            with patch.object(aggregate, 'aggregate_up_columnar') as mock_columnar:
+                mock_columnar.return_value = {}
+                self.assertEqual(result, aggregate_up(CENTERS, **kwargs))
+            self.assertTrue(mock_logger.error.called)
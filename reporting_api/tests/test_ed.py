@@ -1,23 +1,35 @@
 import datetime
+from unittest.mock import patch
 
 from django.conf import settings
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils.timezone import now
 from pytz import timezone
 
 from libya_elections.utils import astz
 from polling_reports.models import CenterOpen
-from polling_reports.tests.factories import StaffPhoneFactory
+from polling_reports.tests.factories import CenterOpenFactory, PollingReportFactory, \
+    StaffPhoneFactory
 from register.models import Office
-from register.tests.factories import RegistrationCenterFactory
+from register.tests.factories import RegistrationCenterFactory, RegistrationFactory, \
+    WhitelistFactory
 from voting.models import Election
 from voting.tests.factories import ElectionFactory
 
-from reporting_api import create_test_data, tasks
+from reporting_api import create_test_data, reports, tasks
 from reporting_api.data_pull_common import get_all_polling_locations
 from reporting_api.data_pull_ed import message_log, pull_data, process_raw_data
-from reporting_api.reports import ELECTION_DAY_HQ_REPORTS_KEY, ELECTION_DAY_REPORT_KEY, \
-    ELECTION_DAY_LOG_KEY, election_key, retrieve_report, get_election_data_from_db
+from reporting_api.models import ElectionReport
+from reporting_api.reports import ELECTION_DAY_BY_COUNTRY_KEY, ELECTION_DAY_BY_REGION_KEY, \
+    ELECTION_DAY_HQ_REPORTS_KEY, ELECTION_DAY_LOCK_KEY, ELECTION_DAY_METADATA_KEY, \
+    ELECTION_DAY_POLLING_CENTERS_TABLE_KEY, ELECTION_DAY_REPORT_KEY, ELECTION_DAY_LOG_KEY, \
+    election_day_lock, election_day_office_aggregate_key, election_day_office_centers_key, \
+    election_day_office_index_key, election_day_office_table_key, \
+    election_day_polling_center_log_key, election_day_polling_center_table_key, election_key, \
+    redis_key, report_store, retrieve_center_changes, \
+    retrieve_polling_centers_page, retrieve_report, get_election_data_from_db, \
+    generate_centers_by_office, generate_election_day_reports_and_logs, get_election_days, \
+    update_election_day_center, update_polling_centers_table
 
 
 class ElectionDayTest(TestCase):
@@ -232,6 +244,223 @@ class TestStaffPhoneReportingByElection(TestCase):
                 self.assertEqual(message['type'], 'phonelink')
 
 
+class TestElectionInputFingerprint(TestCase):
+
+    def setUp(self):
+        self.center = RegistrationCenterFactory()
+        self.election = ElectionFactory(
+            polling_start_time=now() - datetime.timedelta(hours=1),
+            polling_end_time=now() + datetime.timedelta(hours=1),
+        )
+        generate_election_day_reports_and_logs()
+
+    def generate(self):
+        with patch.object(reports, 'generate_and_load_election_day_report',
+                          wraps=reports.generate_and_load_election_day_report) as mock_generate:
+            generate_election_day_reports_and_logs()
+        return mock_generate.called
+
+    def test_unchanged(self):
+        fingerprint = ElectionReport.objects.get(election=self.election).input_fingerprint
+        self.assertTrue(fingerprint)
+        metadata_key = election_key(ELECTION_DAY_METADATA_KEY, self.election)
+        last_updated = retrieve_report(metadata_key)['last_updated']
+        self.assertFalse(self.generate())
+        self.assertEqual(fingerprint,
+                         ElectionReport.objects.get(election=self.election).input_fingerprint)
+        self.assertNotEqual(last_updated, retrieve_report(metadata_key)['last_updated'])
+
+    def test_changed(self):
+        CenterOpenFactory(election=self.election, registration_center=self.center)
+        self.assertTrue(self.generate())
+        self.assertFalse(self.generate())
+
+    def test_other_inputs_changed(self):
+        registration = RegistrationFactory(registration_center=self.center, archive_time=None)
+        self.assertTrue(self.generate())
+        registration.soft_delete()
+        self.assertTrue(self.generate())
+        WhitelistFactory()
+        self.assertTrue(self.generate())
+        office = self.center.office
+        office.name_english = 'Renamed'
+        office.save()
+        self.assertTrue(self.generate())
+        self.assertFalse(self.generate())
+
+    def test_reminders_sent(self):
+        with patch.object(reports, 'get_effective_reminder_time') as mock_time:
+            mock_time.return_value = self.election.polling_start_time - datetime.timedelta(days=1)
+            self.generate()
+            self.assertFalse(self.generate())
+            mock_time.return_value = self.election.polling_start_time + datetime.timedelta(days=1)
+            self.assertTrue(self.generate())
+
+
+class TestElectionDayCenterUpdate(TestCase):
+
+    def setUp(self):
+        self.election = ElectionFactory(
+            polling_start_time=now() - datetime.timedelta(hours=1),
+            polling_end_time=now() + datetime.timedelta(hours=1),
+        )
+        self.center_1 = RegistrationCenterFactory()
+        self.center_2 = RegistrationCenterFactory(office=self.center_1.office)
+        self.center_3 = RegistrationCenterFactory()
+        CenterOpenFactory(election=self.election, registration_center=self.center_1)
+        PollingReportFactory(election=self.election, registration_center=self.center_1,
+                             num_voters=7)
+        CenterOpenFactory(election=self.election, registration_center=self.center_3)
+        generate_election_day_reports_and_logs()
+
+    def get_reports(self, center):
+        """ Return the reports which update_election_day_center() writes for the
+        center. """
+        office_id = center.office_id
+        reports = retrieve_report([
+            election_key(ELECTION_DAY_BY_COUNTRY_KEY, self.election),
+            election_key(ELECTION_DAY_BY_REGION_KEY, self.election),
+            election_day_office_table_key(self.election, office_id),
+            election_day_office_aggregate_key(self.election, office_id),
+            election_day_office_centers_key(self.election, office_id),
+            election_day_office_index_key(self.election, office_id),
+            election_day_polling_center_table_key(self.election, center.center_id),
+        ])
+        self.assertIsNotNone(reports[0])
+        # a center which hasn't sent any messages has no log
+        reports.append(retrieve_report(
+            election_day_polling_center_log_key(self.election, center.center_id)))
+        return reports
+
+    def assert_same_as_full_update(self, *centers):
+        for center in centers:
+            update_election_day_center(self.election, center.center_id)
+        updated = [self.get_reports(center) for center in centers]
+        generate_election_day_reports_and_logs(rebuild_all=True)
+        self.assertEqual([self.get_reports(center) for center in centers], updated)
+
+    def test_center_opens(self):
+        CenterOpenFactory(election=self.election, registration_center=self.center_2)
+        self.assert_same_as_full_update(self.center_2)
+
+    def test_center_reports(self):
+        PollingReportFactory(election=self.election, registration_center=self.center_1,
+                             period_number=2, num_voters=20)
+        PollingReportFactory(election=self.election, registration_center=self.center_3,
+                             num_voters=5)
+        self.assert_same_as_full_update(self.center_1, self.center_3)
+
+    def test_whole_reports_left_to_full_update(self):
+        keys = [election_key(key, self.election)
+                for key in (ELECTION_DAY_REPORT_KEY, ELECTION_DAY_METADATA_KEY,
+                            ELECTION_DAY_POLLING_CENTERS_TABLE_KEY, ELECTION_DAY_LOG_KEY)]
+        reports = retrieve_report(keys)
+        CenterOpenFactory(election=self.election, registration_center=self.center_2)
+        update_election_day_center(self.election, self.center_2.center_id)
+        self.assertEqual(reports, retrieve_report(keys))
+
+    def test_lock_expired(self):
+        with self.assertLogs('reporting_api.reports', 'WARNING'):
+            with election_day_lock(self.election):
+                report_store.delete(redis_key(ELECTION_DAY_LOCK_KEY % self.election.id))
+
+    def test_center_changes(self):
+        sequence, centers = retrieve_center_changes(self.election)
+        center_ids = {center['polling_center_code'] for center in centers}
+        self.assertTrue({self.center_1.center_id, self.center_2.center_id,
+                         self.center_3.center_id}.issubset(center_ids))
+        self.assertEqual((sequence, []), retrieve_center_changes(self.election, sequence))
+
+        CenterOpenFactory(election=self.election, registration_center=self.center_2)
+        update_election_day_center(self.election, self.center_2.center_id)
+        new_sequence, centers = retrieve_center_changes(self.election, sequence)
+        self.assertGreater(new_sequence, sequence)
+        self.assertEqual([self.center_2.center_id],
+                         [center['polling_center_code'] for center in centers])
+        self.assertIn('opened', centers[0])
+
+        # regenerating the report records only the centers that actually changed
+        generate_election_day_reports_and_logs(rebuild_all=True)
+        self.assertEqual([], retrieve_center_changes(self.election, new_sequence)[1])
+
+    def test_centers_page(self):
+        def page_codes(**kwargs):
+            num_centers, centers = retrieve_polling_centers_page(self.election, **kwargs)
+            return num_centers, [center['polling_center_code'] for center in centers]
+
+        codes = sorted(center.center_id for center in
+                       (self.center_1, self.center_2, self.center_3))
+        self.assertEqual((3, codes), page_codes())
+        self.assertEqual((3, codes[1:2]), page_codes(offset=1, limit=1))
+        self.assertEqual((3, codes[::-1]), page_codes(descending=True))
+        self.assertEqual((3, []), page_codes(offset=3, limit=1))
+        self.assertEqual((2, sorted([self.center_1.center_id, self.center_2.center_id])),
+                         page_codes(office_id=self.center_1.office_id))
+        self.assertEqual((1, [self.center_1.center_id]), page_codes(period='1', reported=True))
+        self.assertEqual((2, sorted([self.center_2.center_id, self.center_3.center_id])),
+                         page_codes(period='1', reported=False))
+        # centers which haven't opened sort first
+        self.assertEqual(self.center_2.center_id, page_codes(sort='opened')[1][0])
+
+        # the index is kept up to date as a center reports
+        PollingReportFactory(election=self.election, registration_center=self.center_3,
+                             num_voters=5)
+        update_election_day_center(self.election, self.center_3.center_id)
+        self.assertEqual((1, [self.center_2.center_id]), page_codes(period='1', reported=False))
+
+    def test_report_not_generated(self):
+        election = ElectionFactory(
+            polling_start_time=now() + datetime.timedelta(days=1),
+            polling_end_time=now() + datetime.timedelta(days=1, hours=8),
+        )
+        update_election_day_center(election, self.center_1.center_id)
+        self.assertIsNone(retrieve_report(election_key(ELECTION_DAY_REPORT_KEY, election)))
+
+
+class TestPollingCentersTable(TestCase):
+
+    def setUp(self):
+        self.election = ElectionFactory(
+            polling_start_time=now() - datetime.timedelta(hours=1),
+            polling_end_time=now() + datetime.timedelta(hours=1),
+        )
+        self.election_day_dt, self.election_day, self.day_after_election_day = \
+            get_election_days(self.election)
+        self.before_election = (self.election_day_dt - datetime.timedelta(days=2)) \
+            .strftime('%Y-%m-%d')
+
+    def update(self, centers, dates, current_time):
+        with patch.object(reports, 'get_effective_reminder_time') as mock_time:
+            mock_time.return_value = current_time
+            update_polling_centers_table(dates, centers, self.election, self.election_day_dt,
+                                         self.election_day, self.day_after_election_day)
+
+    def test_centers(self):
+        centers = {
+            '11001': {'polling_center_code': 11001, 'office_id': 1,
+                      self.election_day: {'opened': '08:15:00', '1': 30,
+                                          'reported': '11:00:00'}},
+            '11002': {'polling_center_code': 11002, 'office_id': 2,
+                      self.before_election: {'opened': '08:00:00'}},
+        }
+        dates = [self.before_election, self.election_day]
+        # after the second reminder
+        self.update(centers, dates, self.election_day_dt.replace(hour=16))
+        center = centers['11001']
+        self.assertEqual('08:15', center['opened'])
+        self.assertEqual(self.election_day_dt.strftime('%d/%m') + ' 11:00',
+                         center['last_reported'])
+        self.assertEqual(['has_reported', 'has_not_reported', 'not_due', 'not_due'],
+                         [center['reported_period_' + period] for period in '1234'])
+        self.assertEqual(30, center['votes_reported_1'])
+        # opened before the election started
+        self.assertNotIn('last_opened', centers['11002'])
+        self.assertEqual('no_data', centers['11002']['reported_period_1'])
+        self.assertEqual({1: [11001], 2: [11002], 3: []},
+                         generate_centers_by_office([{'code': 1}, {'code': 2}, {'code': 3}],
+                                                    centers))
+
+
 class TestReportingByElection(TestCase):
 
     def setUp(self):
@@ -265,6 +494,20 @@ class TestReportingByElection(TestCase):
             self.assertDictEqual(hq_reports_from_db, hq_reports_from_redis)
             self.assertDictEqual(messages_from_db, messages_from_redis)
 
+    def test_streaming_cursors(self):
+        polling_locations = get_all_polling_locations()
+        for election in Election.objects.all():
+            with override_settings(REPORT_SERVER_SIDE_CURSORS=True, REPORT_CURSOR_ITERSIZE=3):
+                streamed = pull_data(polling_locations, election)
+                streamed_log = message_log(election)
+            with override_settings(REPORT_SERVER_SIDE_CURSORS=False):
+                fetched = pull_data(polling_locations, election)
+                fetched_log = message_log(election)
+            del streamed['last_updated']
+            del fetched['last_updated']
+            self.assertEqual(streamed, fetched)
+            self.assertEqual(streamed_log, fetched_log)
+
     def test_distribution_by_election(self):
         tz = timezone(settings.TIME_ZONE)
         elections = Election.objects.all()
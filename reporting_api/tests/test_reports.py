@@ -1,20 +1,39 @@
 # Python imports
 import base64
+import copy
+import datetime
 import json
+import os
+import pstats
+import tempfile
+from unittest.mock import patch
 
 # 3rd party imports
-from django.db import connection
-from django.test import TestCase
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import localdate, now
 
 # Project imports
-from register.models import RegistrationCenter
-from register.tests.factories import RegistrationFactory
-from reporting_api import create_test_data, reports, tasks, views
-from reporting_api.data_pull import registrations_by_phone
+from libya_elections.constants import OUTGOING
+from polling_reports.tests.factories import CenterOpenFactory
+from register.models import Registration, RegistrationCenter, SMS
+from register.tests.factories import RegistrationFactory, SMSFactory
+from reporting_api import create_test_data, data_pull, data_pull_ed, instrumentation, \
+    reports, tasks, views
+from reporting_api.data_pull import duplicate_registrations, \
+    multiple_family_book_registrations, phone_statistics, refresh_registration_rollup, \
+    registrations_by_phone
+from reporting_api.data_pull_common import ReferenceData
+from reporting_api.models import RegistrationRollup, RegistrationRollupStatus
+from voting.models import Election
+from voting.tests.factories import ElectionFactory
 
 BASE_URI = '/reporting/'
 ELECTION_DAY_REPORT_REL_URI = 'election_day.json'
 ELECTION_DAY_LOG_REL_URI = 'election_day_log.json'
+ELECTION_DAY_CHANGES_REL_URI = 'election_day_changes.json'
 REGISTRATIONS_REL_URI = 'registrations.json'
 
 TEST_USERNAME = 'some_test_user'
@@ -40,10 +59,12 @@ class TestReports(TestCase):
         rsp = self.client.get(BASE_URI + ELECTION_DAY_LOG_REL_URI)
         self.assertEqual(200, rsp.status_code)
         self.assertEqual('application/json', rsp['Content-Type'])
-        self.assertNotEqual('{}', rsp.content.decode())
+        # getvalue() works for streamed responses too
+        content = rsp.getvalue().decode()
+        self.assertNotEqual('{}', content)
         allowable_phone_keys = {'phone_number', 'type', 'center_code',
                                 'creation_date', 'data'}
-        log = json.loads(rsp.content.decode())
+        log = json.loads(content)
         for key in log.keys():
             int(key)  # shouldn't raise
             for phone in log[key]:
@@ -78,7 +99,7 @@ class TestReports(TestCase):
         rsp = self.client.get(BASE_URI + ELECTION_DAY_REPORT_REL_URI)
         self.assertEqual(200, rsp.status_code)
         self.assertEqual('application/json', rsp['Content-Type'])
-        d = json.loads(rsp.content.decode())
+        d = json.loads(rsp.getvalue().decode())
         self._check_slice(d, 'by_country',
                           required_item_keys=('country', 'office_count', 'polling_center_count',
                                               'region_count', 'registration_count'),
@@ -104,7 +125,7 @@ class TestReports(TestCase):
         rsp = self.client.get(BASE_URI + REGISTRATIONS_REL_URI)
         self.assertEqual(200, rsp.status_code)
         self.assertEqual('application/json', rsp['Content-Type'])
-        d = json.loads(rsp.content.decode())
+        d = json.loads(rsp.getvalue().decode())
         self._check_slice(d, 'by_country',
                           required_item_keys=('country', 'office_count', 'polling_center_count',
                                               'region_count', 'total'),
@@ -137,6 +158,67 @@ class TestReports(TestCase):
         for center in no_reg_centers:
             self.assertNotIn(center.center_id, reported_centers)
 
+    def test_streamed_reports_match_encoded_reports(self):
+        for relative_uri in (REGISTRATIONS_REL_URI, ELECTION_DAY_LOG_REL_URI,
+                             ELECTION_DAY_REPORT_REL_URI):
+            with override_settings(REPORT_STREAMING_RESPONSES=True):
+                streamed = self.client.get(BASE_URI + relative_uri)
+            with override_settings(REPORT_STREAMING_RESPONSES=False):
+                encoded = self.client.get(BASE_URI + relative_uri)
+            self.assertTrue(streamed.streaming)
+            self.assertFalse(encoded.streaming)
+            self.assertEqual(json.loads(encoded.getvalue().decode()),
+                             json.loads(streamed.getvalue().decode()))
+            self.assertEqual(encoded['ETag'], streamed['ETag'])
+
+    def test_not_modified(self):
+        for relative_uri in (REGISTRATIONS_REL_URI, ELECTION_DAY_LOG_REL_URI,
+                             ELECTION_DAY_REPORT_REL_URI):
+            rsp = self.client.get(BASE_URI + relative_uri)
+            self.assertEqual(200, rsp.status_code)
+            rsp = self.client.get(BASE_URI + relative_uri, HTTP_IF_NONE_MATCH=rsp['ETag'])
+            self.assertEqual(304, rsp.status_code)
+        rsp = self.client.get(BASE_URI + REGISTRATIONS_REL_URI)
+        etag, last_modified = rsp['ETag'], rsp['Last-Modified']
+        rsp = self.client.get(BASE_URI + REGISTRATIONS_REL_URI,
+                              HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(304, rsp.status_code)
+        # a new generation of the reports has a new ETag
+        tasks.registrations()
+        rsp = self.client.get(BASE_URI + REGISTRATIONS_REL_URI, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, rsp.status_code)
+
+    def test_registrations_report_from_one_generation(self):
+        rsp = self.client.get(BASE_URI + REGISTRATIONS_REL_URI)
+        resolve_report_keys = reports.resolve_report_keys
+
+        def resolve_then_regenerate(keys):
+            redis_keys = resolve_report_keys(keys)
+            tasks.registrations()
+            return redis_keys
+
+        # the response is put together from the generation its ETag is computed from,
+        # even if the reports are regenerated in the meantime
+        with patch.object(views, 'resolve_report_keys', side_effect=resolve_then_regenerate):
+            regenerated = self.client.get(BASE_URI + REGISTRATIONS_REL_URI)
+        self.assertEqual(rsp['ETag'], regenerated['ETag'])
+        self.assertEqual(json.loads(rsp.getvalue().decode()),
+                         json.loads(regenerated.getvalue().decode()))
+
+    def test_election_day_changes(self):
+        rsp = self.client.get(BASE_URI + ELECTION_DAY_CHANGES_REL_URI)
+        self.assertEqual(200, rsp.status_code)
+        self.assertEqual('application/json', rsp['Content-Type'])
+        changes = json.loads(rsp.content.decode())
+        self.assertEqual(0, changes['since'])
+        self.assertTrue(changes['centers'])
+        rsp = self.client.get(BASE_URI + ELECTION_DAY_CHANGES_REL_URI,
+                              {'since': changes['sequence']})
+        self.assertEqual(200, rsp.status_code)
+        self.assertEqual([], json.loads(rsp.content.decode())['centers'])
+        rsp = self.client.get(BASE_URI + ELECTION_DAY_CHANGES_REL_URI, {'since': 'yesterday'})
+        self.assertEqual(400, rsp.status_code)
+
     def test_registration_slices(self):
         d = reports.retrieve_report(reports.REGISTRATIONS_METADATA_KEY)
         self.assertEqual(set(d.keys()), {'demographic_breakdowns', 'subconstituencies',
@@ -146,6 +228,20 @@ class TestReports(TestCase):
                                          'phone_duplicate_registrations', 'message_stats',
                                          'headline'})
 
+    def test_loading_leaves_raw_reports_unchanged(self):
+        reference_data = ReferenceData()
+        registrations = data_pull.pull_data(reference_data.active_registration_locations,
+                                            reference_data=reference_data)
+        original = copy.deepcopy(registrations)
+        reports.load_registrations_report(registrations)
+        self.assertEqual(original, registrations)
+        for election in Election.objects.all():
+            report = reports.retrieve_report(
+                reports.election_key(reports.ELECTION_DAY_REPORT_KEY, election))
+            original = copy.deepcopy(report)
+            reports.load_election_day_report(election, report)
+            self.assertEqual(original, report)
+
     def test_lists_of_reports(self):
         r1, r2 = reports.retrieve_report([reports.REGISTRATIONS_METADATA_KEY,
                                           reports.REGISTRATIONS_STATS_KEY])
@@ -168,6 +264,367 @@ class TestReports(TestCase):
         self.assertFalse(bool(r2))
 
 
+class TestIncrementalRegistrations(TestCase):
+
+    def setUp(self):
+        create_test_data.create(num_registrations=NUM_REGISTRATIONS,
+                                num_copy_centers=NUM_COPY_CENTERS,
+                                num_no_reg_centers=NUM_NO_REG_CENTERS)
+        tasks.registrations()
+
+    def _get_registration_reports(self):
+        by_polling_center, region_stats, office_stats, subconstituency_stats, metadata = \
+            reports.retrieve_report([reports.REGISTRATIONS_BY_POLLING_CENTER_KEY,
+                                     reports.REGISTRATIONS_REGION_STATS_KEY,
+                                     reports.REGISTRATIONS_OFFICE_STATS_KEY,
+                                     reports.REGISTRATIONS_SUBCONSTITUENCY_STATS_KEY,
+                                     reports.REGISTRATIONS_METADATA_KEY])
+        by_polling_center = sorted(by_polling_center,
+                                   key=lambda center: center['polling_center_code'])
+        return by_polling_center, region_stats, office_stats, subconstituency_stats, \
+            metadata['dates']
+
+    def test_incremental_matches_full(self):
+        registrations = list(Registration.objects.all()[:3])
+        reg_centers = RegistrationCenter.objects.filter(reg_open=True)
+        # new registration
+        RegistrationFactory(registration_center=registrations[0].registration_center,
+                            archive_time=None)
+        # changed registration
+        changed = registrations[1]
+        changed.registration_center = reg_centers.exclude(id=changed.registration_center.id)[0]
+        changed.save_with_archive_version()
+        # deleted registration
+        deleted = registrations[2]
+        deleted.deleted = True
+        deleted.save()
+
+        tasks.registrations()
+        incremental_reports = self._get_registration_reports()
+
+        # force the rollup to be rebuilt from scratch
+        RegistrationRollupStatus.objects.all().delete()
+        tasks.registrations()
+        self.assertEqual(incremental_reports, self._get_registration_reports())
+
+
+@override_settings(REPORT_INCREMENTAL_SMS_COUNTS=True)
+class TestSMSCounters(TestCase):
+
+    def setUp(self):
+        reports.empty_report_store()
+        self.messages = [SMSFactory(), SMSFactory(), SMSFactory(msg_type=SMS.NOT_HANDLED)]
+        self.cursor = connection.cursor()
+
+    def test_reconcile(self):
+        expected = data_pull.get_sms_counts(self.cursor)
+        self.assertEqual(3, sum(expected.values()))
+        self.assertEqual(expected, reports.get_incremental_sms_counts())
+        # no longer due for reconciliation, so read from the counters
+        with patch.object(data_pull, 'get_sms_counts') as mock_get_sms_counts:
+            self.assertEqual(expected, reports.get_incremental_sms_counts())
+        self.assertFalse(mock_get_sms_counts.called)
+
+    def test_counted_while_reconciling(self):
+        get_sms_counts = data_pull.get_sms_counts
+        field = reports.sms_counter_field(self.messages[0])
+
+        def count_then_commit_message(cursor):
+            sms_counts = get_sms_counts(cursor)
+            reports.update_sms_counters({field: 1})
+            return sms_counts
+
+        expected = get_sms_counts(self.cursor)
+        date, direction, msg_type = field.split(':')
+        expected[(date, int(direction), int(msg_type))] += 1
+        with patch.object(data_pull, 'get_sms_counts', side_effect=count_then_commit_message):
+            self.assertEqual(expected, reports.get_incremental_sms_counts())
+        self.assertEqual(expected, reports.get_incremental_sms_counts())
+
+    def test_counted_as_saved(self):
+        reports.get_incremental_sms_counts()
+        # the counters are updated once the changes are committed
+        with patch.object(transaction, 'on_commit', side_effect=lambda func: func()):
+            SMSFactory()
+            SMSFactory(direction=OUTGOING)  # not counted
+            changed = SMS.objects.get(pk=self.messages[0].pk)
+            changed.msg_type = SMS.NOT_HANDLED
+            changed.save()
+            deleted = SMS.objects.get(pk=self.messages[1].pk)
+            deleted.deleted = True
+            deleted.save()
+            self.messages[2].soft_delete()
+            # saves which don't change how a message is counted don't look it up
+            unchanged = SMSFactory()
+            unchanged.message = 'changed'
+            with self.assertNumQueries(1):
+                unchanged.save(update_fields=['message'])
+        self.assertEqual(data_pull.get_sms_counts(self.cursor),
+                         reports.get_incremental_sms_counts())
+
+    @override_settings(REPORT_INCREMENTAL_SMS_COUNTS=False)
+    def test_not_counted_when_disabled(self):
+        message = SMS.objects.get(pk=self.messages[0].pk)
+        message.msg_type = SMS.NOT_HANDLED
+        with self.assertNumQueries(1):
+            message.save()
+
+
+@override_settings(REPORT_INSTRUMENTATION=True)
+class TestInstrumentation(TestCase):
+
+    def setUp(self):
+        reports.empty_report_store()
+        create_test_data.create(num_registrations=10)
+
+    def test_stages_recorded(self):
+        tasks.registrations()
+        run, = instrumentation.recent_runs()
+        self.assertEqual('registrations', run['name'])
+        self.assertTrue({'query', 'aggregate', 'serialize', 'redis_write', 'other'}
+                        <= set(run['stages']))
+        self.assertGreater(run['stages']['query']['queries'], 0)
+        self.assertEqual(run['queries'],
+                         sum(stage['queries'] for stage in run['stages'].values()))
+        self.assertGreater(run['reports_written'], 0)
+        self.assertGreater(run['bytes_written'], 0)
+
+    @override_settings(REPORT_INSTRUMENTATION_HISTORY=2)
+    def test_history_trimmed(self):
+        for _ in range(3):
+            tasks.registrations()
+        tasks.election_day()
+        self.assertEqual(['election_day', 'registrations'],
+                         [run['name'] for run in instrumentation.recent_runs()])
+        self.assertEqual(1, len(instrumentation.recent_runs('election_day')))
+
+    @override_settings(REPORT_INSTRUMENTATION=False)
+    def test_disabled(self):
+        tasks.registrations()
+        self.assertEqual([], instrumentation.recent_runs())
+
+    def test_profile_saved(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with override_settings(REPORT_PROFILE_THRESHOLD=0, REPORT_PROFILE_DIR=profile_dir):
+                tasks.registrations()
+            profiles = os.listdir(profile_dir)
+            self.assertEqual(1, len(profiles))
+            pstats.Stats(os.path.join(profile_dir, profiles[0]))
+
+
+class TestReportCache(TestCase):
+
+    def setUp(self):
+        create_test_data.create(num_registrations=10)
+        tasks.registrations()
+        self.keys = [reports.REGISTRATIONS_METADATA_KEY, reports.REGISTRATIONS_STATS_KEY]
+
+    def test_cached_until_regenerated(self):
+        metadata, stats = reports.retrieve_report(self.keys)
+        with patch.object(reports.report_store_replica, 'mget') as mock_mget:
+            self.assertEqual([metadata, stats], reports.retrieve_report(self.keys))
+            self.assertIs(stats, reports.retrieve_report(reports.REGISTRATIONS_STATS_KEY))
+            self.assertFalse(mock_mget.called)
+        tasks.registrations()
+        self.assertIsNot(stats, reports.retrieve_report(reports.REGISTRATIONS_STATS_KEY))
+
+    def test_not_cached_after_emptying(self):
+        stats = reports.retrieve_report(reports.REGISTRATIONS_STATS_KEY)
+        reports.empty_report_store()
+        self.assertIsNone(reports.retrieve_report(reports.REGISTRATIONS_STATS_KEY))
+        tasks.registrations()
+        self.assertIsNot(stats, reports.retrieve_report(reports.REGISTRATIONS_STATS_KEY))
+
+    @override_settings(REPORT_CACHE_SIZE=1)
+    def test_eviction(self):
+        metadata, stats = reports.retrieve_report(self.keys)
+        self.assertIsNot(metadata, reports.retrieve_report(reports.REGISTRATIONS_METADATA_KEY))
+        self.assertEqual(reports.resolve_report_keys([reports.REGISTRATIONS_METADATA_KEY]),
+                         list(reports.decoded_reports))
+
+    def test_generation_switch(self):
+        old_stats = reports.retrieve_report(reports.REGISTRATIONS_STATS_KEY)
+        old_keys = reports.resolve_report_keys(self.keys)
+        writer = reports.ReportWriter()
+        writer.set(reports.REGISTRATIONS_METADATA_KEY, {'generation': 'new'})
+        writer.set(reports.REGISTRATIONS_STATS_KEY, {'generation': 'new'})
+        writer.pipe.execute()
+        # written but not yet visible
+        self.assertEqual(old_stats, reports.retrieve_report(reports.REGISTRATIONS_STATS_KEY))
+        writer.commit()
+        self.assertEqual([{'generation': 'new'}] * 2, reports.retrieve_report(self.keys))
+        # the old generation stays around briefly for readers who already resolved it
+        for key in old_keys:
+            ttl = reports.report_store.ttl(key)
+            self.assertGreater(ttl, 0)
+            self.assertLessEqual(ttl, settings.REPORT_GENERATION_GRACE_PERIOD)
+
+
+class TestRegistrationRollup(TestCase):
+
+    def _get_rollup(self):
+        return sorted(RegistrationRollup.objects.values_list(
+            'registration_center_id', 'reg_date', 'gender', 'age', 'count'))
+
+    def test_incremental_matches_full(self):
+        center = RegistrationCenter.objects.get(
+            pk=RegistrationFactory(archive_time=None).registration_center_id)
+        changed = RegistrationFactory(registration_center=center, archive_time=None)
+        deleted = RegistrationFactory(registration_center=center, archive_time=None)
+        RegistrationFactory()  # archived
+        refresh_registration_rollup()
+        self.assertEqual(3, sum(row[-1] for row in self._get_rollup()))
+
+        RegistrationFactory(registration_center=center, archive_time=None)
+        changed.registration_center = RegistrationFactory(archive_time=None).registration_center
+        changed.save_with_archive_version()
+        deleted.deleted = True
+        deleted.save()
+        refresh_registration_rollup()
+        incremental_rollup = self._get_rollup()
+        self.assertEqual(4, sum(row[-1] for row in incremental_rollup))
+
+        # force a full rebuild
+        RegistrationRollupStatus.objects.all().delete()
+        refresh_registration_rollup()
+        self.assertEqual(incremental_rollup, self._get_rollup())
+
+    @override_settings(REPORT_REGISTRATIONS_FULL_REBUILD_INTERVAL=datetime.timedelta(days=7))
+    def test_birthday_between_refreshes(self):
+        # 32nd birthday today (a leap year if this one is), so 31 as of yesterday's full rebuild
+        today = localdate()
+        birth_date = today.replace(year=today.year - 32)
+        yesterday = now() - datetime.timedelta(days=1)
+        registration = RegistrationFactory(archive_time=None, citizen__birth_date=birth_date)
+        Registration.objects.filter(pk=registration.pk).update(
+            creation_date=yesterday - datetime.timedelta(hours=1),
+            modification_date=yesterday - datetime.timedelta(hours=1))
+        with patch('reporting_api.data_pull.now', return_value=yesterday):
+            refresh_registration_rollup()
+        self.assertEqual([31], [row[3] for row in self._get_rollup()])
+
+        # removed from the bucket it was counted in, leaving nothing behind
+        registration.soft_delete()
+        refresh_registration_rollup()
+        self.assertEqual([], self._get_rollup())
+
+    def test_deleted_registration_saved_again(self):
+        center = RegistrationCenter.objects.get(
+            pk=RegistrationFactory(archive_time=None).registration_center_id)
+        deleted = RegistrationFactory(registration_center=center, archive_time=None)
+        refresh_registration_rollup()
+        self.assertEqual(2, sum(row[-1] for row in self._get_rollup()))
+
+        deleted.soft_delete()
+        refresh_registration_rollup()
+        self.assertEqual(1, sum(row[-1] for row in self._get_rollup()))
+
+        # saving the deleted registration again doesn't remove it a second time
+        deleted.save()
+        refresh_registration_rollup()
+        incremental_rollup = self._get_rollup()
+        self.assertEqual(1, sum(row[-1] for row in incremental_rollup))
+
+        # force a full rebuild
+        RegistrationRollupStatus.objects.all().delete()
+        refresh_registration_rollup()
+        self.assertEqual(incremental_rollup, self._get_rollup())
+
+
+class TestReferenceData(TestCase):
+
+    def _count_queries(self, election):
+        refresh_registration_rollup()
+        reference_data = ReferenceData()
+        with CaptureQueriesContext(connection) as context:
+            data_pull.pull_data(reference_data.active_registration_locations,
+                                reference_data=reference_data)
+            data_pull_ed.pull_data(reference_data.all_polling_locations, election,
+                                   reference_data)
+        return len(context)
+
+    def test_queries_independent_of_centers(self):
+        election = ElectionFactory()
+        for _ in range(2):
+            CenterOpenFactory(election=election,
+                              registration_center=RegistrationFactory(
+                                  archive_time=None).registration_center)
+        num_queries = self._count_queries(election)
+        for _ in range(5):
+            CenterOpenFactory(election=election,
+                              registration_center=RegistrationFactory(
+                                  archive_time=None).registration_center)
+        self.assertEqual(num_queries, self._count_queries(election))
+
+
+class TestRegistrationPoints(TestCase):
+    dates = ['2014-08-01', '2014-08-02', '2014-08-03']
+    table = {
+        'by_country': [{'country': 'Libya', '2014-08-01': [1, 2], '2014-08-03': [3, 4]}],
+        'by_region': [{'region': 'West', '2014-08-01': [1, 2]},
+                      {'region': 'East', '2014-08-03': [3, 4]}],
+    }
+
+    def test_new_registrations(self):
+        points = reports.registration_points(self.table, 'region', self.dates)
+        self.assertEqual(['Libya', 'West', 'East'], [line['label'] for line in points])
+        self.assertEqual([['2014-08-01', 3], ['2014-08-02', None], ['2014-08-03', 7]],
+                         points[0]['points'])
+        self.assertEqual([['2014-08-01', None], ['2014-08-02', None], ['2014-08-03', 7]],
+                         points[2]['points'])
+
+    def test_cumulative_registrations(self):
+        points = reports.registration_points(self.table, 'region', self.dates, cumulative=True)
+        self.assertEqual([['2014-08-01', 3], ['2014-08-02', 3], ['2014-08-03', 10]],
+                         points[0]['points'])
+        self.assertEqual([['2014-08-01', 3], ['2014-08-02', 3], ['2014-08-03', 3]],
+                         points[1]['points'])
+
+    def test_shared_daily_registrations(self):
+        daily = {}
+        expected = reports.registration_points(self.table, 'region', self.dates)
+        self.assertEqual(expected, reports.registration_points(self.table, 'region', self.dates,
+                                                               daily=daily))
+        self.assertEqual({'country', 'region'}, set(daily))
+        self.assertEqual([[1, 2], None, [3, 4]], daily['country'][0])
+
+
+class TestWeeklyRegistrations(TestCase):
+    # Tuesday (before the CDA date) through Thursday of the following week
+    dates = ['2014-04-22', '2014-04-26', '2014-04-27', '2014-05-01']
+    by_office = [{'office_id': 1, '2014-04-22': [1, 2], '2014-04-27': [3, 4]},
+                 {'office_id': 2, '2014-04-26': [5, 6], '2014-05-01': [7, 8]}]
+
+    def test_weeks(self):
+        weeks, week_of_date = reports.registration_weeks(reports.parse_dates(self.dates))
+        self.assertEqual(['2014-04-20', '2014-04-27'],
+                         [first.strftime('%Y-%m-%d') for first, last in weeks])
+        self.assertEqual(['2014-04-26', '2014-05-03'],
+                         [last.strftime('%Y-%m-%d') for first, last in weeks])
+        self.assertEqual([0, 0, 1, 1], week_of_date)
+        self.assertEqual(([], []), reports.registration_weeks([]))
+
+    def test_weekly_registrations(self):
+        daily = reports.daily_registrations(self.by_office, self.dates)
+        weekly = reports.calc_weekly_registrations(self.by_office, self.dates,
+                                                   reports.parse_dates(self.dates), daily)
+        self.assertEqual([['2014-04-20', '2014-04-26'], ['2014-04-27', '2014-05-03']],
+                         weekly['weeks'])
+        office_1, office_2 = weekly['by_office']
+        self.assertEqual({'office_id': 1, 'male': 4, 'female': 6, 'pre_cda': 3,
+                          'last_seven': [3, 0, 7, 0], 'weeks': [3, 7]}, office_1)
+        self.assertEqual({'office_id': 2, 'male': 12, 'female': 14, 'pre_cda': 0,
+                          'last_seven': [0, 11, 0, 15], 'weeks': [11, 15]}, office_2)
+        self.assertEqual({'male': 16, 'female': 20, 'pre_cda': 3,
+                          'last_seven': [3, 11, 7, 15], 'weeks': [14, 22]}, weekly['country'])
+
+    def test_cumulative_messages(self):
+        stats = {'sms_stats': {'messages': {'2014-04-22': 2, '2014-05-01': 3}},
+                 'message_stats': {'1': {'2014-04-26': 4}}}
+        self.assertEqual({'messages': [2, 2, 2, 5], 'by_type': {'1': [0, 4, 4, 4]}},
+                         reports.calc_cumulative_messages(stats, self.dates))
+
+
 class TestRegistrationsByPhone(TestCase):
 
     @classmethod
@@ -221,6 +678,54 @@ class TestRegistrationsByPhone(TestCase):
         self.assertEqual(report, [])
 
 
+class TestPhoneStatistics(TestCase):
+
+    def setUp(self):
+        self.cursor = connection.cursor()
+
+    def test_multiple_family_books(self):
+        reg = RegistrationFactory(archive_time=None)
+        phone_number = reg.sms.from_number
+        other = RegistrationFactory(sms__from_number=phone_number, archive_time=None)
+        # same family book as the first
+        RegistrationFactory(sms__from_number=phone_number, archive_time=None,
+                            citizen__fbr_number=reg.citizen.fbr_number)
+        fbrn, dups, regs_by_phone = phone_statistics(self.cursor)
+        self.assertEqual({phone_number: sorted([reg.citizen.fbr_number,
+                                                other.citizen.fbr_number])},
+                         {number: sorted(fbr_list) for number, fbr_list in fbrn.items()})
+        self.assertEqual({}, dups)
+        self.assertEqual([(phone_number, 3)], regs_by_phone)
+
+    def test_duplicate_registrations(self):
+        reg = RegistrationFactory(archive_time=None)
+        phone_number = reg.sms.from_number
+        replies = [SMSFactory(to_number=phone_number, direction=OUTGOING, message_code=3)
+                   for _ in range(2)]
+        # not the "NID already registered" message, or deleted
+        SMSFactory(to_number=phone_number, direction=OUTGOING, message_code=1)
+        SMSFactory(to_number=phone_number, direction=OUTGOING, message_code=3, deleted=True)
+        fbrn, dups, regs_by_phone = phone_statistics(self.cursor)
+        self.assertEqual({}, fbrn)
+        self.assertEqual({phone_number: sorted(sms.creation_date for sms in replies)},
+                         {number: sorted(dates) for number, dates in dups.items()})
+        self.assertEqual([], regs_by_phone)
+
+    def test_same_as_single_statistics(self):
+        reg = RegistrationFactory(archive_time=None)
+        phone_number = reg.sms.from_number
+        RegistrationFactory(sms__from_number=phone_number, archive_time=None)
+        SMSFactory(to_number=phone_number, direction=OUTGOING, message_code=3)
+        fbrn, dups, regs_by_phone = phone_statistics(self.cursor)
+        self.assertEqual({number: sorted(fbr_list) for number, fbr_list in fbrn.items()},
+                         {number: sorted(fbr_list) for number, fbr_list
+                          in multiple_family_book_registrations(self.cursor).items()})
+        self.assertEqual({number: sorted(dates) for number, dates in dups.items()},
+                         {number: sorted(dates) for number, dates
+                          in duplicate_registrations(self.cursor).items()})
+        self.assertEqual(regs_by_phone, registrations_by_phone(self.cursor))
+
+
 class TestMissingReports(TestCase):
 
     def setUp(self):
@@ -233,7 +738,7 @@ class TestMissingReports(TestCase):
 
     def test(self):
         for relative_uri in (REGISTRATIONS_REL_URI, ELECTION_DAY_LOG_REL_URI,
-                             ELECTION_DAY_REPORT_REL_URI):
+                             ELECTION_DAY_REPORT_REL_URI, ELECTION_DAY_CHANGES_REL_URI):
             rsp = self.client.get(BASE_URI + relative_uri)
             self.assertEqual(503, rsp.status_code, 'expected report at %s to be unavailable' %
                              relative_uri)
@@ -1,16 +1,21 @@
 # Python imports
 import datetime
+import json
 
 # 3rd party imports
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.utils.timezone import now
 
 # Project imports
 from register.tests.test_models import RegistrationCenterFactory
 from reporting_api.data_pull_common import get_active_registration_locations, \
     get_all_polling_locations
-from reporting_api.reports import calc_yesterday, parse_iso_datetime, printable_iso_datetime
-from reporting_api.utils import get_datetime_from_local_date_and_time
+from reporting_api.reports import calc_yesterday, parse_iso_datetime, printable_iso_datetime, \
+    redis_key, report_store, retrieve_report
+from reporting_api.serialization import CODECS, decode_report, encode_report
+from reporting_api.utils import get_datetime_from_local_date_and_time, run_concurrently, \
+    streaming_query
 
 
 class TestReportUtils(TestCase):
@@ -84,3 +89,69 @@ class TestReportUtils(TestCase):
         self.assertEqual(sorted(for_registration.keys()), sorted([rc1.center_id]))
         self.assertEqual(sorted(all_locations.keys()),
                          sorted([rc1.center_id, rc2.center_id]))
+
+
+class TestReportSerialization(TestCase):
+    data = {'dates': ['2014-08-01'], 1: {'name': 'مكتب', 'total': 42}, 'missing': None}
+
+    def test_round_trip(self):
+        for name in CODECS:
+            decoded = decode_report(encode_report(self.data, codec=name))
+            # int keys become strings, just as with JSON
+            self.assertEqual(json.loads(json.dumps(self.data)), decoded)
+
+    def test_json_without_header(self):
+        self.assertEqual(json.dumps(self.data).encode(), encode_report(self.data, codec='json'))
+        self.assertEqual(['a', 1], decode_report(b' ["a", 1]'))
+        self.assertEqual(7, decode_report(b'7'))
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            decode_report(b'')
+
+    @override_settings(REPORT_STORE_CODEC='zlib-json')
+    def test_compressed(self):
+        value = encode_report([self.data] * 100)
+        self.assertLess(len(value), len(encode_report([self.data] * 100, codec='json')))
+        self.assertEqual(1, value[0])
+
+    def test_retrieve_legacy_report(self):
+        key = 'test_legacy_report'
+        report_store.set(redis_key(key), json.dumps(self.data))
+        self.addCleanup(report_store.delete, redis_key(key))
+        self.assertEqual('مكتب', retrieve_report(key)['1']['name'])
+
+
+class TestRunConcurrently(TestCase):
+
+    def check_results(self):
+        funcs = [lambda i=i: i * i for i in range(8)]
+        self.assertEqual([i * i for i in range(8)], run_concurrently(funcs))
+        self.assertEqual([], run_concurrently([]))
+
+    @override_settings(REPORT_QUERY_THREADS=0)
+    def test_serial(self):
+        self.check_results()
+
+    @override_settings(REPORT_QUERY_THREADS=3)
+    def test_threads(self):
+        self.check_results()
+
+    @override_settings(REPORT_QUERY_THREADS=3)
+    def test_exception(self):
+        def fail():
+            raise ValueError('failed')
+        with self.assertRaises(ValueError):
+            run_concurrently([lambda: 1, fail])
+
+
+class TestStreamingQuery(TestCase):
+
+    @override_settings(REPORT_SERVER_SIDE_CURSORS=True, REPORT_CURSOR_ITERSIZE=2)
+    def test_stopped_early(self):
+        savepoints = list(connection.savepoint_ids)
+        with streaming_query('SELECT * FROM generate_series(1, 10) AS n;',
+                             time_zone='UTC') as rows:
+            self.assertEqual({'n': 1}, next(rows))
+        # the transaction of the server-side cursor ends with the with block
+        self.assertEqual(savepoints, connection.savepoint_ids)
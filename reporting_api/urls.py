@@ -1,10 +1,16 @@
 from django.conf.urls import url
-from django.views.decorators.cache import never_cache
+from django.views.decorators.cache import cache_control
 
-from .views import election_day_log, election_day_report, registrations_report
+from .views import election_day_changes, election_day_log, election_day_report, \
+    registrations_report
+
+# Clients may keep the reports, but must revalidate them (with the ETag or Last-Modified
+# header) before each use.
+revalidate = cache_control(max_age=0, no_cache=True, must_revalidate=True, private=True)
 
 urlpatterns = (
-    url(r'^election_day.json$', never_cache(election_day_report)),
-    url(r'^election_day_log.json$', never_cache(election_day_log)),
-    url(r'^registrations.json$', never_cache(registrations_report)),
+    url(r'^election_day.json$', revalidate(election_day_report)),
+    url(r'^election_day_log.json$', revalidate(election_day_log)),
+    url(r'^election_day_changes.json$', revalidate(election_day_changes)),
+    url(r'^registrations.json$', revalidate(registrations_report)),
 )
@@ -1,11 +1,17 @@
 # Python imports
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
 import datetime
 import logging
+import threading
 
 from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.backends.signals import connection_created
 from pytz import timezone
 
 # Project imports
+from libya_elections.utils import ConnectionInTZ
 from register.models import Office
 from .constants import COUNTRY, OFFICE, POLLING_CENTER_CODE, POLLING_CENTER_COPY_OF, \
     POLLING_CENTER_TYPE, REGION, SUBCONSTITUENCY_ID
@@ -17,47 +23,163 @@ logger = logging.getLogger(__name__)
 DEFAULT_DATE_TIME_COLUMNS = ('creation_date', )
 
 
-def dictfetchall(cursor, date_time_columns=DEFAULT_DATE_TIME_COLUMNS):
-    """Returns all rows from a cursor as a dict, and presents date/time columns
-    according to settings.TIME_ZONE.
+def dictfetchiter(cursor, date_time_columns=DEFAULT_DATE_TIME_COLUMNS):
+    """Yields the rows from a cursor as dicts, fetching them in batches of
+    settings.REPORT_CURSOR_ITERSIZE, and presents date/time columns according
+    to settings.TIME_ZONE.
 
     The simple form, when we don't have to change the presentation of
     any dates or times, is from the Django documentation, at
     https://docs.djangoproject.com/en/1.6/topics/db/sql/
     """
-    desc = cursor.description
-    result_columns = set([col[0] for col in desc])
     if date_time_columns is None:
         date_time_columns = ()
-    if result_columns.isdisjoint(set(date_time_columns)):
-        return [
-            dict(list(zip([col[0] for col in desc], row)))
-            for row in cursor.fetchall()
-        ]
-
     pres_tz = timezone(settings.TIME_ZONE)
-    result = []
     warned = []
-    for row in cursor.fetchall():
-        values = []
-        for i, col in enumerate(desc):
-            if col[0] in date_time_columns:
-                t = row[i]
-                if isinstance(t, datetime.datetime):
-                    t = t.astimezone(pres_tz)
+    columns = None
+    while True:
+        rows = cursor.fetchmany(settings.REPORT_CURSOR_ITERSIZE)
+        if not rows:
+            break
+        if columns is None:
+            # a server-side cursor has no description until the first fetch
+            columns = [col[0] for col in cursor.description]
+            convert = [col in date_time_columns for col in columns]
+            if not any(convert):
+                convert = None
+        for row in rows:
+            if convert is None:
+                yield dict(list(zip(columns, row)))
+                continue
+            values = []
+            for i, col in enumerate(columns):
+                if convert[i]:
+                    t = row[i]
+                    if isinstance(t, datetime.datetime):
+                        t = t.astimezone(pres_tz)
+                    else:
+                        if col not in warned:
+                            logging.warning('Column "%s" should be date/time but is %s' %
+                                            (col, type(t)))
+                            warned.append(col)
+                    values.append(t)
                 else:
-                    if col[0] not in warned:
-                        logging.warning('Column "%s" should be date/time but is %s' %
-                                        (col[0], type(t)))
-                        warned.append(col[0])
-                values.append(t)
-            else:
-                values.append(row[i])
-        result.append(dict(list(zip([col[0] for col in desc], values))))
-    return result
-
-
-def get_polling_centers(cursor, polling_locations):
+                    values.append(row[i])
+            yield dict(list(zip(columns, values)))
+
+
+def dictfetchall(cursor, date_time_columns=DEFAULT_DATE_TIME_COLUMNS):
+    """Returns all rows from a cursor as a dict, and presents date/time columns
+    according to settings.TIME_ZONE.
+    """
+    return list(dictfetchiter(cursor, date_time_columns))
+
+
+@contextmanager
+def streaming_cursor():
+    """Provides a cursor which keeps the result set on the database server and
+    fetches rows settings.REPORT_CURSOR_ITERSIZE at a time, instead of loading
+    the whole result set into memory on execute.
+
+    DATABASES sets DISABLE_SERVER_SIDE_CURSORS, since a cursor held open across
+    transactions doesn't survive transaction-level connection pooling, so the
+    server-side cursor is only used within its own transaction.  Set
+    settings.REPORT_SERVER_SIDE_CURSORS to False to use an ordinary cursor.
+    A server-side cursor can only execute a single query.
+    """
+    if not settings.REPORT_SERVER_SIDE_CURSORS:
+        yield connection.cursor()
+        return
+    with transaction.atomic():
+        cursor = connection.chunked_cursor()
+        cursor.cursor.itersize = settings.REPORT_CURSOR_ITERSIZE
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+
+@contextmanager
+def streaming_query(sql, params=None, date_time_columns=DEFAULT_DATE_TIME_COLUMNS,
+                    time_zone=None):
+    """Runs sql with a streaming_cursor() and provides an iterator over the resulting
+    rows as dicts (see dictfetchiter()), so that the rows can be fed straight into the
+    code which aggregates them.  The rows must be consumed within the with block,
+    which closes the cursor (and the transaction of a server-side cursor) when it
+    exits, whether or not all of them were.
+
+    time_zone: if set, the database connection time zone while fetching the rows
+    """
+    with ExitStack() as stack:
+        if time_zone:
+            stack.enter_context(ConnectionInTZ(connection.cursor(), time_zone))
+        cursor = stack.enter_context(streaming_cursor())
+        cursor.execute(sql, params)
+        yield dictfetchiter(cursor, date_time_columns)
+
+
+def _call_in_thread(func):
+    try:
+        return func()
+    finally:
+        # Django opens a database connection per thread; don't leave it open.
+        connections.close_all()
+
+
+def run_concurrently(funcs):
+    """Call each of the functions (which take no arguments) and return their results,
+    in the same order.
+
+    If settings.REPORT_QUERY_THREADS is greater than 1, the functions are called in
+    that many threads, each of which queries the database on its own connection.  The
+    functions must not depend on each other or on uncommitted changes in the caller's
+    transaction.
+    """
+    if settings.REPORT_QUERY_THREADS <= 1 or len(funcs) <= 1:
+        return [func() for func in funcs]
+    with ThreadPoolExecutor(max_workers=min(settings.REPORT_QUERY_THREADS,
+                                            len(funcs))) as executor:
+        futures = [executor.submit(_call_in_thread, func) for func in funcs]
+        return [future.result() for future in futures]
+
+
+class QueryCounter(object):
+    """Counts the queries run on every database connection, including those opened
+    by the threads of run_concurrently()."""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        for db_connection in connections.all():
+            self.install(db_connection)
+        connection_created.connect(self.install)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.install)
+        for db_connection in connections.all():
+            if self in db_connection.execute_wrappers:
+                db_connection.execute_wrappers.remove(self)
+
+
+def get_polling_centers(cursor, polling_locations, office_regions=None):
+    """Return election day data for each center in polling_locations.
+
+    office_regions: dict mapping office id to region, to avoid looking up each office
+    """
+    if office_regions is None:
+        office_regions = {office.id: office.region for office in Office.objects.all()}
     cursor.execute(query.CENTERS_AND_PHONES)
     polling_centers = {}
 
@@ -75,17 +197,17 @@ def get_polling_centers(cursor, polling_locations):
             if copy_of:
                 d[POLLING_CENTER_COPY_OF] = copy_of
             d[SUBCONSTITUENCY_ID] = subconstituency_id
-            region = Office.objects.get(id=office_id).region
-            d[REGION] = Office.REGION_NAMES[region]
-            d[COUNTRY] = 'Libya'
         except KeyError:
             # don't log missing invalid centers
             if center_id > 11000 and center_id not in [88888, 99999]:
                 logger.error("Polling center missing from codings: %s" % center_id)
             continue
-        except Office.DoesNotExist:
+        try:
+            d[REGION] = Office.REGION_NAMES[office_regions[office_id]]
+        except KeyError:
             logger.error("office_id missing from Office table: %s" % office_id)
             continue
+        d[COUNTRY] = 'Libya'
         polling_centers[int(center_id)] = d
 
     return polling_centers
@@ -1,12 +1,18 @@
 # Generates report JSON for vr-dashboard
 
 # Python imports
+from calendar import timegm
+import hashlib
 import json
 import logging
 
 # 3rd party imports
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.timezone import is_naive
+from pytz import timezone
 
 # Project imports
 from libya_elections.utils import basic_auth_view
@@ -16,7 +22,9 @@ from .reports import ELECTION_DAY_LOG_KEY, ELECTION_DAY_REPORT_KEY, \
     REGISTRATIONS_BY_COUNTRY_KEY, REGISTRATIONS_BY_OFFICE_KEY, \
     REGISTRATIONS_BY_POLLING_CENTER_KEY, REGISTRATIONS_BY_REGION_KEY, \
     REGISTRATIONS_BY_SUBCONSTITUENCY_KEY, REGISTRATIONS_METADATA_KEY, \
-    REGISTRATIONS_STATS_KEY, election_key, retrieve_report
+    REGISTRATIONS_STATS_KEY, election_key, parse_iso_datetime, resolve_report_keys, \
+    retrieve_center_changes, retrieve_encoded_reports
+from .serialization import decode_report, iter_report_json
 
 
 logger = logging.getLogger(__name__)
@@ -37,40 +45,135 @@ UNAVAILABLE_MSG = "Data is not yet available; please try again in a few minutes.
 UNAVAILABLE_MSG_TYPE = "text/plain"
 
 
+# The slices of the legacy registrations report, by the name used in the report
+REGISTRATIONS_REPORT_SLICES = (
+    ('by_subconstituency_id', REGISTRATIONS_BY_SUBCONSTITUENCY_KEY),
+    ('by_region', REGISTRATIONS_BY_REGION_KEY),
+    ('by_polling_center_code', REGISTRATIONS_BY_POLLING_CENTER_KEY),
+    ('by_office_id', REGISTRATIONS_BY_OFFICE_KEY),
+    ('by_country', REGISTRATIONS_BY_COUNTRY_KEY),
+)
+
+
 def report_unavailable():
     return HttpResponse(UNAVAILABLE_MSG, content_type=UNAVAILABLE_MSG_TYPE,
                         status=UNAVAILABLE_STATUS)
 
 
+def report_etag(redis_keys, last_updated=None):
+    """ Return the ETag for a response built from the reports stored under redis_keys
+    (as returned by resolve_report_keys()), which changes with each generation of the
+    reports. """
+    validator = '\n'.join(list(redis_keys) + [last_updated or ''])
+    return quote_etag(hashlib.sha1(validator.encode()).hexdigest())
+
+
+def report_last_modified(last_updated):
+    """ Return the Last-Modified timestamp for the last_updated time of a report. """
+    last_updated = parse_iso_datetime(last_updated)
+    if is_naive(last_updated):
+        # the reports record datetime.now(), in settings.TIME_ZONE
+        last_updated = timezone(settings.TIME_ZONE).localize(last_updated)
+    return timegm(last_updated.utctimetuple())
+
+
+def conditional_report_response(request, get_response, redis_keys, last_updated=None):
+    """ Return 304 Not Modified if the client already has the current generation of the
+    reports stored under redis_keys (according to If-None-Match or If-Modified-Since),
+    or else the response returned by get_response(), with the ETag and Last-Modified
+    headers the client can use to check next time. """
+    etag = report_etag(redis_keys, last_updated)
+    last_modified = report_last_modified(last_updated) if last_updated else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = get_response()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def stream_registrations_report(header, slices):
+    """ Yield the legacy registrations report as JSON, in pieces: the header (a dict
+    with the metadata and stats) followed by the slices, which are (name, stored report)
+    pairs and are passed on without being decoded. """
+    yield json.dumps(header).encode()[:-1]  # leave the object open for the slices
+    for name, value in slices:
+        yield (', %s: ' % json.dumps(name)).encode()
+        yield from iter_report_json(value)
+    yield b'}'
+
+
+def stream_report(value):
+    """ Return a streaming JSON response with a report as stored in Redis. """
+    return StreamingHttpResponse(iter_report_json(value), content_type='application/json')
+
+
 @basic_auth_view(REPORT_USER_DB, REPORT_REALM)
 def registrations_report(request):
     """
     Generates a JSON-formatted registrations report for use by vr-dashboard.
     Return 503 if the report is not available.
+
+    If settings.REPORT_STREAMING_RESPONSES is set, the slices are streamed to the client
+    as stored in Redis instead of being decoded and encoded again.
     """
-    # put together this legacy report from smaller slices in the report store
-    metadata = retrieve_report(REGISTRATIONS_METADATA_KEY)
-    stats = retrieve_report(REGISTRATIONS_STATS_KEY)
-    by_subconstituency = retrieve_report(REGISTRATIONS_BY_SUBCONSTITUENCY_KEY)
-    by_region = retrieve_report(REGISTRATIONS_BY_REGION_KEY)
-    by_polling_center = retrieve_report(REGISTRATIONS_BY_POLLING_CENTER_KEY)
-    by_office = retrieve_report(REGISTRATIONS_BY_OFFICE_KEY)
-    by_country = retrieve_report(REGISTRATIONS_BY_COUNTRY_KEY)
-    if None in [metadata, stats, by_subconstituency, by_region, by_polling_center, by_office,
-                by_country]:
+    # Put together this legacy report from smaller slices in the report store.  The
+    # keys are resolved once, and everything is retrieved from that generation of the
+    # reports, so that the body matches the ETag.
+    redis_keys = resolve_report_keys([REGISTRATIONS_METADATA_KEY, REGISTRATIONS_STATS_KEY]
+                                     + [key for name, key in REGISTRATIONS_REPORT_SLICES])
+    metadata, stats = retrieve_encoded_reports(redis_keys[:2])
+    if metadata is None or stats is None:
         # task hasn't built it yet
         return report_unavailable()
+    metadata = decode_report(metadata)
 
-    legacy_report = {**metadata, **stats}
-    legacy_report['by_subconstituency_id'] = by_subconstituency
-    legacy_report['by_region'] = by_region
-    legacy_report['by_polling_center_code'] = by_polling_center
-    legacy_report['by_office_id'] = by_office
-    legacy_report['by_country'] = by_country
-    del legacy_report['headline']
+    def get_response():
+        legacy_report = {**metadata, **decode_report(stats)}
+        del legacy_report['headline']
 
-    return HttpResponse(json.dumps(legacy_report, indent=1),
-                        content_type='application/json')
+        slices = retrieve_encoded_reports(redis_keys[2:])
+        if None in slices:
+            return report_unavailable()
+        names = [name for name, key in REGISTRATIONS_REPORT_SLICES]
+        if settings.REPORT_STREAMING_RESPONSES:
+            return StreamingHttpResponse(
+                stream_registrations_report(legacy_report, zip(names, slices)),
+                content_type='application/json')
+
+        for name, value in zip(names, slices):
+            legacy_report[name] = decode_report(value)
+        return HttpResponse(json.dumps(legacy_report, indent=1),
+                            content_type='application/json')
+
+    return conditional_report_response(request, get_response, redis_keys,
+                                       metadata['last_updated'])
+
+
+def election_report_response(request, key, **json_kwargs):
+    """ Return the response for a report of the most current election, or 503 if there
+    is no applicable election or the report is not available. """
+    election = Election.objects.get_most_current_election()
+    if election is None:
+        return report_unavailable()
+    key = election_key(key, election)
+    redis_keys = resolve_report_keys([key])
+
+    def get_response():
+        # retrieved from the generation the ETag is computed from
+        value = retrieve_encoded_reports(redis_keys)[0]
+        if value is None:
+            # task hasn't built it yet
+            return report_unavailable()
+        if settings.REPORT_STREAMING_RESPONSES:
+            return stream_report(value)
+        return HttpResponse(json.dumps(decode_report(value), indent=1, **json_kwargs),
+                            content_type='application/json')
+
+    return conditional_report_response(request, get_response, redis_keys)
 
 
 @basic_auth_view(REPORT_USER_DB, REPORT_REALM)
@@ -79,15 +182,7 @@ def election_day_report(request):
     Create JSON-formatted election day report for use by vr-dashboard.
     Return 503 if there is no applicable election or the report is not available.
     """
-    election = Election.objects.get_most_current_election()
-    if election is None:
-        return report_unavailable()
-    t = retrieve_report(election_key(ELECTION_DAY_REPORT_KEY, election))
-    if t is None:
-        # task hasn't built it yet
-        return report_unavailable()
-
-    return HttpResponse(json.dumps(t, indent=1), content_type='application/json')
+    return election_report_response(request, ELECTION_DAY_REPORT_KEY)
 
 
 @basic_auth_view(REPORT_USER_DB, REPORT_REALM)
@@ -96,13 +191,29 @@ def election_day_log(request):
     Generates a JSON-formatted log of all incoming daily report SMS for use by vr-dashboard.
     Return 503 if there is no applicable election or the log is not available.
     """
+    return election_report_response(request, ELECTION_DAY_LOG_KEY, cls=DateTimeEncoder)
+
+
+@basic_auth_view(REPORT_USER_DB, REPORT_REALM)
+def election_day_changes(request):
+    """
+    Generates a JSON-formatted list of the polling centers (as in the polling centers
+    table of the election day report) whose status has changed since the sequence
+    number passed as the "since" parameter, along with the current sequence number,
+    which the client passes next time.  Without "since", all centers are returned.
+    Return 503 if there is no applicable election or the report is not available.
+    """
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        return HttpResponseBadRequest('"since" must be a sequence number')
     election = Election.objects.get_most_current_election()
     if election is None:
         return report_unavailable()
-    t = retrieve_report(election_key(ELECTION_DAY_LOG_KEY, election))
-    if t is None:
+    sequence, centers = retrieve_center_changes(election, since)
+    if sequence is None:
         # task hasn't built it yet
         return report_unavailable()
 
-    return HttpResponse(json.dumps(t, indent=1, cls=DateTimeEncoder),
+    return HttpResponse(json.dumps({'since': since, 'sequence': sequence, 'centers': centers}),
                         content_type='application/json')
@@ -1,3 +1,4 @@
+import codecs
 import csv
 from io import StringIO
 from unittest.mock import patch
@@ -32,7 +33,7 @@ class CSVReportTest(TestCase):
         """
         self.rsp = self.client.get(url)
         if self.rsp.status_code == 200:
-            reader = csv.reader(StringIO(self.rsp.content.decode('utf-16')), delimiter='\t')
+            reader = csv.reader(StringIO(self.rsp.getvalue().decode('utf-16')), delimiter='\t')
             return list(reader)
 
     @patch('vr_dashboard.views.views.retrieve_report')
@@ -183,3 +184,22 @@ class CSVReportTest(TestCase):
         # There are 2 data rows, with each column converted to str
         self.assertEqual(rows[2], [str(item) for item in mock_phone_report[0]])
         self.assertEqual(rows[3], [str(item) for item in mock_phone_report[1]])
+
+    @patch('vr_dashboard.views.views.retrieve_report')
+    def test_large_csv_is_streamed(self, mock_retrieve_report):
+        mock_metadata_report = {
+            'last_updated': '2018-02-27',
+        }
+        mock_phone_report = [['9195%06d' % i, i] for i in range(5000)]
+        mock_retrieve_report.return_value = [mock_metadata_report, mock_phone_report]
+
+        self.rsp = self.client.get(reverse('vr_dashboard:phone-csv'))
+        self.assertTrue(self.rsp.streaming)
+        chunks = list(self.rsp.streaming_content)
+        self.assertGreater(len(chunks), 2)
+        # the BOM is sent once, at the start
+        self.assertEqual(codecs.BOM_UTF16_LE, chunks[0])
+        content = b''.join(chunks)
+        self.assertEqual(1, content.count(codecs.BOM_UTF16_LE))
+        rows = list(csv.reader(StringIO(content[2:].decode('utf-16le')), delimiter='\t'))
+        self.assertEqual(rows[2:], [[str(item) for item in row] for row in mock_phone_report])
@@ -134,7 +134,7 @@ class TestEndToEnd(TestCase):
             logger.info(extra)
         rsp = self.client.get(url, **extra)
         self.assertEqual(200, rsp.status_code)
-        logger.info(rsp.content)
+        logger.info(rsp.getvalue())
         return rsp
 
     def _request_csv(self, url, **extra):
@@ -145,7 +145,7 @@ class TestEndToEnd(TestCase):
         """
         url += '?format=csv'
         rsp = self._request(url, **extra)
-        content = rsp.content[2:]  # skip BOM
+        content = rsp.getvalue()[2:]  # skip BOM
         reader = csv.reader(StringIO(content.decode('utf-16-le')), delimiter='\t')
         rows = []
         for row in reader:
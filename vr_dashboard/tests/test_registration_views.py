@@ -1,19 +1,22 @@
 from datetime import timedelta
+from unittest.mock import patch
 
 # 3rd party imports
 from django.conf import settings
+from django.db import connection, transaction
 from django.test import TestCase
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
 from django.utils.timezone import now
 
 from libya_site.tests.factories import DEFAULT_USER_PASSWORD, UserFactory
-from register.models import Registration
+from register.models import Office, Registration
 from register.tests.factories import OfficeFactory, RegistrationCenterFactory
 from reporting_api import create_test_data, tasks
 from reporting_api.reports import empty_report_store
 from voting.models import Election
 from voting.tests.factories import ElectionFactory
+from vr_dashboard.views import views
 from vr_dashboard.views.views import ELECTION_SESSION_KEY
 
 URI_NAMESPACE = 'vr_dashboard:'
@@ -159,6 +162,88 @@ class TestRegistrationData(TestCase):
             rsp = self.client.get(uri)
             self.assertContains(rsp, str(invalid_id), status_code=404)
 
+    def test_election_day_center_pages(self):
+        assert self.client.login(username=self.staff_user.username, password=DEFAULT_USER_PASSWORD)
+        uri = reverse(URI_NAMESPACE + 'election-day-center')
+        rsp = self.client.get(uri + '?format=json&page_size=2')
+        self.assertEqual(200, rsp.status_code)
+        first_page = rsp.json()
+        self.assertEqual(2, len(first_page['centers']))
+        self.assertEqual((first_page['num_centers'] + 1) // 2, first_page['num_pages'])
+        rsp = self.client.get(uri + '?format=json&page_size=2&page=2')
+        self.assertEqual(2, rsp.json()['page'])
+        self.assertEqual(first_page['num_centers'], rsp.json()['num_centers'])
+        self.assertNotIn(first_page['centers'][0], rsp.json()['centers'])
+        for query in ('sort=name', 'page=0', 'page_size=100000', 'office=x', 'period=5'):
+            rsp = self.client.get(uri + '?' + query)
+            self.assertEqual(400, rsp.status_code, query)
+
+
+class TestPageContextCache(TestCase):
+
+    def setUp(self):
+        views.page_contexts.clear()
+        create_test_data.create(num_registrations=NUM_REGISTRATIONS)
+        tasks.registrations()
+        self.staff_user = UserFactory()
+        self.staff_user.is_staff = True
+        self.staff_user.save()
+        assert self.client.login(username=self.staff_user.username, password=DEFAULT_USER_PASSWORD)
+        self.uri = reverse(URI_NAMESPACE + 'offices')
+
+    def test_cached_until_regenerated(self):
+        rsp = self.client.get(self.uri)
+        with patch.object(views, 'finalize_offices_stats') as mock_finalize:
+            cached_rsp = self.client.get(self.uri)
+        self.assertFalse(mock_finalize.called)
+        self.assertIs(rsp.context['groups'], cached_rsp.context['groups'])
+        # a new generation of the reports replaces the context
+        tasks.registrations()
+        with patch.object(views, 'finalize_offices_stats',
+                          wraps=views.finalize_offices_stats) as mock_finalize:
+            rsp = self.client.get(self.uri)
+        self.assertTrue(mock_finalize.called)
+        self.assertEqual(200, rsp.status_code)
+
+    def test_cached_by_language(self):
+        self.client.get(self.uri)
+        self.client.cookies[settings.LANGUAGE_COOKIE_NAME] = 'ar'
+        self.client.get(self.uri)
+        self.assertEqual({'en', 'ar'}, {key[1] for key in views.page_contexts})
+
+    @override_settings(DASHBOARD_PAGE_CACHE_SIZE=0)
+    def test_cache_disabled(self):
+        self.client.get(self.uri)
+        self.assertEqual(0, len(views.page_contexts))
+
+
+@override_settings(HIDE_PUBLIC_DASHBOARD=False, DASHBOARD_PAGE_CACHE_SIZE=0)
+class TestNameDirectory(TestCase):
+
+    def setUp(self):
+        create_test_data.create(num_registrations=NUM_REGISTRATIONS)
+        tasks.registrations()
+
+    def test_no_name_queries(self):
+        for uri_name in PUBLIC_URI_NAMES:
+            uri = reverse(URI_NAMESPACE + uri_name)
+            self.client.get(uri)  # load the directory
+            with CaptureQueriesContext(connection) as queries:
+                rsp = self.client.get(uri)
+            self.assertEqual(200, rsp.status_code)
+            # Only the current election, for the base template, is queried.
+            self.assertEqual([], [query['sql'] for query in queries.captured_queries
+                                  if 'voting_election' not in query['sql']])
+
+    def test_renamed_office(self):
+        uri = reverse(URI_NAMESPACE + 'offices')
+        office = Office.objects.get(id=Registration.objects.first().registration_center.office_id)
+        self.assertContains(self.client.get(uri), office.name_english)
+        with patch.object(transaction, 'on_commit', side_effect=lambda func: func()):
+            office.name_english = 'Renamed office'
+            office.save()
+        self.assertContains(self.client.get(uri), 'Renamed office')
+
 
 class TestWithNoRegistrationData(TestCase):
 
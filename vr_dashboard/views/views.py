@@ -2,20 +2,23 @@
 import codecs
 from collections import defaultdict, OrderedDict
 import csv
-from datetime import datetime, timedelta
-import json
+from datetime import datetime
+from functools import partial
+from io import StringIO
 import logging
 import numbers
 import re
+import threading
 
 # 3rd party imports
 from django.conf import settings
 from django.contrib.auth.decorators import user_passes_test
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.template.defaultfilters import date as date_filter
 from django.urls import reverse
 from django.utils.timezone import now, utc
+from django.utils import translation
 from django.utils.translation import pgettext
 from django.utils.translation import ugettext as _
 
@@ -28,42 +31,42 @@ from register.models import Office, RegistrationCenter
 from register.utils import center_checkin_times
 from reporting_api.constants import INACTIVE_FOR_ELECTION, POLLING_CENTER_CODE, \
     POLLING_CENTER_COPY_OF, PRELIMINARY_VOTE_COUNTS
+from reporting_api.name_directory import get_name_directory
 from reporting_api.reports import calc_yesterday, election_key, \
+    election_day_office_table_key, election_day_offices_table_keys, \
     election_day_polling_center_log_key,\
     election_day_polling_center_table_key, parse_iso_datetime, printable_iso_datetime,\
-    retrieve_report, ELECTION_DAY_BY_COUNTRY_KEY, ELECTION_DAY_HQ_REPORTS_KEY, \
+    redis_key, resolve_report_keys, retrieve_polling_center_rows, \
+    retrieve_polling_centers_page, retrieve_report, \
+    ELECTION_DAY_BY_COUNTRY_KEY, \
+    ELECTION_DAY_HQ_REPORTS_KEY, \
     ELECTION_DAY_POLLING_CENTERS_TABLE_KEY, \
-    ELECTION_DAY_METADATA_KEY, ELECTION_DAY_OFFICES_TABLE_KEY, \
+    ELECTION_DAY_METADATA_KEY, \
     REGISTRATION_POINTS_CR_BY_COUNTRY_KEY, REGISTRATION_POINTS_NR_BY_COUNTRY_KEY, \
     REGISTRATION_POINTS_CR_BY_OFFICE_KEY, REGISTRATION_POINTS_NR_BY_OFFICE_KEY, \
     REGISTRATION_POINTS_CR_BY_REGION_KEY, REGISTRATION_POINTS_NR_BY_REGION_KEY, \
     REGISTRATION_POINTS_CR_BY_SUBCONSTITUENCY_KEY, REGISTRATION_POINTS_NR_BY_SUBCONSTITUENCY_KEY, \
-    REGISTRATIONS_BY_COUNTRY_KEY, REGISTRATIONS_BY_OFFICE_KEY, REGISTRATIONS_BY_REGION_KEY, \
+    REGISTRATIONS_BY_COUNTRY_KEY, REGISTRATIONS_BY_REGION_KEY, \
     REGISTRATIONS_BY_POLLING_CENTER_KEY, REGISTRATIONS_BY_PHONE_KEY, \
     REGISTRATIONS_BY_SUBCONSTITUENCY_KEY, REGISTRATIONS_CSV_COUNTRY_STATS_KEY, \
     REGISTRATIONS_CSV_OFFICE_STATS_KEY, REGISTRATIONS_CSV_REGION_STATS_KEY, \
     REGISTRATIONS_CSV_SUBCONSTITUENCY_STATS_KEY, REGISTRATIONS_METADATA_KEY, \
     REGISTRATIONS_OFFICE_STATS_KEY, REGISTRATIONS_REGION_STATS_KEY, REGISTRATIONS_STATS_KEY, \
     REGISTRATIONS_DAILY_BY_OFFICE_KEY, REGISTRATIONS_DAILY_BY_SUBCONSTITUENCY_KEY, \
-    REGISTRATIONS_SUBCONSTITUENCY_STATS_KEY
+    REGISTRATIONS_SUBCONSTITUENCY_STATS_KEY, REGISTRATIONS_CUMULATIVE_MESSAGES_KEY, \
+    REGISTRATIONS_WEEKLY_KEY
 from voting.models import Election
 from vr_dashboard.forms import StartEndReportForm
 
 logger = logging.getLogger(__name__)
 
-# The VR dashboard currently reports counts of registrations prior to
-# the Constitutional Drafting Assembly registration period.  The cutoff
-# date for that was 2014-04-23.  The CDA date could be edited here for
-# testing the pre-CDA counters with test data that only has newer
-# registration dates.
-#
-# The entire feature will presumably be removed in the future.
-CDA_DATE_STR = '2014-04-23'
-CDA_DATE = datetime.strptime(CDA_DATE_STR, '%Y-%m-%d')
-
 UNUSED_CENTER_ID = 99999999  # valid syntactically, but not used in actual data
 FORMAT_QUERY_ARG = 'format'  # query argument to control response format on some pages
 ELECTION_QUERY_ARG = 'election'  # query argument to select election by id
+CSV_CHUNK_SIZE = 32768  # characters of CSV to buffer before streaming them
+WEEKLY_NUM_WEEKS = 4  # weeks shown on the weekly page
+# the fields of reporting_api.reports.polling_centers_index() the center list can sort by
+CENTER_LIST_SORT_FIELDS = ('code', 'office_id', 'registrations', 'opened')
 # if the data format changes, bump the version number
 ELECTION_SESSION_KEY = 'SelElectV1'
 
@@ -77,6 +80,11 @@ PERIOD_VOTES_REPORTED_MESSAGE = _("Period {period} Votes Reported: {count}")
 #           "none": ["", "", "", ""]}
 COLORS = {}
 
+# Template contexts of the dashboard pages, by page, language, election and report
+# generations (see page_context())
+page_contexts = OrderedDict()
+page_contexts_lock = threading.Lock()
+
 
 def quartile(arr, val):
     """ Return the quartile (0-3) of val in arr. """
@@ -151,6 +159,45 @@ def handle_missing_election_report(request, election, page_flag):
                                  template='vr_dashboard/polling_error.html')
 
 
+def page_context(page_flag, keys, build_context, election=None):
+    """
+    Return the template context of a page, as computed by build_context() from the
+    reports with the specified keys, or None if any of the reports are missing.
+
+    The contexts are cached for the current generation of the reports (see
+    reporting_api.reports.ReportWriter), so that they are only computed again once
+    the reports are regenerated.  Up to settings.DASHBOARD_PAGE_CACHE_SIZE contexts
+    are kept in a process-local cache, by page, language, and election (for
+    election day pages).  They're also computed again when the names of the offices
+    etc. change (see reporting_api.name_directory).  The returned context is shared
+    with other requests and must not be modified; per-request values should be added
+    to a copy.
+
+    build_context: function called with the reports, in the order of the keys
+    """
+    redis_keys = resolve_report_keys(keys)
+    # Reports without a generation can't be told apart from their replacements.
+    cacheable = settings.DASHBOARD_PAGE_CACHE_SIZE and \
+        all(resolved != redis_key(key) for key, resolved in zip(keys, redis_keys))
+    if cacheable:
+        cache_key = (page_flag, translation.get_language(), election.id if election else None,
+                     tuple(redis_keys), get_name_directory().version)
+        with page_contexts_lock:
+            if cache_key in page_contexts:
+                page_contexts.move_to_end(cache_key)
+                return page_contexts[cache_key]
+    reports = retrieve_report(keys)
+    if reports[0] is None:
+        return None
+    context = build_context(*reports)
+    if cacheable:
+        with page_contexts_lock:
+            page_contexts[cache_key] = context
+            while len(page_contexts) > settings.DASHBOARD_PAGE_CACHE_SIZE:
+                page_contexts.popitem(last=False)
+    return context
+
+
 # public page
 def redirect_to_national(request):
     return redirect('vr_dashboard:national')
@@ -161,82 +208,85 @@ def national(request):
     if should_hide_public_view(request):
         return redirect(settings.PUBLIC_REDIRECT_URL)
     page_flag = 'national_page'
-    by_country, metadata, raw_stats, nr_by_country, cr_by_country = \
-        retrieve_report([REGISTRATIONS_BY_COUNTRY_KEY,
-                         REGISTRATIONS_METADATA_KEY,
-                         REGISTRATIONS_STATS_KEY,
-                         REGISTRATION_POINTS_NR_BY_COUNTRY_KEY,
-                         REGISTRATION_POINTS_CR_BY_COUNTRY_KEY])
-    if by_country is None:
-        return handle_missing_report(request, page_flag)
 
-    last_updated = parse_iso_datetime(metadata['last_updated'])
-    # Just keep country-wide data for first country in list.
-    # A visual redesign is needed to support more than one country, since
-    # the country is in <thead></thead>.
-    country_wide_data = by_country[0] if by_country else {}
-    country_name = country_wide_data['country'] \
-        if 'country' in country_wide_data else 'no data available'
-
-    age_groupings = metadata['demographic_breakdowns']['by_age']
-    dates = metadata['dates']
-    yesterday_date, yesterday_date_str = calc_yesterday(dates)
+    def build_context(by_country, metadata, raw_stats, nr_by_country, cr_by_country):
+        last_updated = parse_iso_datetime(metadata['last_updated'])
+        # Just keep country-wide data for first country in list.
+        # A visual redesign is needed to support more than one country, since
+        # the country is in <thead></thead>.
+        country_wide_data = by_country[0] if by_country else {}
+        country_name = country_wide_data['country'] \
+            if 'country' in country_wide_data else 'no data available'
+
+        age_groupings = metadata['demographic_breakdowns']['by_age']
+        dates = metadata['dates']
+        yesterday_date, yesterday_date_str = calc_yesterday(dates)
+
+        by_age = []
+        for age in age_groupings:
+            age_count = country_wide_data.get(age, 0)
+            by_age.append((age, age_count))
+
+        totals = [0, 0]  # male and female
+        for d in dates:
+            for i in range(len(totals)):
+                try:
+                    totals[i] += country_wide_data[d][i]
+                except KeyError:
+                    raise Exception("Bug 951: d: %s, dates: %r, country_wide_data: %r" %
+                                    (d, dates, country_wide_data))
+
+        yesterday_totals = country_wide_data[yesterday_date_str] if yesterday_date_str else [0, 0]
+
+        groups = [{'name': country_name,
+                   'm': totals[0],
+                   'm_color': cell_color_by_quartile("blue", [totals[0]], totals[0]),
+                   'f': totals[1],
+                   'f_color': cell_color_by_quartile("pink", [totals[1]], totals[1]),
+                   't': sum(totals),
+                   't_color': cell_color_by_quartile("purple", [sum(totals)], sum(totals)),
+                   'm_yesterday': yesterday_totals[0],
+                   'm_yesterday_color':
+                   cell_color_by_quartile("blue", [yesterday_totals[0]], yesterday_totals[0]),
+                   'f_yesterday': yesterday_totals[1],
+                   'f_yesterday_color':
+                   cell_color_by_quartile("pink", [yesterday_totals[1]], yesterday_totals[1]),
+                   't_yesterday': sum(yesterday_totals),
+                   't_yesterday_color':
+                   cell_color_by_quartile("purple", [sum(yesterday_totals)], sum(yesterday_totals)),
+                   }]
+        headline = build_headline(last_updated, raw_stats['headline'])
+        return {
+            'country': country_name,
+            'by_age': by_age,
+            'nr_by_country': nr_by_country,
+            'cr_by_country': cr_by_country,
+            'new_reg_chart': True,
+            'cum_reg_chart': True,
+            'yesterday': yesterday_date.strftime('%d/%m') if yesterday_date else '',
+            'groups': groups,
+            page_flag: True,
+            'registration_stats_page': True,
+            'headline_stats': headline,
+            'last_updated': last_updated
+        }
 
-    by_age = []
-    for age in age_groupings:
-        age_count = country_wide_data.get(age, 0)
-        by_age.append((age, age_count))
-
-    totals = [0, 0]  # male and female
-    for d in dates:
-        for i in range(len(totals)):
-            try:
-                totals[i] += country_wide_data[d][i]
-            except KeyError:
-                raise Exception("Bug 951: d: %s, dates: %r, country_wide_data: %r" %
-                                (d, dates, country_wide_data))
-
-    yesterday_totals = country_wide_data[yesterday_date_str] if yesterday_date_str else [0, 0]
-
-    groups = [{'name': country_name,
-               'm': totals[0],
-               'm_color': cell_color_by_quartile("blue", [totals[0]], totals[0]),
-               'f': totals[1],
-               'f_color': cell_color_by_quartile("pink", [totals[1]], totals[1]),
-               't': sum(totals),
-               't_color': cell_color_by_quartile("purple", [sum(totals)], sum(totals)),
-               'm_yesterday': yesterday_totals[0],
-               'm_yesterday_color':
-               cell_color_by_quartile("blue", [yesterday_totals[0]], yesterday_totals[0]),
-               'f_yesterday': yesterday_totals[1],
-               'f_yesterday_color':
-               cell_color_by_quartile("pink", [yesterday_totals[1]], yesterday_totals[1]),
-               't_yesterday': sum(yesterday_totals),
-               't_yesterday_color':
-               cell_color_by_quartile("purple", [sum(yesterday_totals)], sum(yesterday_totals)),
-               }]
-    headline = build_headline(last_updated, raw_stats['headline'])
-    template_args = {
-        'country': country_name,
-        'by_age': by_age,
-        'nr_by_country': nr_by_country,
-        'cr_by_country': cr_by_country,
-        'new_reg_chart': True,
-        'cum_reg_chart': True,
-        'yesterday': yesterday_date.strftime('%d/%m') if yesterday_date else '',
-        'groups': groups,
-        page_flag: True,
-        'registration_stats_page': True,
-        'headline_stats': headline,
-        'last_updated': last_updated
-    }
+    template_args = page_context(page_flag,
+                                 [REGISTRATIONS_BY_COUNTRY_KEY,
+                                  REGISTRATIONS_METADATA_KEY,
+                                  REGISTRATIONS_STATS_KEY,
+                                  REGISTRATION_POINTS_NR_BY_COUNTRY_KEY,
+                                  REGISTRATION_POINTS_CR_BY_COUNTRY_KEY],
+                                 build_context)
+    if template_args is None:
+        return handle_missing_report(request, page_flag)
     return render(request, 'vr_dashboard/national.html', template_args)
 
 
 def finalize_offices_stats(stats):
     keys_in_order = sorted([int(k) for k in stats.keys() if k != 'total'])
 
-    office_objects = Office.objects.filter(id__in=keys_in_order)
+    offices = get_name_directory().offices
     males_by_office = []
     females_by_office = []
     total_by_office = []
@@ -245,10 +295,10 @@ def finalize_offices_stats(stats):
     total_yesterday_by_office = []
 
     office_info = []
-    for offices_index, office_id in enumerate(keys_in_order):
-        oi = stats[str(office_id)]
+    for office_id in keys_in_order:
+        oi = dict(stats[str(office_id)])
         office_info.append(oi)
-        oi['name'] = office_objects[offices_index].name
+        oi['name'] = offices[office_id].name
         oi['pct_f'] = fmt_percent(oi['f'], oi['t'])
         oi['pct_f_yesterday'] = \
             fmt_percent(oi['f_yesterday'], oi['t_yesterday'])
@@ -261,7 +311,7 @@ def finalize_offices_stats(stats):
         females_yesterday_by_office.append(oi['f_yesterday'])
         total_yesterday_by_office.append(oi['m_yesterday'] + oi['f_yesterday'])
 
-    totals = stats['total']
+    totals = dict(stats['total'])
 
     totals['pct_f'] = fmt_percent(totals['f'], totals['t'])
     totals['pct_f_yesterday'] = fmt_percent(totals['f_yesterday'], totals['t_yesterday'])
@@ -306,32 +356,35 @@ def offices(request):
     if should_hide_public_view(request):
         return redirect(settings.PUBLIC_REDIRECT_URL)
     page_flag = 'offices_page'
-    metadata, office_stats, raw_stats, nr_by_office, cr_by_office = \
-        retrieve_report([REGISTRATIONS_METADATA_KEY,
-                         REGISTRATIONS_OFFICE_STATS_KEY,
-                         REGISTRATIONS_STATS_KEY,
-                         REGISTRATION_POINTS_NR_BY_OFFICE_KEY,
-                         REGISTRATION_POINTS_CR_BY_OFFICE_KEY])
-    if metadata is None:
-        return handle_missing_report(request, page_flag)
 
-    last_updated = parse_iso_datetime(metadata['last_updated'])
-    dates = metadata['dates']
-    yesterday_date, yesterday_date_str = calc_yesterday(dates)
-    office_info, totals = finalize_offices_stats(office_stats)
-
-    headline = build_headline(last_updated, raw_stats['headline'])
-    template_args = {'groups': office_info,
-                     'yesterday': yesterday_date.strftime('%d/%m') if yesterday_date else '',
-                     'totals': totals,
-                     page_flag: True,
-                     'registration_stats_page': True,
-                     'headline_stats': headline,
-                     'nr': nr_by_office,
-                     'cr': cr_by_office,
-                     'new_reg_chart': True,
-                     'cum_reg_chart': True,
-                     'last_updated': last_updated}
+    def build_context(metadata, office_stats, raw_stats, nr_by_office, cr_by_office):
+        last_updated = parse_iso_datetime(metadata['last_updated'])
+        dates = metadata['dates']
+        yesterday_date, yesterday_date_str = calc_yesterday(dates)
+        office_info, totals = finalize_offices_stats(office_stats)
+
+        headline = build_headline(last_updated, raw_stats['headline'])
+        return {'groups': office_info,
+                'yesterday': yesterday_date.strftime('%d/%m') if yesterday_date else '',
+                'totals': totals,
+                page_flag: True,
+                'registration_stats_page': True,
+                'headline_stats': headline,
+                'nr': nr_by_office,
+                'cr': cr_by_office,
+                'new_reg_chart': True,
+                'cum_reg_chart': True,
+                'last_updated': last_updated}
+
+    template_args = page_context(page_flag,
+                                 [REGISTRATIONS_METADATA_KEY,
+                                  REGISTRATIONS_OFFICE_STATS_KEY,
+                                  REGISTRATIONS_STATS_KEY,
+                                  REGISTRATION_POINTS_NR_BY_OFFICE_KEY,
+                                  REGISTRATION_POINTS_CR_BY_OFFICE_KEY],
+                                 build_context)
+    if template_args is None:
+        return handle_missing_report(request, page_flag)
     return render(request, 'vr_dashboard/offices.html', template_args)
 
 
@@ -340,195 +393,117 @@ def offices_detail(request):
     """ Like offices(), but omits %female from cumulative-totals and last-day total and adds
     a column for each age breakdown. """
     page_flag = 'offices_detail_page'
-    metadata, office_stats, raw_stats, nr_by_office, cr_by_office = \
-        retrieve_report([REGISTRATIONS_METADATA_KEY,
-                         REGISTRATIONS_OFFICE_STATS_KEY,
-                         REGISTRATIONS_STATS_KEY,
-                         REGISTRATION_POINTS_NR_BY_OFFICE_KEY,
-                         REGISTRATION_POINTS_CR_BY_OFFICE_KEY])
-    if metadata is None:
-        return handle_missing_report(request, page_flag)
 
-    last_updated = parse_iso_datetime(metadata['last_updated'])
-    age_groupings = metadata['demographic_breakdowns']['by_age']
-    dates = metadata['dates']
-    yesterday_date, yesterday_date_str = calc_yesterday(dates)
-    office_info, totals = finalize_offices_stats(office_stats)
-
-    headline = build_headline(last_updated, raw_stats['headline'])
-    template_args = {'office_info': office_info,
-                     'yesterday': yesterday_date.strftime('%d/%m') if yesterday_date else '',
-                     'age_groupings': age_groupings,
-                     'totals': totals,
-                     page_flag: True,
-                     'registration_stats_page': True,
-                     'headline_stats': headline,
-                     'nr': nr_by_office,
-                     'cr': cr_by_office,
-                     'new_reg_chart': True,
-                     'cum_reg_chart': True,
-                     'last_updated': last_updated}
+    def build_context(metadata, office_stats, raw_stats, nr_by_office, cr_by_office):
+        last_updated = parse_iso_datetime(metadata['last_updated'])
+        age_groupings = metadata['demographic_breakdowns']['by_age']
+        dates = metadata['dates']
+        yesterday_date, yesterday_date_str = calc_yesterday(dates)
+        office_info, totals = finalize_offices_stats(office_stats)
+
+        headline = build_headline(last_updated, raw_stats['headline'])
+        return {'office_info': office_info,
+                'yesterday': yesterday_date.strftime('%d/%m') if yesterday_date else '',
+                'age_groupings': age_groupings,
+                'totals': totals,
+                page_flag: True,
+                'registration_stats_page': True,
+                'headline_stats': headline,
+                'nr': nr_by_office,
+                'cr': cr_by_office,
+                'new_reg_chart': True,
+                'cum_reg_chart': True,
+                'last_updated': last_updated}
+
+    template_args = page_context(page_flag,
+                                 [REGISTRATIONS_METADATA_KEY,
+                                  REGISTRATIONS_OFFICE_STATS_KEY,
+                                  REGISTRATIONS_STATS_KEY,
+                                  REGISTRATION_POINTS_NR_BY_OFFICE_KEY,
+                                  REGISTRATION_POINTS_CR_BY_OFFICE_KEY],
+                                 build_context)
+    if template_args is None:
+        return handle_missing_report(request, page_flag)
     return render(request, 'vr_dashboard/offices_detail.html', template_args)
 
 
 @user_passes_test(lambda user: user.is_staff)
 def weekly(request):
     page_flag = 'weekly_page'
-    office_breakdowns, metadata, raw_stats, nr_by_country = \
-        retrieve_report([REGISTRATIONS_BY_OFFICE_KEY,
-                         REGISTRATIONS_METADATA_KEY,
-                         REGISTRATIONS_STATS_KEY,
-                         REGISTRATION_POINTS_NR_BY_COUNTRY_KEY])
-    if office_breakdowns is None:
-        return handle_missing_report(request, page_flag)
-
-    last_updated = parse_iso_datetime(metadata['last_updated'])
-
-    office_info = [{'id': ob['office_id']} for ob in office_breakdowns]
-    for oi in office_info:
-        oi['name'] = Office.objects.get(id=oi['id']).name
-
-    dates = metadata['dates']
-    if dates:
-        last_7 = dates[-7:]  # smaller during first week
-        last_7_fmt = [datetime.strptime(d, '%Y-%m-%d').strftime('%d/%m') for d in last_7]
-        last_7_indexes = [i for i in range(len(last_7))]
-
-        # get date ranges for last <= 4 weeks
-        #
-        # if the last date is Thursday, March 20, the last week will be the enclosing
-        # Sunday-Saturday, or March 16-22.
-        start_day = datetime.strptime(dates[0], '%Y-%m-%d')
-        last_day = datetime.strptime(dates[-1], '%Y-%m-%d')
-        end_of_last_week = last_day + timedelta((12 - last_day.weekday()) % 7)
-        start_of_last_week = end_of_last_week - timedelta(6)
-
-        last_four_weeks = []
-        last_four_weeks_fmt = []
-        cur_start = start_of_last_week
-        while len(last_four_weeks) < 4:
-            end_of_cur_week = cur_start + timedelta(6)
-            if start_day > end_of_cur_week:
-                break
-            last_four_weeks.append((cur_start, end_of_cur_week))
-            last_four_weeks_fmt.append((cur_start.strftime('%d/%m'),
-                                        end_of_cur_week.strftime('%d/%m')))
-            cur_start -= timedelta(7)
-        last_four_weeks = list(reversed(last_four_weeks))
-        last_four_weeks_fmt = list(reversed(last_four_weeks_fmt))
-    else:
-        last_four_weeks = last_four_weeks_fmt = last_7 = last_7_fmt = last_7_indexes = []
-
-    # across all offices, we need to get this data:
-    #   male+female for each of last 7 days
-    #   male+female for each of last 4 weeks
-    #   male+female [prior to CDA date
-    #   cumulative_male
-    #   cumulative_female
-
-    global_info = {'last_seven': [0] * len(last_7),
-                   'last_four_weeks': [0] * len(last_four_weeks),
-                   'yesterday': 0,
-                   'male': 0,
-                   'female': 0,
-                   'pre_cda': 0}
-
-    for i, ob in enumerate(office_breakdowns):
-        oi = office_info[i]
-
-        # for each office, we need to get this data:
-        #   male+female for each of last 7 days
-        #   male+female for each of last 4 weeks
-        #   male+female prior to CDA date
-        #   cumulative male
-        #   cumulative female
-        # from cumulative-male and cumulative-female we'll make the
-        # trivial calculations of percent-female and total
-
-        total_male = total_female = 0
-        last_7_totals = []
-        pre_cda_total = 0
-
-        oi['last_four_weeks'] = [0] * len(last_four_weeks)
-
-        if dates:
-            yesterday_date, yesterday_date_str = calc_yesterday(dates)
-
-        for d in dates:
-            d_dt = datetime.strptime(d, '%Y-%m-%d')
-            if d in ob:
-                date_males, date_females = ob[d]
-            else:
-                date_males, date_females = 0, 0
-            total_male += date_males
-            total_female += date_females
-
-            if d == yesterday_date_str:
-                global_info['yesterday'] += date_males + date_females
-
-            if d in last_7:
-                last_7_totals.append(date_males + date_females)
-                global_info['last_seven'][last_7.index(d)] += date_males + date_females
-
-            if d_dt < CDA_DATE:
-                pre_cda_total += date_males + date_females
-
-            for j, date_range in enumerate(last_four_weeks):
-                if date_range[0] <= d_dt <= date_range[1]:
-                    oi['last_four_weeks'][j] += date_males + date_females
-                    global_info['last_four_weeks'][j] += date_males + date_females
-
-        oi['last_seven'] = last_7_totals
-
-        oi['pre_cda'] = pre_cda_total
-        global_info['pre_cda'] += pre_cda_total
-
-        oi['last_seven_colors'] = []
-        for j in range(len(last_7_totals)):
-            oi['last_seven_colors'].append(cell_color_by_quartile("orange", last_7_totals,
-                                                                  last_7_totals[j]))
 
-        total = total_male + total_female
-        oi['total'] = total
-        oi['pct_female'] = 0.0 if total == 0 else float(total_female) / total
-        oi['pct_female_fmt'] = fmt_percent(total_female, total)
-
-        global_info['male'] += total_male
-        global_info['female'] += total_female
-
-    global_info['total'] = global_info['male'] + global_info['female']
-    global_info['pct_female_fmt'] = fmt_percent(global_info['female'], global_info['total'])
-    global_info['pct_male_fmt'] = fmt_percent(global_info['male'], global_info['total'])
-
-    # now go back and color cells
-
-    global_info['last_seven_colors'] = []
-    for i in range(len(last_7)):
-        global_info['last_seven_colors']\
-            .append(cell_color_by_quartile("orange",
-                                           global_info['last_seven'],
-                                           global_info['last_seven'][i]))
-    row_totals = [oi['total'] for _oi in office_info]
-    pct_female = [oi['pct_female'] for _oi in office_info]
-    for oi in office_info:
-        oi['total_color'] = cell_color_by_quartile("blue", row_totals, oi['total'])
-        oi['pct_female_color'] = cell_color_by_quartile("pink", pct_female, oi['pct_female'])
-
-    headline = build_headline(last_updated, raw_stats['headline'])
-    template_args = {'office_info': office_info,
-                     'global_info': global_info,
-                     'last_seven': last_7_fmt,
-                     'last_seven_indexes': last_7_indexes,
-                     'last_seven_actual': len(last_7_indexes),
-                     'last_four_weeks': last_four_weeks_fmt,
-                     'num_weeks': len(last_four_weeks),
-                     'num_weeks_range': list(range(len(last_four_weeks))),
-                     page_flag: True,
-                     'registration_stats_page': True,
-                     'nr': nr_by_country,
-                     'new_reg_chart': True,
-                     'headline_stats': headline,
-                     'last_updated': last_updated}
+    def build_context(weekly, metadata, raw_stats, nr_by_country):
+        # The aggregates are precomputed by reporting_api.reports.calc_weekly_registrations();
+        # just format them.
+        last_updated = parse_iso_datetime(metadata['last_updated'])
+        offices = get_name_directory().offices
+
+        last_7_fmt = [datetime.strptime(d, '%Y-%m-%d').strftime('%d/%m')
+                      for d in weekly['last_seven_dates']]
+        last_7_indexes = [i for i in range(len(last_7_fmt))]
+        weeks = weekly['weeks'][-WEEKLY_NUM_WEEKS:]
+        last_four_weeks_fmt = [tuple(datetime.strptime(d, '%Y-%m-%d').strftime('%d/%m')
+                                     for d in week)
+                               for week in weeks]
+
+        def row_info(totals):
+            info = {'last_seven': totals['last_seven'],
+                    'last_four_weeks': totals['weeks'][-WEEKLY_NUM_WEEKS:],
+                    'pre_cda': totals['pre_cda'],
+                    'male': totals['male'],
+                    'female': totals['female'],
+                    'total': totals['male'] + totals['female']}
+            info['last_seven_colors'] = [
+                cell_color_by_quartile("orange", info['last_seven'], count)
+                for count in info['last_seven']]
+            return info
+
+        office_info = []
+        for office in weekly['by_office']:
+            oi = row_info(office)
+            oi['id'] = office['office_id']
+            oi['name'] = offices[oi['id']].name
+            total = oi['total']
+            oi['pct_female'] = 0.0 if total == 0 else float(oi['female']) / total
+            oi['pct_female_fmt'] = fmt_percent(oi['female'], total)
+            office_info.append(oi)
+
+        global_info = row_info(weekly['country'])
+        global_info['yesterday'] = global_info['last_seven'][-1] if last_7_fmt else 0
+        global_info['pct_female_fmt'] = fmt_percent(global_info['female'], global_info['total'])
+        global_info['pct_male_fmt'] = fmt_percent(global_info['male'], global_info['total'])
+
+        # now go back and color cells
+        row_totals = [oi['total'] for _oi in office_info]
+        pct_female = [oi['pct_female'] for _oi in office_info]
+        for oi in office_info:
+            oi['total_color'] = cell_color_by_quartile("blue", row_totals, oi['total'])
+            oi['pct_female_color'] = cell_color_by_quartile("pink", pct_female, oi['pct_female'])
+
+        headline = build_headline(last_updated, raw_stats['headline'])
+        template_args = {'office_info': office_info,
+                         'global_info': global_info,
+                         'last_seven': last_7_fmt,
+                         'last_seven_indexes': last_7_indexes,
+                         'last_seven_actual': len(last_7_indexes),
+                         'last_four_weeks': last_four_weeks_fmt,
+                         'num_weeks': len(weeks),
+                         'num_weeks_range': list(range(len(weeks))),
+                         page_flag: True,
+                         'registration_stats_page': True,
+                         'nr': nr_by_country,
+                         'new_reg_chart': True,
+                         'headline_stats': headline,
+                         'last_updated': last_updated}
+        return template_args
+
+    template_args = page_context(page_flag,
+                                 [REGISTRATIONS_WEEKLY_KEY,
+                                  REGISTRATIONS_METADATA_KEY,
+                                  REGISTRATIONS_STATS_KEY,
+                                  REGISTRATION_POINTS_NR_BY_COUNTRY_KEY],
+                                 build_context)
+    if template_args is None:
+        return handle_missing_report(request, page_flag)
     return render(request, 'vr_dashboard/weekly.html', template_args)
 
 
@@ -549,7 +524,7 @@ def last_seven_dates(dates):
     return dates[-7:]
 
 
-def compute_message_stats(stats, dates):
+def compute_message_stats(cumulative, dates):
     """ Return the following stats for SMS messages of a particular
     type:
         overall count
@@ -557,19 +532,20 @@ def compute_message_stats(stats, dates):
         count for "yesterday"
         date of "yesterday" in %d/%m format
 
-    The input dictionary stats has counts for dates, though not
-    necessarily for any particular date.  The date keys are of the form
-    '%Y-%m-%d' and potential dates are given in the input list dates.
+    The input list cumulative has the cumulative count of messages through
+    each of the dates (see reporting_api.reports.calc_cumulative_messages()),
+    which are of the form '%Y-%m-%d'.
     """
+    def count_through(index):
+        return cumulative[index - 1] if index > 0 else 0
+
     yesterday_date, yesterday_date_str = calc_yesterday(dates)
     last_week = last_seven_dates(dates)
-    all_counts_by_date = [stats.get(date, 0) for date in dates]
-    total = sum(all_counts_by_date)
-    counts_for_last_seven_dates = [stats.get(date, 0) for date in last_week]
-    total_last_7 = sum(counts_for_last_seven_dates)
-    stats = {'total_last_7': total_last_7,
-             'total': total,
-             'last': stats.get(yesterday_date_str, 0),
+    # the index after the last of last_week, which may leave out today
+    end = len(dates) - 1 if dates and last_week[-1:] != dates[-1:] else len(dates)
+    stats = {'total_last_7': count_through(end) - count_through(end - len(last_week)),
+             'total': count_through(len(dates)),
+             'last': count_through(len(dates)) - count_through(len(dates) - 1),
              'last_date': yesterday_date.strftime('%d/%m') if yesterday_date else ''
              }
     return stats
@@ -578,19 +554,21 @@ def compute_message_stats(stats, dates):
 @user_passes_test(lambda user: user.is_staff)
 def sms(request):
     page_flag = 'sms_page'
-    raw_stats, metadata = retrieve_report([REGISTRATIONS_STATS_KEY,
-                                           REGISTRATIONS_METADATA_KEY])
+    raw_stats, metadata, cumulative_messages = \
+        retrieve_report([REGISTRATIONS_STATS_KEY,
+                         REGISTRATIONS_METADATA_KEY,
+                         REGISTRATIONS_CUMULATIVE_MESSAGES_KEY])
     if raw_stats is None:
         return handle_missing_report(request, page_flag)
 
     last_updated = parse_iso_datetime(metadata['last_updated'])
-    sms_stats = compute_message_stats(raw_stats['sms_stats']['messages'], metadata['dates'])
+    sms_stats = compute_message_stats(cumulative_messages['messages'], metadata['dates'])
 
     # Compute summary stats for each SMS message type present in the dictionary.
     # SMS message types with no matching messages (for MESSAGES_QUERY) won't be present.
     stats_by_sms_type = []
-    for sms_type, raw in raw_stats['message_stats'].items():
-        computed = compute_message_stats(raw, metadata['dates'])
+    for sms_type, cumulative in cumulative_messages['by_type'].items():
+        computed = compute_message_stats(cumulative, metadata['dates'])
         computed['translated_sms_type'] = _(sms_type)
         stats_by_sms_type.append(computed)
 
@@ -714,32 +692,31 @@ def cells_by_region(language_code, table, stats, metadata, page_flag):
     return region_info, total_data, last_region
 
 
-def report_regional_grouping(request, grouping, region_stats, metadata, raw_stats, page_flag,
-                             nr, cr):
+def regional_grouping_context(language_code, page_flag, grouping, metadata, raw_stats,
+                              region_stats, nr, cr):
     dates = metadata['dates']
     yesterday_date, yesterday_date_str = calc_yesterday(dates)
 
     age_groupings = metadata['demographic_breakdowns']['by_age']
     last_updated = parse_iso_datetime(metadata['last_updated'])
 
-    region_info, total_data, last_region = cells_by_region(request.LANGUAGE_CODE, grouping,
+    region_info, total_data, last_region = cells_by_region(language_code, grouping,
                                                            region_stats, metadata, page_flag)
 
     headline = build_headline(last_updated, raw_stats['headline'])
-    template_args = {'stats': region_stats,
-                     'regions': region_info,
-                     'yesterday': yesterday_date.strftime('%d/%m') if yesterday_date else '',
-                     'headline_stats': headline,
-                     'nr': nr,
-                     'cr': cr,
-                     'new_reg_chart': True,
-                     'cum_reg_chart': True,
-                     'totals': total_data,
-                     'age_groupings': age_groupings,
-                     page_flag: True,
-                     'registration_stats_page': True,
-                     'last_updated': last_updated}
-    return render(request, 'vr_dashboard/regions.html', template_args)
+    return {'stats': region_stats,
+            'regions': region_info,
+            'yesterday': yesterday_date.strftime('%d/%m') if yesterday_date else '',
+            'headline_stats': headline,
+            'nr': nr,
+            'cr': cr,
+            'new_reg_chart': True,
+            'cum_reg_chart': True,
+            'totals': total_data,
+            'age_groupings': age_groupings,
+            page_flag: True,
+            'registration_stats_page': True,
+            'last_updated': last_updated}
 
 
 # public page
@@ -747,48 +724,75 @@ def regions(request):
     if should_hide_public_view(request):
         return redirect(settings.PUBLIC_REDIRECT_URL)
     page_flag = 'regions_page'
-    grouping, metadata, raw_stats, region_stats, nr_by_region, cr_by_region = \
-        retrieve_report([REGISTRATIONS_BY_REGION_KEY,
-                         REGISTRATIONS_METADATA_KEY,
-                         REGISTRATIONS_STATS_KEY,
-                         REGISTRATIONS_REGION_STATS_KEY,
-                         REGISTRATION_POINTS_NR_BY_REGION_KEY,
-                         REGISTRATION_POINTS_CR_BY_REGION_KEY])
-    if grouping is None:
+    template_args = page_context(page_flag,
+                                 [REGISTRATIONS_BY_REGION_KEY,
+                                  REGISTRATIONS_METADATA_KEY,
+                                  REGISTRATIONS_STATS_KEY,
+                                  REGISTRATIONS_REGION_STATS_KEY,
+                                  REGISTRATION_POINTS_NR_BY_REGION_KEY,
+                                  REGISTRATION_POINTS_CR_BY_REGION_KEY],
+                                 partial(regional_grouping_context, request.LANGUAGE_CODE,
+                                         page_flag))
+    if template_args is None:
         return handle_missing_report(request, page_flag)
-
-    return report_regional_grouping(request, grouping, region_stats, metadata, raw_stats,
-                                    page_flag, nr_by_region, cr_by_region)
+    return render(request, 'vr_dashboard/regions.html', template_args)
 
 
 @user_passes_test(lambda user: user.is_staff)
 def subconstituencies(request):
     page_flag = 'subconstituencies_page'
-    grouping, metadata, raw_stats, region_stats, nr_by_subconstituency, cr_by_subconstituency = \
-        retrieve_report([REGISTRATIONS_BY_SUBCONSTITUENCY_KEY,
-                         REGISTRATIONS_METADATA_KEY,
-                         REGISTRATIONS_STATS_KEY,
-                         REGISTRATIONS_SUBCONSTITUENCY_STATS_KEY,
-                         REGISTRATION_POINTS_NR_BY_SUBCONSTITUENCY_KEY,
-                         REGISTRATION_POINTS_CR_BY_SUBCONSTITUENCY_KEY])
-    if grouping is None:
+    template_args = page_context(page_flag,
+                                 [REGISTRATIONS_BY_SUBCONSTITUENCY_KEY,
+                                  REGISTRATIONS_METADATA_KEY,
+                                  REGISTRATIONS_STATS_KEY,
+                                  REGISTRATIONS_SUBCONSTITUENCY_STATS_KEY,
+                                  REGISTRATION_POINTS_NR_BY_SUBCONSTITUENCY_KEY,
+                                  REGISTRATION_POINTS_CR_BY_SUBCONSTITUENCY_KEY],
+                                 partial(regional_grouping_context, request.LANGUAGE_CODE,
+                                         page_flag))
+    if template_args is None:
         return handle_missing_report(request, page_flag)
+    return render(request, 'vr_dashboard/regions.html', template_args)
 
-    return report_regional_grouping(request, grouping, region_stats, metadata, raw_stats,
-                                    page_flag, nr_by_subconstituency, cr_by_subconstituency)
 
+def iter_csv(rows, language):
+    """ Yield the CSV (actually tab separated) form of rows, in chunks of about
+    CSV_CHUNK_SIZE characters, after a UTF-16LE BOM.
 
-def get_csv_writer(response):
-    """ Return a CSV writer that will encode in UTF-16LE, after prefixing the
-    body with a BOM.
+    The rows are generated as the response is streamed, after the view has
+    returned, so they're generated with the view's language active.
 
     Presumably there are other ways to make Excel happy, but that's what
     the previous Ruby implementation of this feature does, and omitting the
     BOM is not sufficient.
     (Tested with Excel from Office 2010 on Windows 8.1)
     """
-    response.write(codecs.BOM_UTF16_LE)
-    return csv.writer(response, delimiter='\t')
+    yield codecs.BOM_UTF16_LE
+    buffer = StringIO()
+    w = csv.writer(buffer, delimiter='\t')
+    with translation.override(language):
+        for row in rows:
+            w.writerow(row)
+            if buffer.tell() >= CSV_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue()
+
+
+def csv_response(request, rows, filename):
+    """ Return a response which streams rows as a CSV attachment encoded in
+    UTF-16LE (see iter_csv()), so that large reports don't have to be built in
+    memory before the first byte is sent.
+
+    rows: iterable of the rows, each a list of strings, which can be a generator
+    which does the work of building them
+    """
+    response = StreamingHttpResponse(iter_csv(rows, translation.get_language()),
+                                     content_type='application/octet-stream',
+                                     charset='utf-16le')
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
 
 
 @user_passes_test(lambda user: user.is_staff)
@@ -812,36 +816,32 @@ def csv_report(request):
     last_updated = parse_iso_datetime(metadata['last_updated'])
     last_updated_msg = get_last_updated_msg(last_updated)
 
-    response = HttpResponse(content_type='application/octet-stream', charset='utf-16le')
-    client_filename = get_csv_filename(request, 'registrations')
-
     preferred_label = 'english_name' if request.LANGUAGE_CODE == 'en' else 'arabic_name'
 
-    response['Content-Disposition'] = 'attachment; filename="%s"' % client_filename
-    w = get_csv_writer(response)
-    w.writerow([last_updated_msg])
-    for table in tables:
-        w.writerow([_(table)])
-        w.writerow(header)
-        for row in data[table.lower()]:
-            if isinstance(row['label'], str):
-                assert row['label_translated']
-                label = _(row['label'])
-            elif preferred_label in row['label']:
-                label = row['label'][preferred_label]
-            else:
-                label = row['label']['name']
-            item = [label, row['total'][0], row['total'][1], row['total'][2],
-                    row['yesterday'][0], row['yesterday'][1], row['yesterday'][2]]
-            for age in age_groupings:
-                item.append(row[age])
-            for i, field in enumerate(item):
-                if isinstance(field, numbers.Number):
-                    item[i] = str(field)
-
-            w.writerow(item)
-
-    return response
+    def rows():
+        yield [last_updated_msg]
+        for table in tables:
+            yield [_(table)]
+            yield header
+            for row in data[table.lower()]:
+                if isinstance(row['label'], str):
+                    assert row['label_translated']
+                    label = _(row['label'])
+                elif preferred_label in row['label']:
+                    label = row['label'][preferred_label]
+                else:
+                    label = row['label']['name']
+                item = [label, row['total'][0], row['total'][1], row['total'][2],
+                        row['yesterday'][0], row['yesterday'][1], row['yesterday'][2]]
+                for age in age_groupings:
+                    item.append(row[age])
+                for i, field in enumerate(item):
+                    if isinstance(field, numbers.Number):
+                        item[i] = str(field)
+
+                yield item
+
+    return csv_response(request, rows(), get_csv_filename(request, 'registrations'))
 
 
 @user_passes_test(lambda user: user.is_staff)
@@ -878,7 +878,6 @@ def csv_daily_report(request, from_date=None, to_date=None):
 
     parse_date = lambda s: datetime.strptime(s, LIBYA_DATE_FORMAT).date()
 
-    response = HttpResponse(content_type='application/octet-stream', charset='utf-16le')
     if from_date and to_date:
         # For simplicity, use the strings to build the filename before we've
         # validated them. If they turn out not to be valid date strings, we
@@ -894,12 +893,10 @@ def csv_daily_report(request, from_date=None, to_date=None):
     else:
         client_filename = get_csv_filename(request, 'daily_breakdown')
 
-    response['Content-Disposition'] = 'attachment; filename="%s"' % client_filename
-
-    w = get_csv_writer(response)
-    w.writerow([last_updated_msg])
-
     title_column = 0 if request.LANGUAGE_CODE == 'en' else 1
+    # The reports are shared with other requests, so update copies of the rows.
+    daily_by_office = [list(row) for row in daily_by_office]
+    daily_by_subconstituency = [list(row) for row in daily_by_subconstituency]
     daily_by_office[0][title_column] = _('Office')
     # include all columns by default
     daily_by_office_columns_to_include = [
@@ -926,26 +923,30 @@ def csv_daily_report(request, from_date=None, to_date=None):
                 daily_by_subconstituency_columns_to_include[i] \
                     = from_date <= parse_date(date_str) <= to_date
 
-    for row in daily_by_office:
-        for i, field in enumerate(row[2:]):
-            if isinstance(field, numbers.Number):
-                row[i + 2] = str(field)
-        filtered_row = [
-            elt for i, elt in enumerate(row) if daily_by_office_columns_to_include[i]]
-        w.writerow([filtered_row[title_column]] + filtered_row[2:])
-
-    # Write empty row to separate the 2 tables
-    w.writerow('')
-
-    for row in daily_by_subconstituency:
-        for i, field in enumerate(row[2:]):
-            if isinstance(field, numbers.Number):
-                row[i + 2] = str(field)
-        filtered_row = [
-            elt for i, elt in enumerate(row) if daily_by_subconstituency_columns_to_include[i]]
-        w.writerow([filtered_row[title_column]] + filtered_row[2:])
+    def rows():
+        yield [last_updated_msg]
 
-    return response
+        for row in daily_by_office:
+            for i, field in enumerate(row[2:]):
+                if isinstance(field, numbers.Number):
+                    row[i + 2] = str(field)
+            filtered_row = [
+                elt for i, elt in enumerate(row) if daily_by_office_columns_to_include[i]]
+            yield [filtered_row[title_column]] + filtered_row[2:]
+
+        # Write empty row to separate the 2 tables
+        yield ''
+
+        for row in daily_by_subconstituency:
+            for i, field in enumerate(row[2:]):
+                if isinstance(field, numbers.Number):
+                    row[i + 2] = str(field)
+            filtered_row = [
+                elt for i, elt in enumerate(row)
+                if daily_by_subconstituency_columns_to_include[i]]
+            yield [filtered_row[title_column]] + filtered_row[2:]
+
+    return csv_response(request, rows(), client_filename)
 
 
 @user_passes_test(lambda user: user.is_staff)
@@ -967,25 +968,24 @@ def center_csv_report(request):
         for center in polling_centers
     }
 
-    response = HttpResponse(content_type='application/octet-stream', charset='utf-16le')
-    client_filename = get_csv_filename(request, 'registrations_by_polling_center')
-    response['Content-Disposition'] = 'attachment; filename="%s"' % client_filename
-    w = get_csv_writer(response)
-    w.writerow([last_updated_msg])
-    w.writerow(header)
-
-    # get a list of centers ordered by center_id (model default ordering),
-    # excluding any centers which are not in our report
-    centers_in_report = RegistrationCenter.objects.filter(
-        center_id__in=registrations_by_center_id.keys())
-
-    for center in centers_in_report:
-        w.writerow([
-            str(center.center_id),
-            center.name,
-            str(registrations_by_center_id[center.center_id])
-        ])
-    return response
+    def rows():
+        yield [last_updated_msg]
+        yield header
+
+        # the centers in our report, ordered by center_id, excluding any which have
+        # been deleted
+        center_names = get_name_directory().centers
+        for center_id in sorted(registrations_by_center_id):
+            if center_id not in center_names:
+                continue
+            yield [
+                str(center_id),
+                center_names[center_id],
+                str(registrations_by_center_id[center_id])
+            ]
+
+    return csv_response(request, rows(),
+                        get_csv_filename(request, 'registrations_by_polling_center'))
 
 
 @user_passes_test(lambda user: user.is_staff)
@@ -1000,25 +1000,22 @@ def phone_csv_report(request):
     last_updated = parse_iso_datetime(metadata['last_updated'])
     last_updated_msg = get_last_updated_msg(last_updated)
 
-    response = HttpResponse(content_type='application/octet-stream', charset='utf-16le')
-    client_filename = get_csv_filename(request, 'registrations_by_phone')
-    response['Content-Disposition'] = 'attachment; filename="%s"' % client_filename
-    w = get_csv_writer(response)
-    w.writerow([last_updated_msg])
-    w.writerow(header)
-
-    for phone_number, registration_count in registrations_by_phone:
-        w.writerow([
-            str(phone_number),
-            str(registration_count)
-        ])
-    return response
+    def rows():
+        yield [last_updated_msg]
+        yield header
+
+        for phone_number, registration_count in registrations_by_phone:
+            yield [
+                str(phone_number),
+                str(registration_count)
+            ]
 
+    return csv_response(request, rows(), get_csv_filename(request, 'registrations_by_phone'))
 
-def get_response_format(request):
+
+def get_response_format(request, valid_formats=('csv', 'html')):
     """ Check the format query arg (if it exists) for the desired rendering.
     Return None if the request is invalid or the format otherwise. """
-    valid_formats = ('csv', 'html')
     default_format = 'html'
     requested_format = request.GET.get(FORMAT_QUERY_ARG, default_format).lower()
     if requested_format in valid_formats:
@@ -1100,142 +1097,156 @@ def election_day(request):
     election = get_chosen_election(request)
     if election is None:
         return handle_invalid_election(request, page_flag)
-    metadata, offices_table, by_country = \
-        retrieve_report([election_key(ELECTION_DAY_METADATA_KEY, election),
-                         election_key(ELECTION_DAY_OFFICES_TABLE_KEY, election),
-                         election_key(ELECTION_DAY_BY_COUNTRY_KEY, election)])
-    if metadata is None:
-        return handle_missing_election_report(request, election, page_flag)
 
-    last_updated = parse_iso_datetime(metadata['last_updated'])
-    last_updated_msg = get_last_updated_msg(last_updated)
+    def build_context(metadata, by_country, *offices_table):
+        last_updated = parse_iso_datetime(metadata['last_updated'])
 
-    total_opened = 0
-    total_not_opened = 0
-    total_closed = 0
+        total_opened = 0
+        total_not_opened = 0
+        total_closed = 0
 
-    total_not_reported = defaultdict(int)
-    total_reported = defaultdict(int)
-
-    for office in offices_table:
-        if request.LANGUAGE_CODE == 'ar':
-            office['name'] = office['arabic_name']
-        else:
-            office['name'] = office['english_name']
-        office['opened_pct'] = fmt_percent(office['opened'], office['polling_center_count'])
-        office['closed_pct'] = fmt_percent(office['closed'], office['polling_center_count'])
-
-        total_opened += office['opened']
-        total_not_opened += office['not_opened']
-        total_closed += office['closed']
-
-        for period in [1, 2, 3, 4]:
-            total_not_reported[period] += office['not_reported_' + str(period)]
-            total_reported[period] += office['votes_reported_' + str(period)]
-
-    summary = {'name': _('Libya'),
-               'by_country': by_country['Libya']['polling_center_count'],
-               'opened': total_opened,
-               'opened_pct': fmt_percent(total_opened,
-                                         by_country['Libya']['polling_center_count']),
-               'not_opened': total_not_opened,
-               'not_reported_1': total_not_reported[1],
-               'not_reported_2': total_not_reported[2],
-               'not_reported_3': total_not_reported[3],
-               'not_reported_4': total_not_reported[4],
-               'closed': total_closed,
-               'closed_pct': fmt_percent(total_closed,
-                                         by_country['Libya']['polling_center_count'])
-               }
+        total_not_reported = defaultdict(int)
+        total_reported = defaultdict(int)
 
-    if response_format == 'csv':
-        response = HttpResponse(content_type='application/octet-stream', charset='utf-16le')
-        client_filename = get_csv_filename(request, 'election_day_overview')
-        response['Content-Disposition'] = 'attachment; filename="%s"' % client_filename
-        w = get_csv_writer(response)
-        w.writerow([
-            _('Election Day Overview')
-        ])
-        w.writerow([
-            last_updated_msg
-        ])
-        w.writerow([
-            _('Office'),
-            _('Polling Center'),
-            _('Opened'),
-            _('Not Opened'),
-            # Format "Not Reported Period n" carefully to use the same strings
-            # which the HTML template uses.
-            _('Not Reported') + ' ' + _('Period') + ' ' + '1',
-            _('Not Reported') + ' ' + _('Period') + ' ' + '2',
-            _('Not Reported') + ' ' + _('Period') + ' ' + '3',
-            _('Not Reported') + ' ' + _('Period') + ' ' + '4',
-            _('Closed')
-        ])
+        # The offices table is shared with other requests, so annotate copies.
+        offices_table = [dict(office) for office in offices_table]
         for office in offices_table:
-            name_fmt = '%(name)s %(id)d' if request.LANGUAGE_CODE == 'ar' else '%(id)d %(name)s'
-            args = {
-                'id': office['office_id'],
-                'name': office['name']
-            }
-            w.writerow([
-                name_fmt % args,
-                str(office['polling_center_count']),
-                str(office['opened']),
-                str(office['not_opened']),
-                str(office['not_reported_1']),
-                str(office['not_reported_2']),
-                str(office['not_reported_3']),
-                str(office['not_reported_4']),
-                str(office['closed'])
-            ])
-        w.writerow([
-            summary['name'],
-            str(summary['by_country']),
-            str(summary['opened']),
-            str(summary['not_opened']),
-            str(summary['not_reported_1']),
-            str(summary['not_reported_2']),
-            str(summary['not_reported_3']),
-            str(summary['not_reported_4']),
-            str(summary['closed'])
-        ])
-        return response
-
-    headline = \
-        {'as_of_datetime':
-         _("As of {time} on {date}:").format(time=last_updated.strftime('%H:%M'),
-                                             date=last_updated.strftime('%d/%m')),
-
-         'open_centers':
-         _("{count} centers have opened").format(count=emphasized_data(intcomma(total_opened))),
-
-         'unopen_centers':
-         _("{count} centers have not opened").format(
-             count=emphasized_data(intcomma(total_not_opened))),
-
-         'period1': PERIOD_VOTES_REPORTED_MESSAGE.format(
-             count=emphasized_data(intcomma(total_reported[1])), period=1),
+            if request.LANGUAGE_CODE == 'ar':
+                office['name'] = office['arabic_name']
+            else:
+                office['name'] = office['english_name']
+            office['opened_pct'] = fmt_percent(office['opened'], office['polling_center_count'])
+            office['closed_pct'] = fmt_percent(office['closed'], office['polling_center_count'])
+
+            total_opened += office['opened']
+            total_not_opened += office['not_opened']
+            total_closed += office['closed']
+
+            for period in [1, 2, 3, 4]:
+                total_not_reported[period] += office['not_reported_' + str(period)]
+                total_reported[period] += office['votes_reported_' + str(period)]
+
+        summary = {'name': _('Libya'),
+                   'by_country': by_country['Libya']['polling_center_count'],
+                   'opened': total_opened,
+                   'opened_pct': fmt_percent(total_opened,
+                                             by_country['Libya']['polling_center_count']),
+                   'not_opened': total_not_opened,
+                   'not_reported_1': total_not_reported[1],
+                   'not_reported_2': total_not_reported[2],
+                   'not_reported_3': total_not_reported[3],
+                   'not_reported_4': total_not_reported[4],
+                   'closed': total_closed,
+                   'closed_pct': fmt_percent(total_closed,
+                                             by_country['Libya']['polling_center_count'])
+                   }
+
+        headline = \
+            {'as_of_datetime':
+             _("As of {time} on {date}:").format(time=last_updated.strftime('%H:%M'),
+                                                 date=last_updated.strftime('%d/%m')),
+
+             'open_centers':
+             _("{count} centers have opened").format(
+                 count=emphasized_data(intcomma(total_opened))),
+
+             'unopen_centers':
+             _("{count} centers have not opened").format(
+                 count=emphasized_data(intcomma(total_not_opened))),
+
+             'period1': PERIOD_VOTES_REPORTED_MESSAGE.format(
+                 count=emphasized_data(intcomma(total_reported[1])), period=1),
+
+             'period2': PERIOD_VOTES_REPORTED_MESSAGE.format(
+                 count=emphasized_data(intcomma(total_reported[2])), period=2),
+
+             'period3': PERIOD_VOTES_REPORTED_MESSAGE.format(
+                 count=emphasized_data(intcomma(total_reported[3])), period=3),
+
+             'period4': PERIOD_VOTES_REPORTED_MESSAGE.format(
+                 count=emphasized_data(intcomma(total_reported[4])), period=4)
+             }
 
-         'period2': PERIOD_VOTES_REPORTED_MESSAGE.format(
-             count=emphasized_data(intcomma(total_reported[2])), period=2),
+        return {
+            page_flag: True,
+            'staff_page': True,
+            'last_updated': last_updated,
+            'offices': offices_table,
+            'summary': summary,
+            'headline': headline,
+        }
 
-         'period3': PERIOD_VOTES_REPORTED_MESSAGE.format(
-             count=emphasized_data(intcomma(total_reported[3])), period=3),
+    # The rows of the offices table are read from the keys of the individual offices,
+    # which are kept up to date as centers open and report.
+    metadata = retrieve_report(election_key(ELECTION_DAY_METADATA_KEY, election))
+    template_args = None
+    if metadata is not None:
+        template_args = page_context(page_flag,
+                                     [election_key(ELECTION_DAY_METADATA_KEY, election),
+                                      election_key(ELECTION_DAY_BY_COUNTRY_KEY, election)]
+                                     + election_day_offices_table_keys(election, metadata),
+                                     build_context, election)
+    if template_args is None:
+        return handle_missing_election_report(request, election, page_flag)
 
-         'period4': PERIOD_VOTES_REPORTED_MESSAGE.format(
-             count=emphasized_data(intcomma(total_reported[4])), period=4)
-         }
-    template_args = {
-        page_flag: True,
-        'staff_page': True,
-        'last_updated': last_updated,
-        'offices': offices_table,
-        'summary': summary,
-        'headline': headline,
-        'elections': Election.objects.all(),
-        'selected_election': election,
-    }
+    if response_format == 'csv':
+        offices_table = template_args['offices']
+        summary = template_args['summary']
+        last_updated_msg = get_last_updated_msg(template_args['last_updated'])
+
+        def rows():
+            yield [
+                _('Election Day Overview')
+            ]
+            yield [
+                last_updated_msg
+            ]
+            yield [
+                _('Office'),
+                _('Polling Center'),
+                _('Opened'),
+                _('Not Opened'),
+                # Format "Not Reported Period n" carefully to use the same strings
+                # which the HTML template uses.
+                _('Not Reported') + ' ' + _('Period') + ' ' + '1',
+                _('Not Reported') + ' ' + _('Period') + ' ' + '2',
+                _('Not Reported') + ' ' + _('Period') + ' ' + '3',
+                _('Not Reported') + ' ' + _('Period') + ' ' + '4',
+                _('Closed')
+            ]
+            name_fmt = '%(name)s %(id)d' if request.LANGUAGE_CODE == 'ar' else '%(id)d %(name)s'
+            for office in offices_table:
+                args = {
+                    'id': office['office_id'],
+                    'name': office['name']
+                }
+                yield [
+                    name_fmt % args,
+                    str(office['polling_center_count']),
+                    str(office['opened']),
+                    str(office['not_opened']),
+                    str(office['not_reported_1']),
+                    str(office['not_reported_2']),
+                    str(office['not_reported_3']),
+                    str(office['not_reported_4']),
+                    str(office['closed'])
+                ]
+            yield [
+                summary['name'],
+                str(summary['by_country']),
+                str(summary['opened']),
+                str(summary['not_opened']),
+                str(summary['not_reported_1']),
+                str(summary['not_reported_2']),
+                str(summary['not_reported_3']),
+                str(summary['not_reported_4']),
+                str(summary['closed'])
+            ]
+
+        return csv_response(request, rows(), get_csv_filename(request, 'election_day_overview'))
+
+    template_args = dict(template_args, elections=Election.objects.all(),
+                         selected_election=election)
     return render(request, 'vr_dashboard/election_day.html', template_args)
 
 
@@ -1246,10 +1257,12 @@ def election_day_preliminary(request):
     election = get_chosen_election(request)
     if election is None:
         return handle_invalid_election(request, page_flag)
-    metadata, offices_table, country_table = \
-        retrieve_report([election_key(ELECTION_DAY_METADATA_KEY, election),
-                         election_key(ELECTION_DAY_OFFICES_TABLE_KEY, election),
-                         election_key(ELECTION_DAY_BY_COUNTRY_KEY, election)])
+    metadata = retrieve_report(election_key(ELECTION_DAY_METADATA_KEY, election))
+    if metadata is not None:
+        metadata, country_table, *offices_table = \
+            retrieve_report([election_key(ELECTION_DAY_METADATA_KEY, election),
+                             election_key(ELECTION_DAY_BY_COUNTRY_KEY, election)]
+                            + election_day_offices_table_keys(election, metadata))
     if metadata is None:
         return handle_missing_election_report(request, election, page_flag)
 
@@ -1290,66 +1303,142 @@ def election_day_preliminary(request):
     return render(request, 'vr_dashboard/election_day_preliminary.html', template_args)
 
 
+def get_center_list_query(request):
+    """ Return the filters, sort order and page of the election day center list
+    requested by the query args, as a dict, or None if any of them are invalid:
+
+        office: office id
+        period, reported: '1' to '4', and 'yes' or 'no' to list only the centers
+          which have or haven't reported for that voting period
+        sort: 'code', 'office_id', 'registrations' or 'opened'
+        order: 'asc' or 'desc'
+        page, page_size: page number (from 1) and the number of centers per page (up
+          to settings.ELECTION_DAY_CENTERS_MAX_PAGE_SIZE)
+    """
+    query = {
+        'office': None,
+        'period': request.GET.get('period') or None,
+        'reported': request.GET.get('reported') or None,
+        'sort': request.GET.get('sort') or 'code',
+        'order': request.GET.get('order') or 'asc',
+    }
+    try:
+        if request.GET.get('office'):
+            query['office'] = int(request.GET['office'])
+        query['page'] = int(request.GET.get('page') or 1)
+        query['page_size'] = int(request.GET.get('page_size')
+                                 or settings.ELECTION_DAY_CENTERS_PAGE_SIZE)
+    except ValueError:
+        return None
+    if query['period'] not in (None, '1', '2', '3', '4') or \
+            query['reported'] not in (None, 'yes', 'no') or \
+            query['sort'] not in CENTER_LIST_SORT_FIELDS or \
+            query['order'] not in ('asc', 'desc') or \
+            query['page'] < 1 or \
+            not 0 < query['page_size'] <= settings.ELECTION_DAY_CENTERS_MAX_PAGE_SIZE:
+        return None
+    return query
+
+
+def center_list_url(request, query, **changes):
+    """ Return the URL of the center list with the query, with the specified query
+    args changed (or removed, if None). """
+    args = request.GET.copy()
+    for name, value in dict(query, **changes).items():
+        if value is None:
+            args.pop(name, None)
+        else:
+            args[name] = value
+    args.pop(FORMAT_QUERY_ARG, None)
+    args.pop('election', None)
+    return '%s?%s' % (request.path, args.urlencode())
+
+
 @user_passes_test(lambda user: user.is_staff)
 def election_day_center(request):
-    response_format = get_response_format(request)
+    response_format = get_response_format(request, valid_formats=('csv', 'html', 'json'))
     if not response_format:  # requested format invalid
         return get_invalid_format_error(request)
+    query = get_center_list_query(request)
+    if query is None:
+        return HttpResponseBadRequest(_('The center list query is not valid.'))
     page_flag = 'election_day_center_page'
     election = get_chosen_election(request)
     if election is None:
         return handle_invalid_election(request, page_flag)
-    metadata, polling_centers_table = \
-        retrieve_report([election_key(ELECTION_DAY_METADATA_KEY, election),
-                         election_key(ELECTION_DAY_POLLING_CENTERS_TABLE_KEY, election)])
+    metadata = retrieve_report(election_key(ELECTION_DAY_METADATA_KEY, election))
     if metadata is None:
         return handle_missing_election_report(request, election, page_flag)
 
+    # The CSV has every center which matches the filters; the other formats have
+    # a single page of them.
+    offset, limit = 0, None
+    if response_format != 'csv':
+        limit = query['page_size']
+        offset = (query['page'] - 1) * limit
+    num_centers, polling_centers_table = retrieve_polling_centers_page(
+        election, office_id=query['office'], period=query['period'],
+        reported=None if query['reported'] is None else query['reported'] == 'yes',
+        sort=query['sort'], descending=query['order'] == 'desc',
+        offset=offset, limit=limit)
+    if num_centers is None:
+        return handle_missing_election_report(request, election, page_flag)
+
     last_updated = parse_iso_datetime(metadata['last_updated'])
     last_updated_msg = get_last_updated_msg(last_updated)
+    num_pages = max((num_centers + query['page_size'] - 1) // query['page_size'], 1)
+
+    if response_format == 'json':
+        return JsonResponse({
+            'last_updated': metadata['last_updated'],
+            'num_centers': num_centers,
+            'page': query['page'],
+            'num_pages': num_pages,
+            'page_size': query['page_size'],
+            'centers': polling_centers_table,
+        })
 
     if response_format == 'csv':
-        response = HttpResponse(content_type='application/octet-stream', charset='utf-16le')
-        client_filename = get_csv_filename(request, 'election_day_centers')
-        response['Content-Disposition'] = 'attachment; filename="%s"' % client_filename
-        w = get_csv_writer(response)
-        w.writerow([
-            _('Election Day Centers')
-        ])
-        w.writerow([
-            last_updated_msg
-        ])
-        w.writerow([
-            _('Polling Center'),
-            _('Code'),
-            _('Copied Polling Center'),
-            _('Total Registrations'),
-            _('Office'),
-            _('Active'),
-            _('Opened'),
-            _('Reported Period') + ' 1',
-            _('Reported Period') + ' 2',
-            _('Reported Period') + ' 3',
-            _('Reported Period') + ' 4',
-            _('Closed')
-        ])
-        for center in polling_centers_table:
-            closed = pgettext(center['closed'][0], center['closed'][1])
-            active = _('No') if INACTIVE_FOR_ELECTION in center else _('Yes')
-            w.writerow([
-                center['name'],  # no English name available
-                str(center['polling_center_code']),
-                str(center[POLLING_CENTER_COPY_OF]) if POLLING_CENTER_COPY_OF in center else '',
-                '' if POLLING_CENTER_COPY_OF in center else str(center['registration_count']),
-                str(center['office_id']),
-                active,
-                center.get('opened', ''),
-                str(center.get('votes_reported_1', '')),
-                str(center.get('votes_reported_2', '')),
-                str(center.get('votes_reported_3', '')),
-                str(center.get('votes_reported_4', '')),
-                closed])
-        return response
+        def rows():
+            yield [
+                _('Election Day Centers')
+            ]
+            yield [
+                last_updated_msg
+            ]
+            yield [
+                _('Polling Center'),
+                _('Code'),
+                _('Copied Polling Center'),
+                _('Total Registrations'),
+                _('Office'),
+                _('Active'),
+                _('Opened'),
+                _('Reported Period') + ' 1',
+                _('Reported Period') + ' 2',
+                _('Reported Period') + ' 3',
+                _('Reported Period') + ' 4',
+                _('Closed')
+            ]
+            for center in polling_centers_table:
+                closed = pgettext(center['closed'][0], center['closed'][1])
+                active = _('No') if INACTIVE_FOR_ELECTION in center else _('Yes')
+                yield [
+                    center['name'],  # no English name available
+                    str(center['polling_center_code']),
+                    str(center[POLLING_CENTER_COPY_OF]) if POLLING_CENTER_COPY_OF in center
+                    else '',
+                    '' if POLLING_CENTER_COPY_OF in center else str(center['registration_count']),
+                    str(center['office_id']),
+                    active,
+                    center.get('opened', ''),
+                    str(center.get('votes_reported_1', '')),
+                    str(center.get('votes_reported_2', '')),
+                    str(center.get('votes_reported_3', '')),
+                    str(center.get('votes_reported_4', '')),
+                    closed]
+
+        return csv_response(request, rows(), get_csv_filename(request, 'election_day_centers'))
 
     # Build the table manually; simply including polling_centers_table in the
     # template context eats a lot of CPU, seemingly just to process the data
@@ -1398,10 +1487,22 @@ def election_day_center(request):
             closed)
         rows.append(row)
 
+    offices = get_name_directory().offices
     template_args = {
         page_flag: True,
         'staff_page': True,
         'centers': '\n'.join(rows),
+        'query': query,
+        'offices': [offices[office['code']] for office in metadata['offices']
+                    if office['code'] in offices],
+        'periods': ['1', '2', '3', '4'],
+        'num_centers': num_centers,
+        'num_pages': num_pages,
+        'previous_page_url': (center_list_url(request, query, page=query['page'] - 1)
+                              if query['page'] > 1 else None),
+        'next_page_url': (center_list_url(request, query, page=query['page'] + 1)
+                          if query['page'] < num_pages else None),
+        'csv_url': center_list_url(request, query, page=None, page_size=None),
         'last_updated': last_updated,
         'elections': Election.objects.all(),
         'selected_election': election,
@@ -1470,8 +1571,6 @@ def election_day_center_n(request, center_id):
         # See if the center report wasn't returned because we don't have data on it.
         # (If all_centers is None, the report is missing from Redis.)
         if center is None and all_centers:
-            # un-JSON skipped on retrieve_report failure
-            all_centers = json.loads(all_centers.decode())
             if center_id not in [c[POLLING_CENTER_CODE] for c in all_centers]:
                 logger.warning('URL contains unrecognized center id')
                 args = {
@@ -1503,7 +1602,8 @@ def election_day_center_n(request, center_id):
     phones = [parse_phone_number_fields(number) for number in sorted(center['phones']) if number]
     last_updated = parse_iso_datetime(metadata['last_updated'])
     checkin_start, ignored = center_checkin_times(election)
-    center_log = [message for message in center_log
+    # The log is shared with other requests, so format copies of the messages.
+    center_log = [dict(message) for message in center_log
                   if parse_iso_datetime(message['creation_date']) >= checkin_start]
     center_log = sorted(center_log, key=lambda e: e['creation_date'])
     stats['last_report'] = _('Not Reported')
@@ -1556,21 +1656,15 @@ def election_day_office_n(request, office_id):
     election = get_chosen_election(request)
     if election is None:
         return handle_invalid_election(request, page_flag)
-    metadata, office_table, polling_centers_table = \
-        retrieve_report([election_key(ELECTION_DAY_METADATA_KEY, election),
-                         election_key(ELECTION_DAY_OFFICES_TABLE_KEY, election),
-                         election_key(ELECTION_DAY_POLLING_CENTERS_TABLE_KEY, election)])
+    metadata = retrieve_report(election_key(ELECTION_DAY_METADATA_KEY, election))
     if metadata is None:
         return handle_missing_election_report(request, election, page_flag)
 
     last_updated = parse_iso_datetime(metadata['last_updated'])
     last_updated_msg = get_last_updated_msg(last_updated)
 
-    # Grab just the slice of office_table needed here.  (The entire table isn't huge, so
-    # it is not broken down by office in Redis.)
-    office_in_list = [office for office in office_table if office['office_id'] == office_id]
-
-    if not office_in_list:  # invalid office id
+    centers_in_office = metadata['centers_by_office'].get(str(office_id))
+    if not centers_in_office:  # invalid office id
         logger.warning('URL contains unrecognized office id')
         args = {
             'error_msg': _("Office id %s is not valid.") % office_id,
@@ -1579,20 +1673,19 @@ def election_day_office_n(request, office_id):
         }
         return render(request, 'vr_dashboard/polling_error.html', args, status=404)
 
-    assert len(office_in_list) == 1, 'Office %d is in table more than once' % office_id
-    office = office_in_list[0]
+    # The office's row and the rows of its centers are read from their own keys,
+    # which are kept up to date as centers open and report.
+    office = retrieve_report(election_day_office_table_key(election, office_id))
+    if office is None:
+        return handle_missing_election_report(request, election, page_flag)
     if request.LANGUAGE_CODE == 'ar':
         office_name = office['arabic_name']
     else:
         office_name = office['english_name']
 
     office_centers_table = []
-    centers_in_office = metadata['centers_by_office'][str(office_id)]
-
     periods = ['reported_period_%d' % i for i in range(1, 5)]
-    for center_id in centers_in_office:
-        center = [entry for entry in polling_centers_table
-                  if entry['polling_center_code'] == center_id][0]
+    for center in retrieve_polling_center_rows(election, centers_in_office):
         center['missing_period'] = False
         for period in periods:
             if center[period] == 'has_not_reported':
@@ -1625,39 +1718,38 @@ def election_day_office_n(request, office_id):
             center['tr_class'] = 'inactive_for_election'
 
     if response_format == 'csv':
-        response = HttpResponse(content_type='application/octet-stream', charset='utf-16le')
-        client_filename = get_csv_filename(request, 'election_day_office_%d' % office_id)
-        response['Content-Disposition'] = 'attachment; filename="%s"' % client_filename
-        w = get_csv_writer(response)
-        w.writerow([
-            _('Election Day Office %d' % office_id)
-        ])
-        w.writerow([
-            last_updated_msg
-        ])
-        w.writerow([
-            _('Polling Center'),
-            _('Code'),
-            _('Active'),
-            _('Opened'),
-            _('Reported Period') + ' 1',
-            _('Reported Period') + ' 2',
-            _('Reported Period') + ' 3',
-            _('Reported Period') + ' 4'
-        ])
-        for row in office_centers_table:
-            active = _('No') if INACTIVE_FOR_ELECTION in row else _('Yes')
-            w.writerow([
-                row['name'],
-                str(row['polling_center_code']),
-                active,
-                row.get('opened_today') or '-',
-                row['reported_period_1_printable'],
-                row['reported_period_2_printable'],
-                row['reported_period_3_printable'],
-                row['reported_period_4_printable']
-            ])
-        return response
+        def rows():
+            yield [
+                _('Election Day Office %d' % office_id)
+            ]
+            yield [
+                last_updated_msg
+            ]
+            yield [
+                _('Polling Center'),
+                _('Code'),
+                _('Active'),
+                _('Opened'),
+                _('Reported Period') + ' 1',
+                _('Reported Period') + ' 2',
+                _('Reported Period') + ' 3',
+                _('Reported Period') + ' 4'
+            ]
+            for row in office_centers_table:
+                active = _('No') if INACTIVE_FOR_ELECTION in row else _('Yes')
+                yield [
+                    row['name'],
+                    str(row['polling_center_code']),
+                    active,
+                    row.get('opened_today') or '-',
+                    row['reported_period_1_printable'],
+                    row['reported_period_2_printable'],
+                    row['reported_period_3_printable'],
+                    row['reported_period_4_printable']
+                ]
+
+        return csv_response(request, rows(),
+                            get_csv_filename(request, 'election_day_office_%d' % office_id))
 
     inactive_centers = office[INACTIVE_FOR_ELECTION] if INACTIVE_FOR_ELECTION in office else []
 
@@ -1722,7 +1814,8 @@ def election_day_hq(request):
     # The reports were simplified to support JSON serialization -- int keys
     # were stringified, Office objects were omitted, and the ordering of the
     # dictionaries was lost.  Restore those properties.
-    offices_by_id = {office.id: office for office in Office.objects.all()}
+    offices_by_id = get_name_directory().offices
+    reports = dict(reports)  # shared with other requests
     report_types = [report_type for report_type in reports.keys() if report_type != 'national']
     for report_type in report_types:
         new_report = OrderedDict()